@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+# Heavy modules (qdrant_client, llama_index, torch via the embedding model) are imported
+# only where they are used; main() loads them in background threads while the user
+# picks grade/term. `python app/startup_report.py` guards the import cost.
+from __future__ import annotations
 
 import os
 os.environ.setdefault("TRANSFORMERS_NO_TF", "1")
@@ -7,21 +11,38 @@ os.environ.setdefault("USE_TF", "0")
 os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
+import json
+import math
 import re
+import time
 
-from qdrant_client import QdrantClient
-from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import lexical_index
+import collection_layout
+import context_packer
+import metrics
+import vector_profiles
+from embeddings import load_embed_model
+from local_index import LocalIndexClient
+from query_cache import QueryEmbeddingCache, SemanticAnswerCache, question_numbers
+from rerank import RERANK_CANDIDATES, load_reranker
+
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
 
 # ============== CONFIG ==============
 ROOT = Path(__file__).resolve().parents[1]
 ENV_PATH = ROOT / ".env"
 
-TOP_K_OVERALL = 10        # Total snippets sent to LLM
+TOP_K_OVERALL = 10        # Total snippets sent to LLM (at most; see CONTEXT_TOKEN_BUDGET)
 TOP_K_PER_COLLECTION = 8  # Max snippets collected from each collection before merging
-EMBED_MODEL_NAME = "intfloat/multilingual-e5-small"
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "1") == "1"  # print answer tokens as they arrive
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"    # fuse dense hits with BM25 (lexical_index)
+RRF_K = 60                                                # reciprocal-rank fusion constant
+SEARCH_TIMEOUT_S = float(os.getenv("SEARCH_TIMEOUT_S", "3"))  # per-collection query budget
 # ====================================
 
 
@@ -48,14 +69,74 @@ def lang_instruction(lang: str) -> str:
     return "أجب بالعربية الفصحى فقط." if lang == "ar" else "Answer in simple English only."
 
 # Additional cleaning: remove any numbered lists if the question is not math-related
+_NUMBERING_PAT = re.compile(r"(?m)^\s*\d+\s*[)\.\-–]\s*")
 def strip_numbering_if_not_math(answer: str, is_math: bool) -> str:
     if is_math:
         return answer
-    return re.sub(r"(?m)^\s*\d+\s*[)\.\-–]\s*", "", answer).strip()
+    return _NUMBERING_PAT.sub("", answer).strip()
+
+class NumberingStripper:
+    """
+    Streaming version of strip_numbering_if_not_math(...).strip(): feed() tokens as
+    they arrive and get back the text that is safe to print; finish() flushes the rest.
+    The concatenated output equals the batch function's result on the full answer.
+
+    A numbering match only ever contains whitespace, digits and `).-–`, so a tail made
+    of those characters is held back until a different character (or the end) decides
+    it; everything before that tail can no longer change.
+    """
+
+    _HOLD = frozenset(").-–")
+
+    def __init__(self, is_math: bool):
+        self.is_math = is_math
+        self._raw = ""        # everything received
+        self._stable = 0      # raw[:_stable] is final
+        self._cleaned = ""    # cleaned text of raw[:_stable], leading whitespace stripped
+        self._emitted = 0     # len(_cleaned) already returned
+
+    def _held(self, ch: str) -> bool:
+        if ch.isspace():
+            return True
+        return not self.is_math and (ch.isdigit() or ch in self._HOLD)
+
+    def _clean(self, start: int, end: int) -> str:
+        if self.is_math:
+            return self._raw[start:end]
+        # Keep one char of left context so `^` only matches at real line starts;
+        # that char is never part of a match (it ended the previous stable part).
+        if start == 0:
+            return _NUMBERING_PAT.sub("", self._raw[:end])
+        return _NUMBERING_PAT.sub("", self._raw[start - 1:end])[1:]
+
+    def _take(self) -> str:
+        out = self._cleaned[self._emitted:]
+        self._emitted = len(self._cleaned)
+        return out
+
+    def feed(self, token: str) -> str:
+        self._raw += token
+        end = len(self._raw)
+        while end > self._stable and self._held(self._raw[end - 1]):
+            end -= 1
+        if end > self._stable:
+            self._cleaned = (self._cleaned + self._clean(self._stable, end)).lstrip()
+            self._stable = end
+        return self._take()
+
+    def finish(self) -> str:
+        tail = self._clean(self._stable, len(self._raw))
+        self._cleaned = (self._cleaned + tail).strip()
+        self._stable = len(self._raw)
+        return self._take()
 
 # TOP-K filtering by subject 
+def _rank_score(h) -> float:
+    """Ranking value of a hit: the fused RRF score after hybrid search, else the similarity."""
+    return h.get("rrf_score", h["score"])
+
 def subject_of_top_hit(hits):
-    for h in sorted(hits, key=lambda x: x["score"], reverse=True):
+    for h in sorted(hits, key=_rank_score, reverse=True):
         subj = (h.get("subject") or "").strip().lower()
         if subj:
             return subj
@@ -64,17 +145,121 @@ def subject_of_top_hit(hits):
 def filter_hits_to_subject_topk(hits, subject: str, k: int):
     if subject:
         hits = [h for h in hits if (h.get("subject") or "").strip().lower() == subject]
-    return sorted(hits, key=lambda x: x["score"], reverse=True)[:k]
+    return sorted(hits, key=_rank_score, reverse=True)[:k]
 
 
 # -------------------------------
 # (1) Prepare the LLM (Groq if available)
 # -------------------------------
+class StubLLM:
+    """
+    Offline stand-in for the Groq LLM (LLM_BACKEND=stub): answers with the first
+    retrieved snippet after an optional fixed delay. Used by the service, load tests
+    and benchmarks so they can run without network access or API quota.
+    """
+
+    class _Response:
+        def __init__(self, text: str):
+            self.text = text
+
+    class _Delta:
+        def __init__(self, delta: str):
+            self.delta = delta
+
+    def __init__(self, delay_s: float = float(os.getenv("STUB_LLM_DELAY", "0"))):
+        self.delay_s = delay_s
+
+    def _text(self, prompt: str) -> str:
+        snippets = prompt.split("المقاطع المسترجعة:\n", 1)[-1]
+        first = snippets.split("\n\n", 1)[0].split("\n", 1)[-1]
+        return f"(stub) {first[:300]}"
+
+    def complete(self, prompt: str):
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        return self._Response(self._text(prompt))
+
+    def stream_complete(self, prompt: str):
+        """Yields the same answer word by word, spreading the delay over the words."""
+        words = re.findall(r"\S+\s*", self._text(prompt))
+        for w in words:
+            if self.delay_s:
+                time.sleep(self.delay_s / len(words))
+            yield self._Delta(w)
+
+
+class LLMHTTPError(RuntimeError):
+    """Non-2xx reply of the chat completions endpoint; status and headers (retry-after) kept for retries."""
+
+    def __init__(self, status_code: int, headers: dict, body: str):
+        super().__init__(f"HTTP {status_code}: {body[:200]}")
+        self.status_code = status_code
+        self.headers = headers
+
+
+class HttpChatLLM:
+    """
+    Groq's OpenAI-compatible /chat/completions over urllib only (LLM_BACKEND=http).
+    Same complete() / stream_complete() interface as the llama_index LLMs; point
+    GROQ_API_BASE at app/stub_llm_server.py to run against a local fake with rate limits.
+    """
+
+    _Response = StubLLM._Response
+    _Delta = StubLLM._Delta
+
+    def __init__(self, api_base: str, api_key: str, model: str,
+                 temperature: float = 0.2, timeout_s: float = float(os.getenv("LLM_TIMEOUT_S", "60"))):
+        self.url = api_base.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.timeout_s = timeout_s
+
+    def _post(self, prompt: str, stream: bool):
+        import urllib.error
+        import urllib.request
+        body = json.dumps({"model": self.model, "temperature": self.temperature, "stream": stream,
+                           "messages": [{"role": "user", "content": prompt}]}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers={
+            "Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"})
+        try:
+            return urllib.request.urlopen(req, timeout=self.timeout_s)
+        except urllib.error.HTTPError as e:
+            headers = {k.lower(): v for k, v in e.headers.items()}
+            raise LLMHTTPError(e.code, headers, e.read().decode("utf-8", "replace")) from None
+
+    def complete(self, prompt: str):
+        with self._post(prompt, stream=False) as resp:
+            data = json.load(resp)
+        return self._Response(data["choices"][0]["message"].get("content") or "")
+
+    def stream_complete(self, prompt: str):
+        """Yields the content deltas of the server-sent events."""
+        with self._post(prompt, stream=True) as resp:
+            for line in resp:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield self._Delta(delta)
+
+
 def load_llm():
+    backend = os.getenv("LLM_BACKEND", "groq").lower()
+    if backend == "stub":
+        return StubLLM()
     groq_key = os.getenv("GROQ_API_KEY")
     if not groq_key:
         return None
+    if backend == "http":
+        return HttpChatLLM(os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1"), groq_key,
+                           os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"))
     try:
+        from llama_index.core import Settings
         from llama_index.llms.groq import Groq
         model = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
         llm = Groq(model=model, api_key=groq_key, temperature=0.2)
@@ -82,6 +267,7 @@ def load_llm():
         return llm
     except Exception:
         try:
+            from llama_index.core import Settings
             from llama_index.llms.openai_like import OpenAILike
             model = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
             api_base = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1").rstrip("/")
@@ -95,57 +281,151 @@ def load_llm():
 # -------------------------------
 # (2) Qdrant helpers
 # -------------------------------
+# Shared by all questions; one in-flight query per collection is enough for a grade/term
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_THREADS", "16")),
+                                  thread_name_prefix="qdrant-search")
+
+def load_search_client(backend: str = ""):
+    """
+    Vector store to search: "qdrant" (URL_QDRANT / API_KEY_QDRANT) or "local"
+    (persisted stores under Indexes/, no network). Defaults to RETRIEVAL_BACKEND.
+    """
+    backend = (backend or os.getenv("RETRIEVAL_BACKEND", "qdrant")).lower()
+    if backend == "local":
+        return LocalIndexClient()
+    url = os.getenv("URL_QDRANT"); key = os.getenv("API_KEY_QDRANT")
+    if not url or not key:
+        raise EnvironmentError("❌ ضع URL_QDRANT و API_KEY_QDRANT في .env")
+    from qdrant_client import QdrantClient
+    return QdrantClient(url=url, api_key=key)
+
 def get_matching_collections(client: QdrantClient, grade: int, term: int):
     """ Returen Collections That ends with *_g{grade}_t{term} """
+    if collection_layout.is_single(client):  # subjects of that grade/term in the single collection
+        return collection_layout.matching_collections(client, grade, term)
     suffix = f"_g{grade}_t{term}"
     cols = client.get_collections().collections
     return [c.name for c in cols if c.name.endswith(suffix)]
 
+def _hit(col: str, point_id, score: float, payload: dict) -> dict:
+    payload = payload or {}
+    return {
+        "collection": col,
+        "id": str(point_id),
+        "score": float(score),
+        "text": (payload.get("text") or "").strip(),
+        "source": payload.get("source", ""),
+        "page": payload.get("page", ""),
+        "page_end": payload.get("page_end", payload.get("page", "")),  # chunks may span pages
+        "subject": payload.get("subject", ""),
+        "grade": payload.get("grade", ""),
+        "term": payload.get("term", ""),
+    }
+
+def _query_collection(client: QdrantClient, col: str, qvec, limit: int, timeout_s: float):
+    """Top `limit` points of one collection as hit dicts."""
+    res = client.query_points(
+        collection_name=col,
+        query=qvec,
+        with_payload=True,
+        limit=limit,
+        search_params=vector_profiles.collection_search_params(client, col),  # quantized: oversample + rescore
+        timeout=max(1, math.ceil(timeout_s)),  # server-side timeout (whole seconds)
+    )
+    return [_hit(col, p.id, p.score, p.payload) for p in res.points]
+
+def _query_single(client: QdrantClient, collections, qvec, limit: int, timeout_s: float):
+    """Top `limit` points of each collection from one filtered query (COLLECTION_LAYOUT=single)."""
+    return [_hit(col, p.id, p.score, p.payload)
+            for col, p in collection_layout.query_grouped(client, collections, qvec, limit, timeout_s)]
+
 def search_all(client: QdrantClient, embed, collections, query: str,
-               top_k_per_collection: int = TOP_K_PER_COLLECTION):
-    """Pull top results from each collection, then merge and sort by score descending."""
-    qvec = embed.get_query_embedding(query)
+               top_k_per_collection: int = TOP_K_PER_COLLECTION,
+               timeout_s: float = SEARCH_TIMEOUT_S):
+    """
+    Pull top results from each collection concurrently, then merge and sort by score descending.
+    A collection that errors or doesn't answer within `timeout_s` is skipped (with a warning).
+    With COLLECTION_LAYOUT=single this is one grouped query on the single collection.
+    """
+    with metrics.span("query_embed"):
+        qvec = embed.get_query_embedding(query)
+    with metrics.span("query_search"):
+        if collection_layout.is_single(client):
+            futures = [(collection_layout.SINGLE_COLLECTION,
+                        _SEARCH_POOL.submit(_query_single, client, collections, qvec, top_k_per_collection,
+                                            timeout_s))]
+        else:
+            futures = [(col, _SEARCH_POOL.submit(_query_collection, client, col, qvec,
+                                                 top_k_per_collection, timeout_s))
+                       for col in collections]
+        wait([f for _, f in futures], timeout=timeout_s)
+
     hits = []
-    for col in collections:
+    for col, fut in futures:  # collection order → same tie order as the sequential version
+        if not fut.done():
+            fut.cancel()
+            metrics.inc("query_collection_errors_total", error="timeout")
+            print(f"⚠️ query timeout in {col} (> {timeout_s:.1f}s)")
+            continue
         try:
-            res = client.query_points(
-                collection_name=col,
-                query=qvec,
-                with_payload=True,
-                limit=top_k_per_collection,
-            )
-            for p in res.points:
-                payload = p.payload or {}
-                hits.append({
-                    "collection": col,
-                    "score": float(p.score),
-                    "text": (payload.get("text") or "").strip(),
-                    "source": payload.get("source", ""),
-                    "page": payload.get("page", ""),
-                    "subject": payload.get("subject", ""),
-                    "grade": payload.get("grade", ""),
-                    "term": payload.get("term", ""),
-                })
+            hits.extend(fut.result())
         except Exception as e:
+            metrics.inc("query_collection_errors_total", error="error")
             print(f"⚠️ query error in {col}: {e}")
             continue
     hits.sort(key=lambda x: x["score"], reverse=True)
     return hits
 
 
+def lexical_search(collections, query: str, limit: int = TOP_K_PER_COLLECTION):
+    """BM25 hits (lexical_index) from every collection that has a lexical index, best first."""
+    hits = []
+    for col in collections:
+        index = lexical_index.load(col)
+        if index is None:
+            continue
+        hits.extend(_hit(col, pid, score, payload) for pid, score, payload in index.search(query, limit))
+    hits.sort(key=lambda x: x["score"], reverse=True)
+    return hits
+
+def fuse_hits(dense_hits, lexical_hits, k: int = RRF_K):
+    """
+    Reciprocal-rank fusion of the dense and BM25 rankings, best first. The fused value
+    goes into "rrf_score"; "score" stays the dense similarity (0.0 for BM25-only hits),
+    and the BM25 score is kept as "bm25_score" when present.
+    """
+    key = lambda h: (h["collection"], h["id"])
+    fused = lexical_index.reciprocal_rank_fusion(
+        [[key(h) for h in dense_hits], [key(h) for h in lexical_hits]], k=k)
+    merged = {}
+    for h in lexical_hits:
+        merged[key(h)] = dict(h, bm25_score=h["score"], score=0.0)
+    for h in dense_hits:
+        merged[key(h)] = dict(merged.get(key(h), {}), **h)
+    hits = [dict(merged[kk], rrf_score=s) for kk, s in fused.items()]
+    hits.sort(key=lambda x: x["rrf_score"], reverse=True)
+    return hits
+
+
 # -------------------------------
 # (3) Build context and prompt
 # -------------------------------
-def build_context(hits, top_k_overall: int = TOP_K_OVERALL):
-    chosen = hits[:top_k_overall]
-    ctx_lines = []
-    sources = []
-    for i, h in enumerate(chosen, 1):
-        snippet = (h["text"] or "").strip()
-        meta = f"[{i}] src={h['source']} page={h['page']} col={h['collection']}"
-        ctx_lines.append(f"{meta}\n{snippet}")
-        sources.append((i, h))
-    context = "\n\n".join(ctx_lines)
+def _citation_header(i: int, h) -> str:
+    pages = h["page"] if h.get("page_end", h["page"]) == h["page"] else f"{h['page']}-{h['page_end']}"
+    return f"[{i}] src={h['source']} page={pages} col={h['collection']}"
+
+def build_context(hits, top_k_overall: int = TOP_K_OVERALL,
+                  token_budget: int = context_packer.CONTEXT_TOKEN_BUDGET, stats: dict | None = None):
+    """
+    Numbered context from the top hits, without near-duplicates and within token_budget
+    (context_packer.pack). sources lists (i, hit) for exactly the [i] blocks in the context.
+    The packing figures (tokens before/after, duplicates, trimmed) go into stats when given.
+    """
+    blocks, kept, pack_stats = context_packer.pack(hits[:top_k_overall], _citation_header, token_budget)
+    if stats is not None:
+        stats.update(pack_stats)
+    context = "\n\n".join(blocks)
+    sources = list(enumerate(kept, 1))
     return context, sources
 
 def build_prompt(user_question: str, context: str):
@@ -178,27 +458,143 @@ def build_prompt(user_question: str, context: str):
         f"أجب بالاعتماد على المقاطع فقط."
     )
 
+def candidate_hits(client: QdrantClient, embed, collections, query: str, k: int = TOP_K_OVERALL):
+    """
+    Search all collections (dense, fused with BM25 when HYBRID_SEARCH is on) and
+    keep the top-k hits of the dominant subject.
+    """
+    hits = search_all(client, embed, collections, query, TOP_K_PER_COLLECTION)
+    if HYBRID_SEARCH and not isinstance(client, LocalIndexClient):  # local stores use row ids
+        with metrics.span("query_lexical"):
+            hits = fuse_hits(hits, lexical_search(collections, query, TOP_K_PER_COLLECTION))
+    if not hits:
+        return []
+    with metrics.span("query_filter"):
+        dom_subj = subject_of_top_hit(hits)
+        return filter_hits_to_subject_topk(hits, dom_subj, k=k)
+
+def retrieve(client: QdrantClient, embed, collections, query: str, reranker=None, stats: dict | None = None):
+    """
+    Full retrieval step for one question: candidate hits of the dominant subject,
+    reranked by the cross-encoder when a reranker is given, then the packed, numbered context.
+    Returns (context, sources); both empty when nothing matched. stats: see build_context.
+    """
+    if reranker is None:
+        hits = candidate_hits(client, embed, collections, query, TOP_K_OVERALL)
+    else:
+        hits = candidate_hits(client, embed, collections, query, RERANK_CANDIDATES)
+        with metrics.span("query_rerank"):
+            hits = reranker.rerank(query, hits)
+    if not hits:
+        metrics.inc("query_no_hits_total")
+        return "", []
+
+    # Build context from filtered snippets
+    with metrics.span("query_context"):
+        return build_context(hits, TOP_K_OVERALL, stats=stats)
+
+def generate_answer(llm, question: str, context: str) -> str:
+    """Ali5 answer for a question from its retrieved context (raises on LLM errors)."""
+    with metrics.span("query_prompt"):
+        prompt = build_prompt(question, context)
+    with metrics.span("query_llm"):
+        answer = llm.complete(prompt).text
+    # Delete any numbered lists if the question is not math-related
+    return strip_numbering_if_not_math(answer, is_calc_question(question)).strip()
+
+def stream_answer(llm, question: str, context: str, on_text=None):
+    """
+    Streaming counterpart of generate_answer: passes each printable piece of the
+    answer to on_text as tokens arrive (numbering filter applied incrementally).
+    Returns (answer, ttft_s, total_s); ttft_s is the time until the first visible text.
+    """
+    with metrics.span("query_prompt"):
+        prompt = build_prompt(question, context)
+    stripper = NumberingStripper(is_math=is_calc_question(question))
+    parts = []
+    ttft_s = None
+    start = time.perf_counter()
+
+    def _emit(piece: str):
+        nonlocal ttft_s
+        if not piece:
+            return
+        if ttft_s is None:
+            ttft_s = time.perf_counter() - start
+        parts.append(piece)
+        if on_text is not None:
+            on_text(piece)
+
+    for chunk in llm.stream_complete(prompt):
+        _emit(stripper.feed(chunk.delta or ""))
+    _emit(stripper.finish())
+    total_s = time.perf_counter() - start
+    ttft_s = ttft_s if ttft_s is not None else total_s
+    metrics.observe("query_llm_seconds", total_s)
+    metrics.observe("query_llm_first_token_seconds", ttft_s)
+    return "".join(parts), ttft_s, total_s
+
+def answer_cache_key(grade: int, term: int, question: str, sources):
+    """
+    (grade, term, dominant subject, reply language, numbers in the question) – the scope
+    in which answers are reused; "12 × 4" never gets the cached answer of "12 × 5".
+    """
+    subject = (sources[0][1].get("subject") or "").strip().lower() if sources else ""
+    return (grade, term, subject, detect_reply_lang(question), question_numbers(question))
+
+def format_pack_stats(stats) -> str:
+    line = (f"✂️ context: {stats['tokens_before']} → {stats['tokens_after']} tokens "
+            f"(saved {stats['tokens_saved']}, {stats['kept']}/{stats['snippets']} snippets")
+    dropped = [f"{stats[k]} {label}" for k, label in
+               (("duplicates", "near-duplicate"), ("over_budget", "over budget"), ("trimmed", "trimmed")) if stats[k]]
+    return line + (", " + ", ".join(dropped) if dropped else "") + ")"
+
+def _score_text(h) -> str:
+    text = f"score={h['score']:.4f}"
+    return text + (f" rrf={h['rrf_score']:.4f}" if "rrf_score" in h else "")
+
 def print_sources(sources):
     print("\n--- مصادر من الكتاب ---")
     for i, h in sources:
-        score = h["score"]
         src = h["source"]; page = h["page"]; col = h["collection"]
-        print(f"[{i}] score={score:.4f} | src={src} | page={page} | col={col}")
+        print(f"[{i}] {_score_text(h)} | src={src} | page={page} | col={col}")
         # print("    " + h["text"].replace("\n", " ") + "\n")
 
 # -------------------------------
 # (4) Deployment
 # -------------------------------
+def _timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+def _load_warm_embed():
+    embed = load_embed_model()  # EMBED_BACKEND: hf | onnx
+    embed.get_query_embedding("warm up")  # first forward pass initializes the runtime
+    return embed
+
+def start_warmup() -> dict:
+    """
+    Loads the search client, embedding model, LLM and reranker in background threads.
+    Returns {name: Future of (value, seconds)}; .result() re-raises loading errors.
+    """
+    pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="warmup")
+    futures = {
+        "search client": pool.submit(_timed, load_search_client),
+        "embeddings": pool.submit(_timed, _load_warm_embed),
+        "llm": pool.submit(_timed, load_llm),            # ممكن يكون None
+        "reranker": pool.submit(_timed, load_reranker),  # None unless USE_RERANK=1
+    }
+    pool.shutdown(wait=False)
+    return futures
+
 def main():
-    # 1) Env & clients
+    # 1) Env & clients (loading in the background while grade/term are entered)
+    start = time.perf_counter()
     load_dotenv(ENV_PATH)
-    url = os.getenv("URL_QDRANT"); key = os.getenv("API_KEY_QDRANT")
-    if not url or not key:
-        raise EnvironmentError("❌ ضع URL_QDRANT و API_KEY_QDRANT في .env")
-
-    client = QdrantClient(url=url, api_key=key)
-    embed = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, normalize=True)
-    llm = load_llm()  # ممكن يكون None
+    metrics.setup()
+    warmup = start_warmup()
+    answer_cache = SemanticAnswerCache()
 
     # 2) Enter grade & term
     print("ادخل الصف الدراسي والترم للبحث:")
@@ -217,6 +613,16 @@ def main():
         except Exception:
             print("⚠️ اختَر 1 أو 2.")
 
+    if not all(f.done() for f in warmup.values()):
+        print("⏳ Loading models...")
+    loaded = {name: f.result() for name, f in warmup.items()}
+    client = loaded["search client"][0]
+    embed = QueryEmbeddingCache(loaded["embeddings"][0])
+    llm = loaded["llm"][0]
+    reranker = loaded["reranker"][0]
+    print(f"⏱️ startup: ready after {time.perf_counter() - start:.2f}s ("
+          + ", ".join(f"{name} {secs:.2f}s" for name, (_, secs) in loaded.items()) + ")")
+
     # 3) Get collections for that grade & term
     collections = get_matching_collections(client, grade, term)
     if not collections:
@@ -225,54 +631,77 @@ def main():
     print("Selected Collections:", ", ".join(collections))
 
     # 4) Ask
+    gen_timings = []  # (time to first token, total generation time) per generated answer
     print("\n🤖 اكتب سؤالك (q للخروج):")
     while True:
         q = input("\nسؤالك: ").strip()
         if not q or q.lower() == "q":
             break
 
-        # Initial search From All Collections
-        hits = search_all(client, embed, collections, q, TOP_K_PER_COLLECTION)
-        if not hits:
+        # Search all collections → dominant subject candidates → (rerank) → numbered context
+        pack_stats = {}
+        context, sources = retrieve(client, embed, collections, q, reranker, stats=pack_stats)
+        if not sources:
             print("⚠️ No Matching Results.")
             continue
-
-        # Get Top-K from Dominant Subject
-        dom_subj = subject_of_top_hit(hits)
-        hits = filter_hits_to_subject_topk(hits, dom_subj, k=TOP_K_OVERALL)
-
-        # Build context from filtered snippets
-        context, sources = build_context(hits, TOP_K_OVERALL)
+        print(format_pack_stats(pack_stats))
 
         # If no LLM → print top snippets only
         if llm is None:
             print("\n=== أفضل النتائج (بدون توليد) ===")
             for i, h in sources:
                 txt = h["text"].replace("\n", " ")
-                print(f"[{i}] score={h['score']:.4f} | src={h['source']} | page={h['page']} | col={h['collection']}")
+                print(f"[{i}] {_score_text(h)} | src={h['source']} | page={h['page']} | col={h['collection']}")
                 print(f"    {txt[:200]}\n")
             continue
 
-        # With LLM → build prompt & generate answer
-        prompt = build_prompt(q, context)
+        # With LLM → reuse a cached answer for a near-identical question, else generate
+        key = answer_cache_key(grade, term, q, sources)
+        qvec = embed.peek(q)  # embedded (and cached) by search_all
         try:
-            answer = llm.complete(prompt).text
-            # Delete any numbered lists if the question is not math-related
-            answer = strip_numbering_if_not_math(answer, is_calc_question(q))
+            answer = answer_cache.get(key, qvec)
+            cached = answer is not None
+            if cached:
+                print("\n=== الإجابة ===")
+                print(answer.strip())
+            elif STREAM_ANSWERS:
+                print("\n=== الإجابة ===")
+                answer, ttft_s, total_s = stream_answer(
+                    llm, q, context, on_text=lambda t: print(t, end="", flush=True))
+                print()
+            else:
+                start = time.perf_counter()
+                answer = generate_answer(llm, q, context)
+                ttft_s = total_s = time.perf_counter() - start
+                print("\n=== الإجابة ===")
+                print(answer.strip())
         except Exception as e:
             print(f"⚠️ LLM error: {e}")
             # fallback : Print top snippets
             print("\n=== Top Snippets ===")
             for i, h in sources:
                 txt = h["text"].replace("\n", " ")
-                print(f"[{i}] score={h['score']:.4f} | src={h['source']} | page={h['page']} | col={h['collection']}")
+                print(f"[{i}] {_score_text(h)} | src={h['source']} | page={h['page']} | col={h['collection']}")
                 print(f"    {txt[:200]}\n")
             continue
 
-        print("\n=== الإجابة ===")
-        print(answer.strip())
+        if not cached:
+            answer_cache.put(key, qvec, answer)
+            gen_timings.append((ttft_s, total_s))
+            print(f"⏱️ first token {ttft_s:.2f}s | total {total_s:.2f}s")
         print_sources(sources)
 
+    print(f"\n📊 cache: query embeddings {embed.stats()} | answers {answer_cache.stats()}")
+    if reranker is not None:
+        print(f"🔁 rerank: {reranker.stats()}")
+    if gen_timings:
+        ttfts = sorted(t for t, _ in gen_timings)
+        totals = sorted(t for _, t in gen_timings)
+        p95 = lambda xs: xs[min(len(xs) - 1, int(0.95 * len(xs)))]
+        print(f"⏱️ {len(gen_timings)} generated answer(s): first token "
+              f"median {ttfts[len(ttfts) // 2]:.2f}s / p95 {p95(ttfts):.2f}s | total "
+              f"median {totals[len(totals) // 2]:.2f}s / p95 {p95(totals):.2f}s")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch question answering: pre-generates Ali5 answers for a whole worksheet.
+
+Input is JSONL ({"question", "grade", "term", optional "id"}) or a text file with one
+question per line (grade/term from --grade/--term). For the whole file:
+
+1) all questions are embedded in one batched call (filling the query-vector cache
+   that search_all reads),
+2) retrieval (search → dominant subject → rerank → packed context) runs for
+   BATCH_SEARCH_CONCURRENCY questions at a time in threads,
+3) BATCH_LLM_CONCURRENCY async workers send the prompts to the LLM as their contexts
+   become ready. Two token buckets keep them under the Groq limits (GROQ_RPM requests
+   and GROQ_TPM tokens per minute); 429 / 5xx / timeouts are retried with exponential
+   backoff and full jitter, at least retry-after, which also pauses every worker.
+
+Each result (answer, sources, per-stage timings, attempts) is written to the output
+JSONL as soon as it is done, so the order follows completion ("index" is the input line).
+
+    python app/batch_ask.py worksheet.jsonl --out answers.jsonl [--grade 5 --term 1]
+
+Offline, against the rate-limited stub server (app/stub_llm_server.py):
+    LLM_BACKEND=http GROQ_API_KEY=x GROQ_API_BASE=http://127.0.0.1:8900/openai/v1 \
+        RETRIEVAL_BACKEND=local python app/batch_ask.py worksheet.jsonl --out answers.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from ask import (ENV_PATH, answer_cache_key, build_prompt, generate_answer,
+                 get_matching_collections, retrieve, start_warmup)
+import metrics
+from context_packer import estimate_tokens
+from loadtest import percentile
+from query_cache import QueryEmbeddingCache, SemanticAnswerCache
+
+# ============== CONFIG ==============
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "8"))  # questions retrieved at once
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))        # LLM requests in flight
+# Groq free tier for llama-3.3-70b-versatile; set to your plan's limits
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))      # requests per minute
+GROQ_TPM = int(os.getenv("GROQ_TPM", "12000"))   # tokens per minute (prompt + answer)
+BATCH_BURST_S = 10.0            # the buckets hold at most this many seconds of quota
+BATCH_ANSWER_TOKENS = 400       # answer tokens counted per request before it is sent
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "5"))
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# ====================================
+
+
+class TokenBucket:
+    """
+    Async token bucket: refills `rate` tokens per second up to `capacity`; acquire(n)
+    waits until n are available (first come, first served). pause(s) empties it for
+    s seconds, so a 429's retry-after holds back every worker, not only the one that got it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.waited_s = 0.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, limit: int, burst_s: float = BATCH_BURST_S) -> "TokenBucket":
+        return cls(limit / 60.0, limit / 60.0 * burst_s)
+
+    async def acquire(self, n: float = 1.0) -> None:
+        n = min(n, self.capacity)  # a request larger than the bucket would wait forever
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now >= self._updated:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= n:
+                        self._tokens -= n
+                        break
+                    await asyncio.sleep((n - self._tokens) / self.rate)
+                else:  # paused
+                    await asyncio.sleep(self._updated - now)
+        self.waited_s += time.monotonic() - start
+
+    def pause(self, seconds: float) -> None:
+        until = time.monotonic() + seconds
+        if until > self._updated:
+            self._tokens = 0.0
+            self._updated = until
+
+
+class GroqLimiter:
+    """Request and token buckets for GROQ_RPM / GROQ_TPM (either <= 0 = unlimited)."""
+
+    def __init__(self, rpm: int = GROQ_RPM, tpm: int = GROQ_TPM):
+        self.requests = TokenBucket.per_minute(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket.per_minute(tpm) if tpm > 0 else None
+
+    async def acquire(self, tokens: int) -> None:
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(tokens)
+
+    def pause(self, seconds: float) -> None:
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
+
+    def waited_s(self) -> float:
+        return sum(b.waited_s for b in (self.requests, self.tokens) if b is not None)
+
+
+def _status_and_headers(exc):
+    """HTTP status and headers of an LLM error (ask.LLMHTTPError or openai's APIStatusError)."""
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    headers = getattr(exc, "headers", None) or getattr(response, "headers", None) or {}
+    return status, headers
+
+
+def retry_delay(exc, attempt: int, rng=random):
+    """
+    Seconds to wait before retry number `attempt` (0-based) of a failed LLM call, or
+    None when the error is not transient. Full-jitter exponential backoff, but never
+    less than the server's retry-after.
+    """
+    status, headers = _status_and_headers(exc)
+    if status is None:
+        # urllib timeouts / refused connections, openai's APITimeoutError / APIConnectionError
+        if not (isinstance(exc, OSError) or type(exc).__name__ in ("APITimeoutError", "APIConnectionError")):
+            return None
+    elif status not in RETRY_STATUSES:
+        return None
+    try:
+        retry_after = float(headers.get("retry-after") or 0)
+    except ValueError:
+        retry_after = 0.0
+    return max(retry_after, rng.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)))
+
+
+def load_items(path: Path, grade=None, term=None) -> list:
+    """
+    [{"index", "id", "question", "grade", "term"}] from a JSONL or plain text file.
+    JSONL lines that are not a JSON object are skipped with a warning (line number).
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if path.suffix == ".jsonl":
+                try:
+                    obj = json.loads(line)
+                except ValueError as e:
+                    print(f"⚠️ {path}:{lineno}: skipped, invalid JSON ({e})", file=sys.stderr)
+                    continue
+                if not isinstance(obj, dict):
+                    print(f"⚠️ {path}:{lineno}: skipped, not a JSON object", file=sys.stderr)
+                    continue
+            else:
+                obj = {"question": line}
+            index = len(items)
+            items.append({
+                "index": index,
+                "id": obj.get("id", index),
+                "question": str(obj.get("question") or "").strip(),
+                "grade": obj.get("grade", grade),
+                "term": obj.get("term", term),
+            })
+    return items
+
+
+def _source_rows(sources) -> list:
+    return [{"i": i, "score": round(h["score"], 4), "source": h["source"], "page": h["page"],
+             "collection": h["collection"]} for i, h in sources]
+
+
+class BatchRunner:
+    """Runs one batch with shared models; results go to `write` (one dict per question)."""
+
+    def __init__(self, client, embed, llm, reranker=None, write=print,
+                 search_concurrency: int = BATCH_SEARCH_CONCURRENCY,
+                 llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+                 limiter: GroqLimiter = None, max_retries: int = BATCH_MAX_RETRIES):
+        self.client = client
+        self.embed = QueryEmbeddingCache(embed)
+        self.answers = SemanticAnswerCache()
+        self.llm = llm
+        self.reranker = reranker
+        self.write = write
+        self.search_concurrency = max(1, search_concurrency)
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.limiter = limiter or GroqLimiter()
+        self.max_retries = max_retries
+        self.counters = {"questions": 0, "answered": 0, "cached": 0, "no_sources": 0, "errors": 0,
+                         "retries": 0, "rate_limited": 0}
+        self.timings = []  # timings_ms of every finished question
+        self.wall_s = 0.0
+
+    def _finish(self, item: dict, started: float, **result) -> None:
+        item["timings_ms"]["total"] = round(1000 * (time.perf_counter() - started), 1)
+        self.timings.append(item["timings_ms"])
+        if "error" in result:
+            self.counters["errors"] += 1
+        row = {k: item[k] for k in ("index", "id", "question", "grade", "term")}
+        row.update(result)
+        row["timings_ms"] = item["timings_ms"]
+        self.write(row)
+
+    def _retrieve(self, item: dict, collections) -> None:
+        """Blocking retrieval for one question; runs in a search thread."""
+        start = time.perf_counter()
+        pack_stats = {}
+        item["context"], item["sources"] = retrieve(self.client, self.embed, collections, item["question"],
+                                                    self.reranker, stats=pack_stats)
+        item["context_tokens"] = pack_stats.get("tokens_after", 0)
+        item["timings_ms"]["retrieve"] = round(1000 * (time.perf_counter() - start), 1)
+
+    async def _generate(self, item: dict, pool: ThreadPoolExecutor) -> dict:
+        """LLM answer under the rate limits, retried on transient errors."""
+        loop = asyncio.get_running_loop()
+        cost = estimate_tokens(build_prompt(item["question"], item["context"])) + BATCH_ANSWER_TOKENS
+        attempts, wait_s, gen_s = 0, 0.0, 0.0
+        while True:
+            start = time.perf_counter()
+            await self.limiter.acquire(cost)
+            call_start = time.perf_counter()
+            wait_s += call_start - start
+            attempts += 1
+            try:
+                result = {"answer": await loop.run_in_executor(pool, generate_answer, self.llm,
+                                                               item["question"], item["context"])}
+            except Exception as e:
+                error, result = e, {"error": f"LLM error: {e}"}
+                delay = retry_delay(e, attempts - 1)
+            gen_s += time.perf_counter() - call_start
+            if "answer" in result or delay is None or attempts > self.max_retries:
+                break
+            status = _status_and_headers(error)[0]
+            if status == 429:
+                self.counters["rate_limited"] += 1
+                self.limiter.pause(delay)
+            self.counters["retries"] += 1
+            metrics.inc("llm_retries_total", status=status or "connection")
+            await asyncio.sleep(delay)
+            wait_s += delay
+        metrics.observe("llm_limiter_wait_seconds", wait_s)
+        item["attempts"] = attempts
+        item["timings_ms"]["llm_wait"] = round(1000 * wait_s, 1)
+        item["timings_ms"]["generate"] = round(1000 * gen_s, 1)
+        return result
+
+    async def _llm_worker(self, jobs: asyncio.Queue, pool: ThreadPoolExecutor) -> None:
+        while True:
+            job = await jobs.get()
+            if job is None:
+                return
+            item, started, key, qvec = job
+            result = await self._generate(item, pool)
+            if "answer" in result:
+                self.answers.put(key, qvec, result["answer"])
+                self.counters["answered"] += 1
+            self._finish(item, started, **result, attempts=item["attempts"],
+                         sources=_source_rows(item["sources"]), context_tokens=item["context_tokens"])
+
+    async def run(self, items: list) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.counters["questions"] = len(items)
+        valid = []
+        for item in items:
+            item["timings_ms"] = {}
+            try:
+                item["grade"], item["term"] = int(item["grade"]), int(item["term"])
+            except (TypeError, ValueError):
+                pass
+            if not item["question"] or item["grade"] not in range(1, 7) or item["term"] not in (1, 2):
+                self._finish(item, started, error="need question, grade (1-6) and term (1-2)")
+            else:
+                valid.append(item)
+
+        collections_for = {}
+        for grade, term in sorted({(it["grade"], it["term"]) for it in valid}):
+            collections_for[(grade, term)] = get_matching_collections(self.client, grade, term)
+
+        # 1) one batched embedding call for every question
+        t0 = time.perf_counter()
+        self.embed.get_query_embedding_batch([it["question"] for it in valid])
+        embed_ms = round(1000 * (time.perf_counter() - t0) / max(1, len(valid)), 2)
+
+        # 2) retrieval in threads → 3) generation by the async LLM workers
+        jobs: asyncio.Queue = asyncio.Queue()
+        search_pool = ThreadPoolExecutor(self.search_concurrency, thread_name_prefix="batch-search")
+        llm_pool = ThreadPoolExecutor(self.llm_concurrency, thread_name_prefix="batch-llm")
+        workers = [asyncio.create_task(self._llm_worker(jobs, llm_pool)) for _ in range(self.llm_concurrency)]
+
+        async def retrieve_one(item):
+            item["timings_ms"]["embed"] = embed_ms
+            collections = collections_for[(item["grade"], item["term"])]
+            if not collections:
+                self._finish(item, started, error=f"No collections that end with _g{item['grade']}_t{item['term']}")
+                return
+            try:
+                await loop.run_in_executor(search_pool, self._retrieve, item, collections)
+            except Exception as e:
+                self._finish(item, started, error=f"retrieval error: {e}")
+                return
+            sources = _source_rows(item["sources"])
+            if not item["sources"]:
+                self.counters["no_sources"] += 1
+                self._finish(item, started, answer=None, sources=[])
+                return
+            if self.llm is None:  # sources only, like ask.py without an LLM
+                self._finish(item, started, answer=None, sources=sources, context_tokens=item["context_tokens"])
+                return
+            key = answer_cache_key(item["grade"], item["term"], item["question"], item["sources"])
+            qvec = self.embed.peek(item["question"])
+            answer = self.answers.get(key, qvec)
+            if answer is not None:
+                self.counters["cached"] += 1
+                self._finish(item, started, answer=answer, cached=True, sources=sources,
+                             context_tokens=item["context_tokens"])
+                return
+            await jobs.put((item, started, key, qvec))
+
+        try:
+            await asyncio.gather(*(retrieve_one(it) for it in valid))
+            for _ in workers:
+                await jobs.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            search_pool.shutdown()
+            llm_pool.shutdown()
+        self.wall_s = time.perf_counter() - started
+
+    def summary(self) -> dict:
+        summary = dict(self.counters, wall_s=round(self.wall_s, 2),
+                       questions_per_s=round(self.counters["questions"] / self.wall_s, 2) if self.wall_s else 0.0,
+                       limiter_wait_s=round(self.limiter.waited_s(), 2))
+        for stage in ("retrieve", "llm_wait", "generate", "total"):
+            vals = [t[stage] for t in self.timings if stage in t]
+            if vals:
+                summary[f"{stage}_ms"] = {f"p{p}": round(percentile(vals, p), 1) for p in (50, 95)}
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions in one batch")
+    parser.add_argument("questions", type=Path, help="JSONL (question, grade, term[, id]) or one question per line")
+    parser.add_argument("--out", type=Path, help="results JSONL (default: stdout)")
+    parser.add_argument("--grade", type=int, help="for lines without a grade")
+    parser.add_argument("--term", type=int, help="for lines without a term")
+    parser.add_argument("--search-concurrency", type=int, default=BATCH_SEARCH_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=GROQ_RPM, help="LLM requests per minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=GROQ_TPM, help="LLM tokens per minute (0 = unlimited)")
+    parser.add_argument("--summary", type=Path, help="write the run summary as JSON here")
+    args = parser.parse_args()
+
+    load_dotenv(ENV_PATH)
+    metrics.setup()
+    items = load_items(args.questions, args.grade, args.term)
+    print(f"📄 {len(items)} question(s) from {args.questions}", file=sys.stderr)
+    loaded = {name: f.result()[0] for name, f in start_warmup().items()}
+    if loaded["llm"] is None:
+        print("⚠️ No LLM configured: writing sources only", file=sys.stderr)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+
+    def write(row):
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        out.flush()
+
+    runner = BatchRunner(loaded["search client"], loaded["embeddings"], loaded["llm"], loaded["reranker"],
+                         write=write, search_concurrency=args.search_concurrency,
+                         llm_concurrency=args.llm_concurrency, limiter=GroqLimiter(args.rpm, args.tpm))
+    try:
+        asyncio.run(runner.run(items))
+    finally:
+        if args.out:
+            out.close()
+    summary = runner.summary()
+    print(json.dumps(summary, ensure_ascii=False, indent=2), file=sys.stderr)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Equivalence check + microbenchmark: text_cleaning.py vs the original
+extract_books.detect_math_symbols / clean_text (kept verbatim below as legacy_*).
+
+Texts checked:
+  eval/cleaning_corpus.jsonl   hand-written edge cases (short math lines, markers with
+                               Arabic-Indic digits, literal placeholders, Unicode whitespace, ...)
+  --pages                      docstore.json / *_cleaned.json / cleaned .jsonl pages, each also
+                               with the [MATH_DETECTED]/[DIAGRAM_DETECTED] markers _extract_page adds
+  --pdf                        raw PyMuPDF page text of these PDFs (no OCR)
+
+Any difference is printed and the exit status is 1. Then both implementations are
+timed over all texts (best of --repeat) and the per-page cost and speedup reported.
+
+    python app/bench_cleaning.py --pages Indexes/maths/g5/t1/index_math_g5_t1/docstore.json \
+        [--pdf Data/Books/maths/g5/t1/*.pdf] [--repeat 5] [--out bench_cleaning.json]
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from text_cleaning import clean_text, count_math_symbols
+
+CORPUS_PATH = Path(__file__).resolve().parents[1] / "eval" / "cleaning_corpus.jsonl"
+
+
+def legacy_detect_math_symbols(text):
+    """Detect mathematical symbols and equations in text"""
+    math_patterns = [
+        r'[+\-×÷*/=<>≤≥≠±√∑∏∫]',  # Basic math symbols
+        r'\d+[/]\d+',  # Fractions like 1/2
+        r'\d+\^\d+',  # Powers like 2^3
+        r'[xy]\s*[=]',  # Variables with equals
+        r'\([^)]*[+\-*/][^)]*\)',  # Expressions in parentheses
+        r'\b(sin|cos|tan|log|ln)\b',  # Mathematical functions
+        r'\d+\s*[°]',  # Degrees
+        r'[αβγδθπλμσφψω]',  # Greek letters
+    ]
+
+    math_content = []
+    for pattern in math_patterns:
+        matches = re.findall(pattern, text, re.IGNORECASE)
+        if matches:
+            math_content.extend(matches)
+
+    return math_content
+
+
+def legacy_clean_text(text):
+    """Simple text cleaning for Arabic content with math preservation"""
+    # Preserve mathematical notations first
+    math_markers = []
+    math_pattern = r'\[MATH_DETECTED:.*?\]|\[DIAGRAM_DETECTED:.*?\]|\[MATH_BOOK_SUMMARY:.*?\]'
+    for match in re.finditer(math_pattern, text):
+        placeholder = f"__MATH_MARKER_{len(math_markers)}__"
+        math_markers.append(match.group())
+        text = text.replace(match.group(), placeholder)
+
+    # Normalize Arabic digits
+    text = text.translate(str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789"))
+
+    # Preserve mathematical symbols while cleaning
+    math_symbols = r'[+\-×÷*/=<>≤≥≠±√∑∏∫°αβγδθπλμσφψω\^\(\)\[\]]'
+
+    # Remove extra spaces and empty lines but preserve math content
+    lines = []
+    for line in text.split('\n'):
+        line = line.strip()
+        # Keep lines with math markers, math symbols, or meaningful content
+        if (line and
+            (len(line) > 2 or
+             '__MATH_MARKER_' in line or
+             re.search(math_symbols, line) or
+             re.search(r'\d+[/\^]\d+', line))):
+            lines.append(line)
+
+    cleaned_text = '\n'.join(lines)
+
+    # Restore math markers
+    for i, marker in enumerate(math_markers):
+        placeholder = f"__MATH_MARKER_{i}__"
+        cleaned_text = cleaned_text.replace(placeholder, marker)
+
+    return cleaned_text
+
+
+def _with_markers(text: str) -> str:
+    """Page text as _extract_page passes it to clean_text for a math book."""
+    n = len(legacy_detect_math_symbols(text))
+    marked = f"[MATH_DETECTED: {n} elements]\n{text}" if n else text
+    return marked + "\n[DIAGRAM_DETECTED: 4 geometric elements]\n"
+
+
+def load_texts(pages_paths, pdf_paths) -> list:
+    """[(name, text)] from the corpus file, page stores and PDFs."""
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        texts = [(f"corpus:{c['name']}", c["text"]) for c in (json.loads(line) for line in f if line.strip())]
+    if pages_paths:
+        from chunking import _load_pages
+        for path in pages_paths:
+            for source, pages in _load_pages(path).items():
+                for page, text in sorted(pages.items()):
+                    texts.append((f"{source}:{page}", text))
+                    texts.append((f"{source}:{page}+markers", _with_markers(text)))
+    for pdf in pdf_paths or []:
+        import fitz
+        with fitz.open(pdf) as doc:
+            for i, page in enumerate(doc, 1):
+                text = page.get_text()
+                texts.append((f"{pdf.name}:{i}", text))
+                texts.append((f"{pdf.name}:{i}+markers", _with_markers(text)))
+    return texts
+
+
+def fold_cases() -> list:
+    """Every BMP character alone, and every case variant of the function names in context:
+    covers the re.IGNORECASE folds that text_cleaning spells out."""
+    texts = [(f"fold:U+{c:04X}", chr(c)) for c in range(0x10000) if not 0xD800 <= c < 0xE000]
+    variants = {"s": "Ssſ", "i": "Iiİı"}
+    for word in ("sin", "cos", "tan", "log", "ln"):
+        forms = [""]
+        for ch in word:
+            forms = [f + v for f in forms for v in variants.get(ch, ch + ch.upper())]
+        for form in forms:
+            for before, after in (("", ""), (" ", "("), ("a", ""), ("", "x"), ("٣", " "), ("_", ""), ("é", "")):
+                texts.append((f"fold:{before}{form}{after}", before + form + after))
+    return texts
+
+
+def check(texts) -> list:
+    """Names (and function) of the texts where the new implementation differs."""
+    failures = []
+    for name, text in texts:
+        if count_math_symbols(text) != len(legacy_detect_math_symbols(text)):
+            failures.append(f"{name}: count_math_symbols")
+        if clean_text(text) != legacy_clean_text(text):
+            failures.append(f"{name}: clean_text")
+    return failures
+
+
+def _best_of(fn, texts, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _, text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="text_cleaning.py vs legacy cleaning: equivalence + speed")
+    parser.add_argument("--pages", nargs="*", type=Path, help="docstore.json / *_cleaned.json / cleaned .jsonl")
+    parser.add_argument("--pdf", nargs="*", type=Path, help="PDFs to take raw page text from")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args()
+
+    texts = load_texts(args.pages, args.pdf)
+    folds = fold_cases()
+    failures = check(texts + folds)
+    print(f"🔍 {len(texts)} texts + {len(folds)} case-fold probes checked, {len(failures)} difference(s)")
+    for failure in failures[:20]:
+        print(f"  ❌ {failure}")
+
+    chars = sum(len(t) for _, t in texts)
+    report = {"texts": len(texts), "chars": chars, "differences": failures, "per_text_us": {}}
+    print(f"{'function':<20}{'legacy_us':>11}{'new_us':>9}{'speedup':>9}")
+    for name, legacy, new in (("detect_math", legacy_detect_math_symbols, count_math_symbols),
+                              ("clean_text", legacy_clean_text, clean_text)):
+        old_s, new_s = _best_of(legacy, texts, args.repeat), _best_of(new, texts, args.repeat)
+        report["per_text_us"][name] = {"legacy": round(1e6 * old_s / len(texts), 2),
+                                       "new": round(1e6 * new_s / len(texts), 2),
+                                       "speedup": round(old_s / new_s, 2)}
+        r = report["per_text_us"][name]
+        print(f"{name:<20}{r['legacy']:>11}{r['new']:>9}{r['speedup']:>8}x")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
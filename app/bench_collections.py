@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: per-collection vs single-collection layout (collection_layout.py).
+
+The same synthetic corpus (--subjects × 6 grades × 2 terms collections of
+--points random vectors) is loaded in each layout, each in a fresh Python process,
+and queried through ask.get_matching_collections / ask.search_all:
+  collections   Qdrant collections created
+  build_s       time to create the collections / payload indexes and upsert all points
+  memory_mb     memory added by the data: process RSS for :memory:, the server's
+                memory_resident_bytes (/metrics) with --url
+  session_ms    mean get_matching_collections() time (list + suffix match vs facet)
+  query_ms      search_all() latency p50 / p95 (fan-out vs one grouped, filtered query)
+  agreement     share of the per-collection hits the single layout returns too
+
+In-process Qdrant (":memory:", the default) searches exhaustively and ignores payload
+indexes, so it shows the fan-out overhead but not HNSW behaviour; use --url with a
+Qdrant server for real numbers. With --url the benchmark uses its own
+bench_* collections and deletes them afterwards.
+
+    python app/bench_collections.py [--subjects 6] [--points 500] [--queries 200] \
+        [--url http://localhost:6333] [--out bench_collections.json]
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+from loadtest import percentile
+
+LAYOUTS = ("per_collection", "single")
+BENCH_PREFIX = "bench_"
+GRADE_TERMS = [(g, t) for g in range(1, 7) for t in (1, 2)]
+
+
+def _rss_mb() -> float:
+    """Current resident memory (Linux /proc), else peak RSS from getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _server_memory_mb(url: str, api_key: str):
+    """memory_resident_bytes from the Qdrant /metrics endpoint, or None."""
+    try:
+        req = urllib.request.Request(url.rstrip("/") + "/metrics", headers={"api-key": api_key or ""})
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            text = resp.read().decode()
+        value = re.search(r"^memory_resident_bytes\s+(\S+)", text, re.M)
+        return float(value.group(1)) / (1024 * 1024) if value else None
+    except Exception:
+        return None
+
+
+class _VectorQuery:
+    """search_all embeds the query through this; returns the prepared vector."""
+
+    def __init__(self, qvec):
+        self.qvec = qvec
+
+    def get_query_embedding(self, _query):
+        return self.qvec
+
+
+def _child(layout: str, url: str, cfg: dict, queries: np.ndarray) -> dict:
+    """Runs inside the fresh process: load the corpus in `layout`, time sessions and queries."""
+    os.environ["COLLECTION_LAYOUT"] = layout
+    os.environ["SINGLE_COLLECTION"] = f"{BENCH_PREFIX}curriculum"
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+    import ask
+    import collection_layout
+
+    api_key = os.getenv("API_KEY_QDRANT", "")
+    client = QdrantClient(url=url, api_key=api_key or None) if url else QdrantClient(":memory:")
+    memory = (lambda: _server_memory_mb(url, api_key)) if url else _rss_mb
+    base_memory = memory()
+
+    rng = np.random.default_rng(cfg["seed"])
+    dim, created = cfg["dim"], set()
+    t0 = time.perf_counter()
+    for s in range(cfg["subjects"]):
+        subject = f"{BENCH_PREFIX}s{s}"
+        for grade, term in GRADE_TERMS:
+            scope = {"subject": subject, "grade": f"g{grade}", "term": f"t{term}"}
+            name = collection_layout.collection_name(subject, f"g{grade}", f"t{term}")
+            target = collection_layout.SINGLE_COLLECTION if layout == "single" else name
+            if target not in created:
+                client.create_collection(target, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+                if layout == "single":
+                    collection_layout.ensure_payload_indexes(client, target)
+                created.add(target)
+            vectors = rng.normal(size=(cfg["points"], dim)).astype(np.float32)
+            first_id = (s * len(GRADE_TERMS) + GRADE_TERMS.index((grade, term))) * cfg["points"]
+            points = [PointStruct(id=first_id + i, vector=v.tolist(),
+                                  payload={**scope, "text": f"{name} {i}", "page": i, "source": f"{subject}.pdf"})
+                      for i, v in enumerate(vectors)]
+            for start in range(0, len(points), 256):
+                client.upsert(target, points=points[start:start + 256], wait=True)
+    build_s = time.perf_counter() - t0
+    used_memory = memory()
+
+    session_ms, collections_for = [], {}
+    for grade, term in GRADE_TERMS:
+        start = time.perf_counter()
+        names = ask.get_matching_collections(client, grade, term)
+        session_ms.append(1000 * (time.perf_counter() - start))
+        collections_for[(grade, term)] = [n for n in names if n.startswith(BENCH_PREFIX)]
+
+    latencies, results = [], []
+    for qi, q in enumerate(queries):
+        collections = collections_for[GRADE_TERMS[qi % len(GRADE_TERMS)]]
+        start = time.perf_counter()
+        hits = ask.search_all(client, _VectorQuery(q.tolist()), collections, "", cfg["top_k"])
+        latencies.append(1000 * (time.perf_counter() - start))
+        results.append(sorted(h["id"] for h in hits))
+
+    if url:
+        for name in created:
+            client.delete_collection(name)
+    return {
+        "collections": len(created),
+        "build_s": round(build_s, 2),
+        "memory_mb": round(used_memory - base_memory, 1) if used_memory is not None and base_memory is not None
+        else None,
+        "session_ms": round(sum(session_ms) / len(session_ms), 2),
+        "query_ms": {"p50": round(percentile(latencies, 50), 2), "p95": round(percentile(latencies, 95), 2)},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-collection vs single-collection Qdrant layout benchmark")
+    parser.add_argument("--subjects", type=int, default=6)
+    parser.add_argument("--points", type=int, default=500, help="points per subject/grade/term")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8, help="hits per subject (TOP_K_PER_COLLECTION)")
+    parser.add_argument("--url", default="", help="Qdrant server (API_KEY_QDRANT from env); default :memory:")
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        layout, url, cfg_path, queries_path = args.child
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        print(json.dumps(_child(layout, url, cfg, np.load(queries_path))))
+        return
+
+    cfg = {"subjects": args.subjects, "points": args.points, "dim": args.dim, "top_k": args.top_k, "seed": 0}
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with open(tmp / "cfg.json", "w", encoding="utf-8") as f:
+            json.dump(cfg, f)
+        np.save(tmp / "queries.npy", np.random.default_rng(1).normal(size=(args.queries, args.dim)).astype(np.float32))
+        for layout in LAYOUTS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", layout, args.url, str(tmp / "cfg.json"), str(tmp / "queries.npy")],
+                check=True, capture_output=True, text=True,
+            )
+            rows[layout] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    baseline = rows["per_collection"]["results"]
+    for layout, row in rows.items():
+        found = sum(len(set(a) & set(b)) for a, b in zip(row.pop("results"), baseline))
+        row["agreement"] = round(found / max(1, sum(len(b) for b in baseline)), 4)
+
+    print(f"{args.subjects * len(GRADE_TERMS)} subject/grade/term groups × {args.points} points, "
+          f"{args.queries} queries ({args.url or ':memory:'})")
+    print(f"{'layout':<16}{'collections':>12}{'build_s':>9}{'memory_mb':>11}{'session_ms':>12}"
+          f"{'query_p50':>11}{'query_p95':>11}{'agreement':>11}")
+    for layout, r in rows.items():
+        print(f"{layout:<16}{r['collections']:>12}{r['build_s']:>9}{str(r['memory_mb']):>11}{r['session_ms']:>12}"
+              f"{r['query_ms']['p50']:>11}{r['query_ms']['p95']:>11}{r['agreement']:>11}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"config": cfg, "url": args.url or ":memory:", "layouts": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: embedding backends of embeddings.py on CPU.
+
+  hf         HuggingFaceEmbedding (PyTorch), the reference
+  onnx       ONNX export, float32 weights (model.onnx)
+  onnx-int8  ONNX export, dynamic int8 weights (model_int8.onnx)
+
+Every backend runs in a fresh Python process, so startup includes the imports.
+For each one it reports:
+  startup_s       import + model load + first query embedding
+  query_ms        single-query latency, p50 / p95
+  batch_per_s     passages embedded per second with get_text_embedding_batch
+  cosine          min / mean cosine similarity to the hf vectors of the same texts
+
+Texts come from the cleaned JSONL files when --data is given, else from built-in samples.
+Run `python app/embeddings.py export` first.
+
+    python app/bench_embeddings.py [--data Data/Extracted_Books/Cleaned] [--queries 100] \
+        [--passages 512] [--batch-size 64] [--out bench_embeddings.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embeddings import ONNX_EMBED_DIR, SAMPLE_TEXTS
+from loadtest import percentile
+
+BACKENDS = {"hf": ("hf", None), "onnx": ("onnx", "model.onnx"), "onnx-int8": ("onnx", "model_int8.onnx")}
+
+
+def _load_texts(data: Path, limit: int) -> list:
+    texts = []
+    if data:
+        for jsonl_file in sorted(Path(data).rglob("*.jsonl")):
+            with open(jsonl_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = (json.loads(line).get("text") or "").strip()
+                    except ValueError:
+                        continue
+                    if text:
+                        texts.append(text)
+                    if len(texts) >= limit:
+                        return texts
+    while len(texts) < limit:
+        texts.extend(SAMPLE_TEXTS)
+    return texts[:limit]
+
+
+def _child(name: str, texts_path: Path, out_dir: Path, n_queries: int, batch_size: int) -> dict:
+    """Runs inside the fresh process: load, time queries and a batch, save vectors."""
+    t0 = time.perf_counter()
+    from embeddings import OnnxEmbedding, load_embed_model
+    backend, file_name = BACKENDS[name]
+    model = (load_embed_model("hf", embed_batch_size=batch_size) if backend == "hf"
+             else OnnxEmbedding(file_name=file_name, embed_batch_size=batch_size))
+    with open(texts_path, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    model.get_query_embedding(texts[0])
+    startup_s = time.perf_counter() - t0
+
+    queries = [t[:200] for t in texts[:n_queries]]
+    latencies, query_vectors = [], []
+    for q in queries:
+        start = time.perf_counter()
+        query_vectors.append(model.get_query_embedding(q))
+        latencies.append(1000 * (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    passage_vectors = model.get_text_embedding_batch(texts)
+    batch_s = time.perf_counter() - start
+
+    np.save(out_dir / f"{name}.npy", np.asarray(query_vectors + passage_vectors, dtype=np.float32))
+    return {"startup_s": round(startup_s, 2),
+            "query_ms": {"p50": round(percentile(latencies, 50), 2), "p95": round(percentile(latencies, 95), 2)},
+            "batch_per_s": round(len(texts) / batch_s, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyTorch vs ONNX (int8) embedding benchmark")
+    parser.add_argument("--data", type=Path, help="Cleaned JSONL tree to take passages from")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--passages", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        name, texts_path, out_dir, n_queries, batch_size = args.child
+        print(json.dumps(_child(name, Path(texts_path), Path(out_dir), int(n_queries), int(batch_size))))
+        return
+
+    names = [n for n in args.backends.split(",") if n]
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with open(tmp / "texts.json", "w", encoding="utf-8") as f:
+            json.dump(_load_texts(args.data, args.passages), f, ensure_ascii=False)
+        for name in names:
+            if BACKENDS[name][1] and not (ONNX_EMBED_DIR / BACKENDS[name][1]).exists():
+                print(f"⚠️ {name}: {ONNX_EMBED_DIR / BACKENDS[name][1]} missing, skipped")
+                continue
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", name, str(tmp / "texts.json"), str(tmp),
+                 str(args.queries), str(args.batch_size)],
+                capture_output=True, text=True,
+            )
+            if out.returncode != 0:
+                print(f"⚠️ {name} failed: {(out.stderr.strip().splitlines() or ['?'])[-1]}")
+                continue
+            rows[name] = json.loads(out.stdout.strip().splitlines()[-1])
+
+        if "hf" in rows:
+            reference = np.load(tmp / "hf.npy")
+            for name in rows:
+                vectors = np.load(tmp / f"{name}.npy")
+                sims = np.sum(reference * vectors, axis=1) / (
+                    np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1))
+                rows[name]["cosine"] = {"min": round(float(sims.min()), 5), "mean": round(float(sims.mean()), 5)}
+
+    print(f"\n{'backend':<11}{'startup_s':>10}{'query_p50':>11}{'query_p95':>11}{'batch/s':>9}{'cos_min':>9}")
+    for name, r in rows.items():
+        print(f"{name:<11}{r['startup_s']:>10}{r['query_ms']['p50']:>11}{r['query_ms']['p95']:>11}"
+              f"{r['batch_per_s']:>9}{r.get('cosine', {}).get('min', '-'):>9}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: loading a persisted index store from its JSON files vs. the compact
+binary sidecars written by local_index.build_sidecar (float32 / float16 / int8).
+
+Every variant is loaded in a fresh Python process so load time and peak RSS are
+not skewed by earlier runs. For each variant it reports:
+  load_ms       time to make the store searchable (+ decode the top-10 payloads)
+  rss_mb        resident memory added by loading (and touching) the store
+  query_ms      mean exact top-10 search latency
+  recall@10     overlap with the float32 top-10 (quantization loss)
+  disk_kb       bytes on disk read by that variant
+
+    python app/bench_index_load.py [--root Indexes] [--queries 50] [--out bench_index_load.json]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import local_index
+
+VARIANTS = ("json", "float32", "float16", "int8")
+
+
+def _rss_mb() -> float:
+    """Current resident memory (Linux /proc), else peak RSS from getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _child(variant: str, store_dir: Path, sidecar: Path, queries: np.ndarray) -> dict:
+    """Runs inside the fresh process: load, search, report."""
+    base_rss = _rss_mb()
+    t0 = time.perf_counter()
+    if variant == "json":
+        vectors = local_index._faiss_vectors(store_dir / "default__vector_store.json")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        payloads = local_index._payloads(store_dir, len(vectors))
+
+        def search(q):
+            scores = vectors @ q
+            return [int(r) for r in np.argsort(-scores)[:10]]
+        _ = [payloads[r] for r in search(queries[0])]
+    else:
+        col = local_index.LocalCollection(store_dir, search="exact", sidecar=sidecar)
+
+        def search(q):
+            return [r for r, _ in col.search(q, 10)]
+        _ = [col.payload(r) for r in search(queries[0])]
+    load_ms = 1000 * (time.perf_counter() - t0)
+
+    t1 = time.perf_counter()
+    results = [search(q) for q in queries]
+    query_ms = 1000 * (time.perf_counter() - t1) / len(queries)
+    return {"load_ms": round(load_ms, 2), "rss_mb": round(_rss_mb() - base_rss, 2),
+            "query_ms": round(query_ms, 3), "results": results}
+
+
+def _run_variant(variant: str, store_dir: Path, sidecar: Path, queries_path: Path) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", variant, str(store_dir), str(sidecar), str(queries_path)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs binary sidecar index load benchmark")
+    parser.add_argument("--root", type=Path, default=local_index.INDEXES_ROOT)
+    parser.add_argument("--queries", type=int, default=50, help="random stored vectors used as queries")
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        variant, store_dir, sidecar, queries_path = args.child
+        print(json.dumps(_child(variant, Path(store_dir), Path(sidecar), np.load(queries_path))))
+        return
+
+    report = {}
+    for name, store_dir in local_index.discover_stores(args.root).items():
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            vectors = local_index._faiss_vectors(store_dir / "default__vector_store.json")
+            rng = np.random.default_rng(0)
+            queries = vectors[rng.integers(0, len(vectors), args.queries)]
+            queries = queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+            np.save(tmp / "queries.npy", queries.astype(np.float32))
+
+            rows = {}
+            for variant in VARIANTS:
+                sidecar = tmp / variant
+                if variant == "json":
+                    disk = sum((store_dir / f).stat().st_size for f in local_index._SOURCE_FILES)
+                else:
+                    local_index.build_sidecar(store_dir, variant, out=sidecar)
+                    disk = sum(p.stat().st_size for p in sidecar.iterdir())
+                rows[variant] = _run_variant(variant, store_dir, sidecar, tmp / "queries.npy")
+                rows[variant]["disk_kb"] = round(disk / 1024, 1)
+
+        baseline = rows["float32"]["results"]
+        for variant, row in rows.items():
+            hits = sum(len(set(a) & set(b)) for a, b in zip(row.pop("results"), baseline))
+            row["recall@10"] = round(hits / (10 * len(baseline)), 4)
+        report[name] = rows
+
+        print(f"\n📦 {name}")
+        print(f"{'variant':<9}{'load_ms':>10}{'rss_mb':>9}{'query_ms':>10}{'recall@10':>11}{'disk_kb':>10}")
+        for variant, r in rows.items():
+            print(f"{variant:<9}{r['load_ms']:>10}{r['rss_mb']:>9}{r['query_ms']:>10}"
+                  f"{r['recall@10']:>11}{r['disk_kb']:>10}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
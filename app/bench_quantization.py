@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: vector storage profiles (vector_profiles.py) — float32 vs int8 scalar vs
+binary quantization with oversampling + float32 rescoring.
+
+The same synthetic corpus (--points unit vectors around --clusters centres sharing a
+common direction, like E5 embeddings) is loaded once per profile, each in a fresh
+Python process, and queried with the search parameters ask.search_all sends:
+  est_ram_mb   vectors + HNSW links kept in RAM (vector_profiles.estimated_ram_mb)
+  memory_mb    memory added by the data: process RSS for :memory:, the server's
+               memory_resident_bytes (/metrics) with --url
+  build_s      create + upsert + wait until the server has indexed everything
+  query_ms     query_points latency p50 / p95
+  recall@k     share of the exact float32 top-k (NumPy brute force) returned
+
+In-process Qdrant (":memory:", the default) ignores quantization and HNSW settings and
+searches exhaustively, so every profile shows float32 numbers there; use --url with a
+Qdrant server for real ones. The server only builds HNSW / quantized segments above
+its indexing threshold (20 MB of vectors by default, ~13k points of 384 dims), hence
+the default --points. With --url the benchmark uses its own bench_* collection and
+deletes it afterwards.
+
+    python app/bench_quantization.py [--points 20000] [--queries 500] [--top-k 10] \
+        [--oversampling 0] [--hnsw-ef 0] [--url http://localhost:6333] [--out bench_quantization.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+import vector_profiles
+from bench_collections import BENCH_PREFIX, _rss_mb, _server_memory_mb
+from loadtest import percentile
+
+BENCH_COLLECTION = f"{BENCH_PREFIX}quantization"
+
+
+def make_corpus(n_points: int, n_queries: int, dim: int, clusters: int, seed: int = 0):
+    """
+    (points, queries) as unit float32 vectors; queries are drawn like the points.
+    A shared direction dominates, as in E5 embeddings (median pairwise cosine ~0.87
+    here, ~0.89 for the real g5/t1 maths store), which is the hard case for binary.
+    Keep ~20 points per cluster: much larger clusters make the top-k near-ties.
+    """
+    rng = np.random.default_rng(seed)
+    common = rng.normal(size=dim)
+    common /= np.linalg.norm(common)
+    centres = rng.normal(size=(clusters, dim)) / np.sqrt(dim)
+
+    def sample(n):
+        v = 3.0 * common + centres[rng.integers(0, clusters, n)] + 0.6 * rng.normal(size=(n, dim)) / np.sqrt(dim)
+        return (v / np.linalg.norm(v, axis=1, keepdims=True)).astype(np.float32)
+    return sample(n_points), sample(n_queries)
+
+
+def exact_top_k(points: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Row ids of the k nearest points per query by cosine (the vectors are unit length)."""
+    out = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start:start + 256] @ points.T
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        out.append(np.take_along_axis(top, order, axis=1))
+    return np.vstack(out)
+
+
+def _wait_indexed(client, name: str, timeout_s: float = 600.0) -> None:
+    """Waits until the server's optimizers are done (HNSW + quantized segments built)."""
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if str(getattr(client.get_collection(name).status, "value", "")) == "green":
+            return
+        time.sleep(0.5)
+    print(f"⚠️ {name} still optimizing after {timeout_s:.0f}s", file=sys.stderr)
+
+
+def _child(profile: str, url: str, cfg: dict, points: np.ndarray, queries: np.ndarray) -> dict:
+    """Runs inside the fresh process: load the corpus with `profile`, time the queries."""
+    warnings.filterwarnings("ignore", message=".*not supported in the local Qdrant.*")
+    warnings.filterwarnings("ignore", message=".*has no effect in local mode.*")
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import PointStruct
+
+    api_key = os.getenv("API_KEY_QDRANT", "")
+    client = QdrantClient(url=url, api_key=api_key or None) if url else QdrantClient(":memory:")
+    memory = (lambda: _server_memory_mb(url, api_key)) if url else _rss_mb
+    base_memory = memory()
+
+    t0 = time.perf_counter()
+    if client.collection_exists(BENCH_COLLECTION):
+        client.delete_collection(BENCH_COLLECTION)
+    client.create_collection(BENCH_COLLECTION, **vector_profiles.create_kwargs(
+        points.shape[1], profile, m=cfg["m"], ef_construct=cfg["ef_construct"]))
+    for start in range(0, len(points), 256):
+        batch = points[start:start + 256]
+        client.upsert(BENCH_COLLECTION, points=[PointStruct(id=start + i, vector=v.tolist(), payload={})
+                                                for i, v in enumerate(batch)], wait=True)
+    if url:
+        _wait_indexed(client, BENCH_COLLECTION)
+    build_s = time.perf_counter() - t0
+    used_memory = memory()
+
+    params = vector_profiles.search_params(profile, hnsw_ef=cfg["hnsw_ef"], oversampling=cfg["oversampling"])
+    for q in queries[:min(20, len(queries))]:  # warm-up (connections, caches)
+        client.query_points(BENCH_COLLECTION, query=q.tolist(), limit=cfg["top_k"], search_params=params)
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        res = client.query_points(BENCH_COLLECTION, query=q.tolist(), limit=cfg["top_k"], search_params=params)
+        latencies.append(1000 * (time.perf_counter() - start))
+        results.append([int(p.id) for p in res.points])
+
+    if url:
+        client.delete_collection(BENCH_COLLECTION)
+    return {
+        "est_ram_mb": round(vector_profiles.estimated_ram_mb(len(points), points.shape[1], profile, cfg["m"]), 1),
+        "memory_mb": round(used_memory - base_memory, 1) if used_memory is not None and base_memory is not None
+        else None,
+        "build_s": round(build_s, 2),
+        "query_ms": {"p50": round(percentile(latencies, 50), 2), "p95": round(percentile(latencies, 95), 2)},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="float32 vs int8 vs binary Qdrant storage benchmark")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--profiles", default=",".join(vector_profiles.PROFILES))
+    parser.add_argument("--oversampling", type=float, default=vector_profiles.QUANT_OVERSAMPLING,
+                        help="0 = each profile's default")
+    parser.add_argument("--hnsw-ef", type=int, default=vector_profiles.HNSW_EF, help="0 = Qdrant's default")
+    parser.add_argument("--m", type=int, default=vector_profiles.HNSW_M)
+    parser.add_argument("--ef-construct", type=int, default=vector_profiles.HNSW_EF_CONSTRUCT)
+    parser.add_argument("--url", default="", help="Qdrant server (API_KEY_QDRANT from env); default :memory:")
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        profile, url, cfg_path, points_path, queries_path = args.child
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        print(json.dumps(_child(profile, url, cfg, np.load(points_path), np.load(queries_path))))
+        return
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    for p in profiles:
+        vector_profiles._profile(p)  # unknown names fail before any work
+    cfg = {"points": args.points, "dim": args.dim, "clusters": args.clusters, "top_k": args.top_k,
+           "oversampling": args.oversampling, "hnsw_ef": args.hnsw_ef, "m": args.m,
+           "ef_construct": args.ef_construct}
+    points, queries = make_corpus(args.points, args.queries, args.dim, args.clusters)
+    truth = exact_top_k(points, queries, args.top_k)
+
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with open(tmp / "cfg.json", "w", encoding="utf-8") as f:
+            json.dump(cfg, f)
+        np.save(tmp / "points.npy", points)
+        np.save(tmp / "queries.npy", queries)
+        for profile in profiles:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", profile, args.url, str(tmp / "cfg.json"),
+                 str(tmp / "points.npy"), str(tmp / "queries.npy")],
+                check=True, capture_output=True, text=True,
+            )
+            rows[profile] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    for row in rows.values():
+        found = sum(len(set(r) & set(t.tolist())) for r, t in zip(row.pop("results"), truth))
+        row[f"recall@{args.top_k}"] = round(found / truth.size, 4)
+
+    recall = f"recall@{args.top_k}"
+    print(f"{args.points} points × {args.dim} dims, {args.queries} queries, top {args.top_k} "
+          f"(m={args.m}, ef_construct={args.ef_construct}, hnsw_ef={args.hnsw_ef or 'default'}, "
+          f"oversampling={args.oversampling or 'profile'}; {args.url or ':memory:'})")
+    print(f"{'profile':<10}{'est_ram_mb':>12}{'memory_mb':>11}{'build_s':>9}{'query_p50':>11}"
+          f"{'query_p95':>11}{recall:>11}")
+    for profile, r in rows.items():
+        print(f"{profile:<10}{r['est_ram_mb']:>12}{str(r['memory_mb']):>11}{r['build_s']:>9}"
+              f"{r['query_ms']['p50']:>11}{r['query_ms']['p95']:>11}{r[recall]:>11}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"config": cfg, "url": args.url or ":memory:", "profiles": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Eval: retrieval order vs. cross-encoder reranking (rerank.py).
+
+For every question of the eval set the candidates are retrieved once (same path as
+ask.retrieve), then compared before and after reranking:
+  recall@k      share of the relevant (source, page) pairs found in the top k
+  hit@k         questions with at least one relevant pair in the top k
+  rerank_ms     added latency of the rerank stage (p50 / p95 / max)
+  fallbacks     queries left in retrieval order (budget / busy / timeout)
+
+Eval set: JSONL, one question per line
+    {"question": "ما هو ناتج 12 × 4؟", "grade": 5, "term": 1,
+     "relevant": [{"source": "math_g5_t1.pdf", "page": 14}]}
+
+    python app/bench_rerank.py --eval eval/questions.jsonl --k 5 [--backend local] [--out rerank.json]
+"""
+import argparse
+import json
+import time
+
+from dotenv import load_dotenv
+
+from ask import ENV_PATH, candidate_hits, get_matching_collections, load_search_client
+from embeddings import load_embed_model
+from loadtest import percentile
+from query_cache import QueryEmbeddingCache
+from rerank import RERANK_CANDIDATES, CrossEncoderReranker
+
+
+def _key(source, page) -> str:
+    return f"{source}|{page}"
+
+
+def hit_keys(hit) -> set:
+    """(source, page) keys a hit covers; chunks from chunking.py may span page..page_end."""
+    try:
+        pages = range(int(hit["page"]), int(hit.get("page_end") or hit["page"]) + 1)
+    except (TypeError, ValueError):
+        pages = [hit["page"]]
+    return {_key(hit["source"], p) for p in pages}
+
+
+def recall_at_k(hits, relevant: set, k: int) -> float:
+    found = set().union(*(hit_keys(h) for h in hits[:k])) & relevant
+    return len(found) / len(relevant) if relevant else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency of cross-encoder reranking")
+    parser.add_argument("--eval", required=True, help="JSONL eval set (see module docstring)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES)
+    parser.add_argument("--backend", default="", help="qdrant | local (default: RETRIEVAL_BACKEND)")
+    parser.add_argument("--out", help="write the summary as JSON here")
+    args = parser.parse_args()
+
+    load_dotenv(ENV_PATH)
+    with open(args.eval, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    client = load_search_client(args.backend)
+    embed = QueryEmbeddingCache(load_embed_model())
+    reranker = CrossEncoderReranker()
+
+    rows = []
+    for item in items:
+        relevant = {_key(r["source"], r["page"]) for r in item.get("relevant", [])}
+        collections = get_matching_collections(client, int(item["grade"]), int(item["term"]))
+        hits = candidate_hits(client, embed, collections, item["question"], args.candidates)
+        start = time.perf_counter()
+        reranked = reranker.rerank(item["question"], hits)
+        rows.append({
+            "rerank_ms": 1000 * (time.perf_counter() - start),
+            "base": recall_at_k(hits, relevant, args.k),
+            "rerank": recall_at_k(reranked, relevant, args.k),
+            "base_hit": recall_at_k(hits, relevant, args.k) > 0,
+            "rerank_hit": recall_at_k(reranked, relevant, args.k) > 0,
+        })
+
+    n = len(rows) or 1
+    lat = [r["rerank_ms"] for r in rows]
+    summary = {
+        "questions": len(rows),
+        "k": args.k,
+        "candidates": args.candidates,
+        "backend": reranker.backend,
+        f"recall@{args.k}": {"retrieval": round(sum(r["base"] for r in rows) / n, 4),
+                             "reranked": round(sum(r["rerank"] for r in rows) / n, 4)},
+        f"hit@{args.k}": {"retrieval": round(sum(r["base_hit"] for r in rows) / n, 4),
+                          "reranked": round(sum(r["rerank_hit"] for r in rows) / n, 4)},
+        "rerank_ms": {"p50": round(percentile(lat, 50), 1), "p95": round(percentile(lat, 95), 1),
+                      "max": round(max(lat, default=0.0), 1)},
+        "fallbacks": reranker.stats()["fallbacks"],
+    }
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
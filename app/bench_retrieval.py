@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retrieval benchmark over golden question sets (one JSONL file per grade/term,
+e.g. eval/golden/g5_t1.jsonl, same format as bench_rerank.py):
+
+    {"question": "ما هو ترتيب إجراء العمليات الحسابية؟", "grade": 5, "term": 1,
+     "relevant": [{"source": "Maths_grade_5_first_term.pdf", "page": 131}, ...]}
+
+Every question goes through the same steps as ask.retrieve + generate_answer,
+timed one by one: embed → search (dense, + BM25 fusion when hybrid) → subject
+filter → rerank (optional) → prompt build → generate (StubLLM, no network).
+Reported per golden file and overall:
+  recall@k   share of the relevant (source, page) pairs in the top k (k = 1, 3, 5, 10)
+  hit@k      questions with at least one relevant pair in the top k
+  mrr        mean reciprocal rank of the first relevant hit
+  context    mean prompt-context tokens before / after context_packer.pack
+  latency    p50 / p95 / mean ms per stage
+
+The JSON written to --out (sorted keys, per-question rankings included) is meant
+to be diffed between runs, e.g. before/after changing chunk_size or the top-k's.
+
+    python app/bench_retrieval.py --golden eval/golden --backend local --out runs/local.json
+    python app/bench_retrieval.py --golden eval/golden --backend memory \
+        --seed Data/Extracted_Books/Cleaned --top-k-overall 5 --no-subject-filter
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import ask
+from bench_rerank import hit_keys, recall_at_k
+from embeddings import load_embed_model
+from loadtest import percentile
+
+K_VALUES = (1, 3, 5, 10)
+STAGES = ("embed", "search", "filter", "rerank", "prompt", "generate")
+
+
+class _FixedQuery:
+    """Hands search_all the vector embedded in the "embed" stage, so search time excludes it."""
+
+    def __init__(self, qvec):
+        self.qvec = qvec
+
+    def get_query_embedding(self, _query):
+        return self.qvec
+
+
+def _key(hit) -> str:
+    return f"{hit['source']}|{hit['page']}"
+
+
+def run_question(client, embed, collections, item, args, llm=None, reranker=None) -> dict:
+    q = item["question"]
+    ms = {}
+
+    start = time.perf_counter()
+    qvec = embed.get_query_embedding(q)
+    ms["embed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = ask.search_all(client, _FixedQuery(qvec), collections, q, args.top_k_per_collection)
+    if args.hybrid:
+        hits = ask.fuse_hits(hits, ask.lexical_search(collections, q, args.top_k_per_collection))
+    ms["search"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    subject = ask.subject_of_top_hit(hits) if args.subject_filter else None
+    keep = max(args.top_k_overall, args.rerank_candidates) if reranker else args.top_k_overall
+    hits = ask.filter_hits_to_subject_topk(hits, subject, k=keep)
+    ms["filter"] = time.perf_counter() - start
+
+    if reranker is not None:
+        start = time.perf_counter()
+        hits = reranker.rerank(q, hits)
+        ms["rerank"] = time.perf_counter() - start
+    hits = hits[:args.top_k_overall]
+
+    start = time.perf_counter()
+    pack_stats = {}
+    context, _ = ask.build_context(hits, args.top_k_overall, args.context_budget, stats=pack_stats)
+    ask.build_prompt(q, context)
+    ms["prompt"] = time.perf_counter() - start
+
+    if llm is not None and hits:
+        start = time.perf_counter()
+        ask.generate_answer(llm, q, context)
+        ms["generate"] = time.perf_counter() - start
+
+    relevant = {f"{r['source']}|{r['page']}" for r in item.get("relevant", [])}
+    ranked = [_key(h) for h in hits]
+    first = next((rank for rank, h in enumerate(hits, 1) if hit_keys(h) & relevant), None)
+    return {
+        "question": q,
+        "ranked": ranked,
+        "first_relevant_rank": first,
+        "recall": {str(k): recall_at_k(hits, relevant, k) for k in K_VALUES},
+        "latency_ms": {stage: round(1000 * s, 3) for stage, s in ms.items()},
+        "context_tokens": {k: pack_stats.get(k, 0) for k in ("tokens_before", "tokens_after")},
+    }
+
+
+def summarize(rows) -> dict:
+    n = len(rows) or 1
+    summary = {
+        "questions": len(rows),
+        "recall@k": {str(k): round(sum(r["recall"][str(k)] for r in rows) / n, 4) for k in K_VALUES},
+        "hit@k": {str(k): round(sum(1 for r in rows if r["first_relevant_rank"] and r["first_relevant_rank"] <= k) / n, 4)
+                  for k in K_VALUES},
+        "mrr": round(sum(1 / r["first_relevant_rank"] for r in rows if r["first_relevant_rank"]) / n, 4),
+        "latency_ms": {},
+        "context_tokens": {k: round(sum(r["context_tokens"][k] for r in rows) / n, 1)
+                           for k in ("tokens_before", "tokens_after")},
+    }
+    for stage in STAGES:
+        vals = [r["latency_ms"][stage] for r in rows if stage in r["latency_ms"]]
+        if vals:
+            summary["latency_ms"][stage] = {"p50": round(percentile(vals, 50), 3),
+                                            "p95": round(percentile(vals, 95), 3),
+                                            "mean": round(sum(vals) / len(vals), 3)}
+    return summary
+
+
+def _golden_files(path: Path) -> list:
+    return sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval benchmark over golden question sets")
+    parser.add_argument("--golden", type=Path, default=ask.ROOT / "eval" / "golden",
+                        help="golden JSONL file or a directory of them (one per grade/term)")
+    parser.add_argument("--backend", choices=["local", "memory", "qdrant"], default="local",
+                        help="local = Indexes/ stores, memory = in-process Qdrant seeded from --seed, "
+                             "qdrant = URL_QDRANT")
+    parser.add_argument("--seed", type=Path, help="Cleaned JSONL tree for --backend memory")
+    parser.add_argument("--top-k-per-collection", type=int, default=ask.TOP_K_PER_COLLECTION)
+    parser.add_argument("--top-k-overall", type=int, default=ask.TOP_K_OVERALL)
+    parser.add_argument("--no-subject-filter", dest="subject_filter", action="store_false")
+    parser.add_argument("--hybrid", action=argparse.BooleanOptionalAction, default=ask.HYBRID_SEARCH)
+    parser.add_argument("--rerank", action="store_true", help="cross-encoder rerank stage (rerank.py)")
+    parser.add_argument("--rerank-candidates", type=int, default=ask.RERANK_CANDIDATES)
+    parser.add_argument("--context-budget", type=int, default=ask.context_packer.CONTEXT_TOKEN_BUDGET,
+                        help="prompt context token budget (context_packer.py)")
+    parser.add_argument("--no-generate", action="store_true", help="skip the stub LLM stage")
+    parser.add_argument("--label", default="", help="free text stored with the run (e.g. 'chunk_size=300')")
+    parser.add_argument("--out", type=Path, help="write the full run as JSON here")
+    args = parser.parse_args()
+
+    load_dotenv(ask.ENV_PATH)
+    embed = load_embed_model()
+    if args.backend == "memory":
+        from qdrant_client import QdrantClient
+        from serve import seed_collections
+        client = QdrantClient(":memory:")
+        if args.seed:
+            seed_collections(client, embed, args.seed)
+    else:
+        client = ask.load_search_client(args.backend)
+    # local stores use row ids, which the BM25 index can't be fused with (see ask.candidate_hits)
+    args.hybrid = args.hybrid and args.backend != "local"
+    llm = None if args.no_generate else ask.StubLLM()
+    reranker = None
+    if args.rerank:
+        from rerank import CrossEncoderReranker
+        reranker = CrossEncoderReranker()
+
+    embed.get_query_embedding("warm up")
+    run = {"config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+           "sets": {}, "questions": []}
+    collections_for = {}
+    for golden in _golden_files(args.golden):
+        with open(golden, "r", encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        rows = []
+        for item in items:
+            gt = (int(item["grade"]), int(item["term"]))
+            if gt not in collections_for:
+                collections_for[gt] = ask.get_matching_collections(client, *gt)
+            row = run_question(client, embed, collections_for[gt], item, args, llm, reranker)
+            row["set"] = golden.name
+            rows.append(row)
+        run["sets"][golden.name] = summarize(rows)
+        run["questions"].extend(rows)
+    run["summary"] = summarize(run["questions"])
+
+    print(f"{'set':<16}{'n':>4}{'R@1':>7}{'R@5':>7}{'R@10':>7}{'H@5':>7}{'MRR':>7}")
+    for name, s in list(run["sets"].items()) + [("ALL", run["summary"])]:
+        print(f"{name:<16}{s['questions']:>4}{s['recall@k']['1']:>7}{s['recall@k']['5']:>7}"
+              f"{s['recall@k']['10']:>7}{s['hit@k']['5']:>7}{s['mrr']:>7}")
+    print("⏱️ " + " | ".join(f"{stage} p50 {v['p50']:.1f}ms p95 {v['p95']:.1f}ms"
+                             for stage, v in run["summary"]["latency_ms"].items()))
+    ctx = run["summary"]["context_tokens"]
+    print(f"✂️ context tokens per question: {ctx['tokens_before']} → {ctx['tokens_after']}")
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(run, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
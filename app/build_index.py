@@ -1,17 +1,26 @@
 # build_index.py
 import os
-import json
-import uuid
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
-from typing import List
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 os.environ["TRANSFORMERS_NO_TF"] = "1"  
 os.environ["USE_TF"] = "0"              
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, Distance, VectorParams
-from llama_index.core import Document, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from qdrant_client.models import PointStruct, PointIdsList
+
+import chunk_records
+import collection_layout
+import lexical_index
+import index_manifest
+import metrics
+import vector_profiles
+from collection_layout import COLLECTION_LAYOUT, SINGLE_COLLECTION
+from embeddings import EMBED_BACKEND, load_embed_model
 
 # ========= ENV & CLIENT =========
 load_dotenv("/home/mohamed/DEPI_Project/.env")
@@ -24,41 +33,371 @@ if not URL_QDRANT or not API_KEY_QDRANT:
 QDRANT_CLIENT = QdrantClient(url=URL_QDRANT, api_key=API_KEY_QDRANT)
 
 # ========= MODEL =========
-# intfloat/multilingual-e5-small -> 384-dim
-EMBED_MODEL = HuggingFaceEmbedding(model_name="intfloat/multilingual-e5-small", normalize=True)
-Settings.embed_model = EMBED_MODEL
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # texts per forward pass
+EMBED_WORKERS    = int(os.getenv("EMBED_WORKERS", "0"))      # 0 = embed in this process
+
+# intfloat/multilingual-e5-small -> 384-dim, PyTorch (hf) or int8 ONNX (onnx), see embeddings.py
+EMBED_MODEL = load_embed_model(EMBED_BACKEND, embed_batch_size=EMBED_BATCH_SIZE)
+if EMBED_BACKEND == "hf":
+    from llama_index.core import Settings
+    Settings.embed_model = EMBED_MODEL
 
 # ========= CONFIG =========
 CLEANED_ROOT = "/home/mohamed/DEPI_Project/Data/Extracted_Books/Cleaned"
 VECTOR_DIM   = 384
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))  # points per upsert request
+UPSERT_IN_FLIGHT  = int(os.getenv("UPSERT_IN_FLIGHT", "4"))     # parallel upsert requests
 
 def _safe_create_collection(collection_name: str, recreate: bool) -> None:
     """
-    Creates or recreates a Qdrant collection with the given name.
+    Creates or recreates a Qdrant collection with the given name, using the storage
+    profile from VECTOR_PROFILE (quantization + HNSW settings, see vector_profiles.py).
     If recreate is True, it will delete any existing collection with the same name.
     """
     if recreate:
-        QDRANT_CLIENT.recreate_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE),
-        )
+        vector_profiles.create_collection(QDRANT_CLIENT, collection_name, VECTOR_DIM, recreate=True)
         return
     try:
-        QDRANT_CLIENT.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE),
-        )
+        vector_profiles.create_collection(QDRANT_CLIENT, collection_name, VECTOR_DIM)
     except Exception:
         pass  # Collection already exists
 
 
-def insert_into_qdart(recreate: bool = False) -> None:
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    """Groups an iterable into lists of at most `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _init_embed_worker(num_threads: int) -> None:
+    """
+    Runs once in every embedding worker. Each worker already loaded EMBED_MODEL
+    when it imported this module; here we only split the CPU cores between workers
+    so they don't oversubscribe each other.
+    """
+    if hasattr(EMBED_MODEL, "set_num_threads"):  # ONNX: session is created on first batch
+        EMBED_MODEL.set_num_threads(num_threads)
+        return
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except Exception:
+        pass
+
+
+def _embed_texts(texts: List[str]) -> Tuple[List[List[float]], float]:
+    """Embeds one batch in a single forward pass. Returns (vectors, seconds)."""
+    start = time.perf_counter()
+    vectors = EMBED_MODEL.get_text_embedding_batch(texts)
+    return vectors, time.perf_counter() - start
+
+
+def _make_embed_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Creates the embedding process pool, or None when embedding in-process."""
+    if workers <= 1:
+        return None
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn (not fork): torch's thread pools don't survive a fork safely
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_embed_worker,
+        initargs=(threads,),
+    )
+
+
+class EmbedStats:
+    """Collects chunk counts and per-batch latencies for the throughput report."""
+
+    def __init__(self) -> None:
+        self.chunks = 0
+        self.batch_seconds: List[float] = []
+        self.started = time.perf_counter()
+
+    def add(self, n_chunks: int, seconds: float) -> None:
+        self.chunks += n_chunks
+        self.batch_seconds.append(seconds)
+
+    def report(self, label: str) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        lat = sorted(self.batch_seconds)
+        if lat:
+            mean_ms = 1000 * sum(lat) / len(lat)
+            p95_ms  = 1000 * lat[min(len(lat) - 1, int(0.95 * len(lat)))]
+            max_ms  = 1000 * lat[-1]
+        else:
+            mean_ms = p95_ms = max_ms = 0.0
+        return (
+            f"⏱️ {label}: {self.chunks} chunk(s) in {elapsed:.1f}s "
+            f"→ {self.chunks / elapsed:.1f} chunks/sec | {len(lat)} batch(es), "
+            f"latency mean={mean_ms:.0f}ms p95={p95_ms:.0f}ms max={max_ms:.0f}ms"
+        )
+
+
+def embed_batches(batches: Iterable[List[Tuple[str, str, dict]]],
+                  pool: Optional[ProcessPoolExecutor] = None,
+                  stats: Optional[EmbedStats] = None,
+                  workers: int = EMBED_WORKERS,
+                  ) -> Iterator[Tuple[List[Tuple[str, str, dict]], List[List[float]]]]:
+    """
+    Embeds batches of records lazily and yields (batch, vectors) in input order.
+    With a pool (of `workers` processes), batches are spread across the workers, but
+    at most two batches per worker are submitted ahead of the consumer.
+    """
+    def _account(vectors, seconds):
+        metrics.observe("embed_batch_seconds", seconds)  # timed where it ran (maybe a worker)
+        metrics.inc("embedded_chunks_total", len(vectors))
+        if stats is not None:
+            stats.add(len(vectors), seconds)
+        return vectors
+
+    if pool is None:
+        for batch in batches:
+            with metrics.profiled("embed_batch"):
+                vectors, seconds = _embed_texts([text for _, text, _ in batch])
+            yield batch, _account(vectors, seconds)
+        return
+
+    max_pending = 2 * max(1, workers)
+    pending: deque = deque()
+    for batch in batches:
+        pending.append((batch, pool.submit(_embed_texts, [text for _, text, _ in batch])))
+        if len(pending) >= max_pending:
+            done_batch, fut = pending.popleft()
+            yield done_batch, _account(*fut.result())
+    while pending:
+        done_batch, fut = pending.popleft()
+        yield done_batch, _account(*fut.result())
+
+
+def _iter_point_batches(records: Iterable[Tuple[str, str, dict]],
+                        pool: Optional[ProcessPoolExecutor],
+                        stats: Optional[EmbedStats],
+                        embed_batch_size: int,
+                        upsert_batch_size: int,
+                        workers: int = EMBED_WORKERS) -> Iterator[List[PointStruct]]:
+    """Turns a stream of records into a stream of embedded PointStruct batches."""
+    points: List[PointStruct] = []
+    for batch, vectors in embed_batches(_batched(records, embed_batch_size), pool, stats, workers):
+        for (point_id, _, md), vector in zip(batch, vectors):
+            points.append(PointStruct(id=point_id, vector=vector, payload=md))
+            if len(points) >= upsert_batch_size:
+                yield points
+                points = []
+    if points:
+        yield points
+
+
+def index_records(records: Iterable[Tuple[str, str, dict]],
+                  collection_name: str,
+                  pool: Optional[ProcessPoolExecutor] = None,
+                  stats: Optional[EmbedStats] = None,
+                  embed_batch_size: int = EMBED_BATCH_SIZE,
+                  upsert_batch_size: int = UPSERT_BATCH_SIZE,
+                  in_flight: int = UPSERT_IN_FLIGHT,
+                  workers: int = EMBED_WORKERS) -> int:
+    """
+    Streams records through embed → upsert in bounded batches.
+    Up to `in_flight` upsert requests run in parallel; once that many are pending,
+    the pipeline waits for the oldest one before reading/embedding more (backpressure),
+    so memory stays flat regardless of how many records there are.
+    Returns the number of upserted points.
+    """
+    upserted = 0
+    pending: deque = deque()
+
+    def _wait_oldest() -> int:
+        fut: Future = pending.popleft()
+        return fut.result()  # re-raises upsert errors
+
+    def _upsert(points: List[PointStruct]) -> int:
+        with metrics.span("upsert"):
+            QDRANT_CLIENT.upsert(collection_name=collection_name, points=points, wait=True)
+        return len(points)
+
+    with ThreadPoolExecutor(max_workers=max(1, in_flight)) as uploader:
+        point_batches = _iter_point_batches(records, pool, stats, embed_batch_size, upsert_batch_size,
+                                           workers)
+        for points in point_batches:
+            if len(pending) >= max(1, in_flight):
+                upserted += _wait_oldest()
+            pending.append(uploader.submit(_upsert, points))
+        while pending:
+            upserted += _wait_oldest()
+    return upserted
+
+
+def _sync_records(file_name: str, records: Iterable[Tuple[str, str, dict]], collection_name: str,
+                  manifest: dict, pool: Optional[ProcessPoolExecutor], stats: EmbedStats,
+                  batch_size: int, scope: Optional[dict] = None,
+                  complete: Callable[[], bool] = lambda: True,
+                  workers: int = EMBED_WORKERS) -> Tuple[int, int, int]:
+    """
+    Brings one file's points in the collection up to date with its records:
+    - records whose content hash matches the manifest are skipped
+    - new/changed records are embedded and upserted
+    - points listed in the manifest but gone from the records are deleted, unless
+      complete() says the records stopped early (failed extraction in pipeline.py)
+    `scope` (single layout) overrides subject/grade/term in every payload, so the
+    filtered search sees exactly the values of the file's path.
+    Updates `manifest` in place. Returns (upserted, unchanged, deleted).
+    """
+    old_hashes = manifest.get(file_name, {})
+    new_hashes = {}
+    unchanged = 0
+
+    def _changed_records():
+        nonlocal unchanged
+        for point_id, text, md in records:
+            if scope:
+                md.update(scope)
+            h = index_manifest.content_hash(md)
+            new_hashes[point_id] = h
+            if old_hashes.get(point_id) == h:
+                unchanged += 1
+                continue
+            yield point_id, text, md
+
+    upserted = index_records(_changed_records(), collection_name,
+                             pool=pool, stats=stats, embed_batch_size=batch_size, workers=workers)
+
+    metrics.inc("index_points_total", upserted, result="upserted")
+    metrics.inc("index_points_total", unchanged, result="unchanged")
+    if not complete():
+        manifest[file_name] = {**old_hashes, **new_hashes}
+        return upserted, unchanged, 0
+
+    removed = [pid for pid in old_hashes if pid not in new_hashes]
+    if removed:
+        metrics.inc("index_points_total", len(removed), result="deleted")
+        QDRANT_CLIENT.delete(collection_name=collection_name,
+                             points_selector=PointIdsList(points=removed))
+
+    manifest[file_name] = new_hashes
+    return upserted, unchanged, len(removed)
+
+
+def _sync_file(jsonl_file: Path, collection_name: str, manifest: dict,
+               pool: Optional[ProcessPoolExecutor], stats: EmbedStats,
+               batch_size: int, scope: Optional[dict] = None,
+               workers: int = EMBED_WORKERS) -> Tuple[int, int, int]:
+    """_sync_records for the records of one JSONL file."""
+    return _sync_records(jsonl_file.name, chunk_records.iter_records(jsonl_file), collection_name, manifest,
+                         pool, stats, batch_size, scope, workers=workers)
+
+
+def _init_layout(recreate: bool) -> None:
+    """Single layout: the one collection and its payload indexes exist before any file is synced."""
+    if COLLECTION_LAYOUT == "single":
+        _safe_create_collection(SINGLE_COLLECTION, recreate=recreate)
+        collection_layout.ensure_payload_indexes(QDRANT_CLIENT, SINGLE_COLLECTION)
+
+
+def _open_collection(subject: str, grade: str, term: str, manifests: dict, recreate: bool) -> dict:
+    """
+    Target of one subject/grade/term in the current layout, created (per-collection
+    layout) and with its manifest loaded into `manifests` on first use.
+    Returns {"name", "target", "manifest_name", "scope", "label"}.
+    """
+    single = COLLECTION_LAYOUT == "single"
+    collection_name = collection_layout.collection_name(subject, grade, term)
+    info = {
+        "name": collection_name,
+        # single layout: one collection, manifests stay per subject_grade_term
+        "target": SINGLE_COLLECTION if single else collection_name,
+        "manifest_name": f"{SINGLE_COLLECTION}.{collection_name}" if single else collection_name,
+        "scope": {"subject": subject, "grade": grade, "term": term} if single else None,
+        "label": f"{SINGLE_COLLECTION}/{collection_name}" if single else collection_name,
+    }
+    if collection_name not in manifests:
+        if not single:
+            _safe_create_collection(collection_name, recreate=recreate)
+        manifest = {} if recreate else index_manifest.load_manifest(info["manifest_name"])
+        # A manifest for an empty collection is stale (collection dropped by hand)
+        count_filter = collection_layout.scope_filter(grade, term, [subject]) if single else None
+        if manifest and QDRANT_CLIENT.count(info["target"], count_filter=count_filter, exact=True).count == 0:
+            manifest = {}
+        manifests[collection_name] = manifest
+    return info
+
+
+def _prune_removed_files(manifests: dict, collection_files: dict) -> None:
+    """
+    Deletes the points of JSONL files that are listed in a manifest but no longer under
+    CLEANED_ROOT, and drops their manifest entries. Collections with no files left at
+    all are found through their manifests on disk; their BM25 index is removed too.
+    """
+    single = COLLECTION_LAYOUT == "single"
+    prefix = f"{SINGLE_COLLECTION}."
+    names = set(manifests)
+    for path in Path(index_manifest.MANIFEST_DIR).glob("*.json"):
+        stem = path.name[:-len(".json")]
+        if single and stem.startswith(prefix):
+            names.add(stem[len(prefix):])
+        elif not single and "." not in stem:
+            names.add(stem)
+
+    for collection_name in sorted(names):
+        manifest_name = f"{prefix}{collection_name}" if single else collection_name
+        manifest = manifests.get(collection_name)
+        if manifest is None:
+            manifest = index_manifest.load_manifest(manifest_name)
+        present = {f.name for f in collection_files.get(collection_name, [])}
+        gone = [file_name for file_name in manifest if file_name not in present]
+        if not gone:
+            continue
+        target = SINGLE_COLLECTION if single else collection_name
+        point_ids = [pid for file_name in gone for pid in manifest[file_name]]
+        if point_ids and QDRANT_CLIENT.collection_exists(target):
+            for start in range(0, len(point_ids), UPSERT_BATCH_SIZE):
+                QDRANT_CLIENT.delete(collection_name=target,
+                                     points_selector=PointIdsList(points=point_ids[start:start + UPSERT_BATCH_SIZE]))
+        metrics.inc("index_points_total", len(point_ids), result="deleted")
+        for file_name in gone:
+            del manifest[file_name]
+        index_manifest.save_manifest(manifest_name, manifest)
+        if not present:
+            (lexical_index.LEXICAL_DIR / f"{collection_name}.npz").unlink(missing_ok=True)
+        print(f"🗑️ {collection_name}: {len(gone)} removed file(s), deleted {len(point_ids)} point(s)")
+
+
+def _rebuild_lexical(collection_files: dict,
+                     records_of: Callable[[Path], Iterable[Tuple[str, str, dict]]] = None) -> None:
+    """
+    Rebuilds each collection's BM25 index (lexical_index) from all of its JSONL files;
+    records_of(file) overrides how a file's records are read (default chunk_records.iter_records).
+    """
+    records_of = records_of or chunk_records.iter_records
+    for collection_name, col_files in collection_files.items():
+        with metrics.span("lexical_build"):
+            path = lexical_index.build(collection_name, (r for f in col_files for r in records_of(f)),
+                                       lexical_index.LEXICAL_DIR)
+        print(f"🔤 BM25 index → {path}")
+
+
+def insert_into_qdart(recreate: bool = False,
+                      batch_size: int = EMBED_BATCH_SIZE,
+                      workers: int = EMBED_WORKERS) -> None:
     """
     Goes into every JSONL file under CLEANED_ROOT:
     - determines collection name: subject_grade_term
-    - creates/recreates the collection
-    - builds points with stable id (source-page-chunk_id)
-    - upserts all points into the collection
+    - creates/recreates the collection (each collection at most once per run); with
+      COLLECTION_LAYOUT=single all files go to SINGLE_COLLECTION instead, with payload
+      indexes on subject/grade/term (see collection_layout.py)
+    - incrementally syncs the file against the collection's manifest (see _sync_file):
+      only new/changed chunks are embedded, removed chunks are deleted
+    - deletes the points of JSONL files that were removed since the last run
+    - embedding runs in batches of `batch_size` (across `workers` processes if > 1),
+      upserts are streamed in bounded chunks (see index_records)
+    - points have a stable id (source-page-chunk_id)
+    - prints a throughput report (chunks/sec, batch latency) per file and overall
+    - rebuilds each collection's BM25 index (lexical_index) from all of its files
     """
     root = Path(CLEANED_ROOT)
     files = list(root.rglob("*.jsonl"))
@@ -66,45 +405,45 @@ def insert_into_qdart(recreate: bool = False) -> None:
         print(f"❌ No JSONL files found under: {root}")
         return
 
-    for jsonl_file in files:
-        # subject/grade/term from path: .../Cleaned/<subject>/<grade>/<term>/<file.jsonl>
-        try:
-            subject = jsonl_file.parts[-4]
-            grade   = jsonl_file.parts[-3]
-            term    = jsonl_file.parts[-2]
-        except Exception:
-            subject, grade, term = "general", "na", "na"
-
-        collection_name = f"{subject}_{grade}_{term}"
-        _safe_create_collection(collection_name, recreate=recreate)
-
-        points: List[PointStruct] = []
-
-        with open(jsonl_file, "r", encoding="utf-8") as f:
-            for i, line in enumerate(f):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                except Exception:
-                    continue
-
-                text = (obj.get("text") or "").strip()
-                md   = (obj.get("metadata") or {})
-                if not (text and md):
-                    continue
-                vector = EMBED_MODEL.get_text_embedding(text)
-                # Add text to payload for reference
-                md["text"] = text
-                # Stable ID based on source|page|chunk_id
-                raw_id = f"{md.get('source','src')}|{md.get('page', i)}|{md.get('chunk_id', i)}"
-                point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, raw_id))
-                points.append(PointStruct(id=point_id, vector=vector, payload=md))
-
-        if points:
-            QDRANT_CLIENT.upsert(collection_name=collection_name, points=points)
-            print(f"✅ Upsert {len(points)} point(s) → {collection_name}  (from {jsonl_file.name})")
+    pool = _make_embed_pool(workers)
+    total_stats = EmbedStats()
+    manifests = {}
+    collection_files = {}  # collection -> [jsonl files], for the BM25 rebuild
+    _init_layout(recreate)
+    try:
+        for jsonl_file in files:
+            # subject/grade/term from path: .../Cleaned/<subject>/<grade>/<term>/<file.jsonl>
+            try:
+                subject = jsonl_file.parts[-4]
+                grade   = jsonl_file.parts[-3]
+                term    = jsonl_file.parts[-2]
+            except Exception:
+                subject, grade, term = "general", "na", "na"
+
+            col = _open_collection(subject, grade, term, manifests, recreate)
+            manifest = manifests[col["name"]]
+            collection_files.setdefault(col["name"], []).append(jsonl_file)
+
+            file_stats = EmbedStats()
+            upserted, unchanged, deleted = _sync_file(jsonl_file, col["target"], manifest,
+                                                      pool, file_stats, batch_size, col["scope"],
+                                                      workers=workers)
+            index_manifest.save_manifest(col["manifest_name"], manifest)
+
+            total_stats.chunks += file_stats.chunks
+            total_stats.batch_seconds.extend(file_stats.batch_seconds)
+
+            print(f"✅ {col['label']} ← {jsonl_file.name}: upserted {upserted}, "
+                  f"unchanged {unchanged}, deleted {deleted}")
+            if upserted:
+                print("   " + file_stats.report(jsonl_file.name))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    print("\n" + total_stats.report("Embedding total"))
+    _prune_removed_files(manifests, collection_files)
+    _rebuild_lexical(collection_files)
 
     # Clooections Names
     print("\n📚 Collections:")
@@ -114,6 +453,7 @@ def insert_into_qdart(recreate: bool = False) -> None:
 
 
 if __name__ == "__main__":
+    metrics.setup()
     # If collection exists, it will be recreated (all data lost)
     insert_into_qdart(recreate=False)
 
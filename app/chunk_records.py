@@ -0,0 +1,45 @@
+# chunk_records.py
+"""
+Cleaned JSONL ({"text", "metadata"} per line) → the (point_id, text, payload) records
+that get indexed. build_index.py, pipeline.py and serve.py's in-memory seed all read
+chunks through here, so point ids and payloads are the same everywhere. Stdlib only.
+"""
+import json
+import uuid
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+
+def parse_record(obj: dict, i: int) -> Optional[Tuple[str, str, dict]]:
+    """
+    (point_id, text, payload) of one extracted record ({"text", "metadata"}), or None
+    when text/metadata are missing. `i` (the line number) stands in for a missing page/chunk_id.
+    """
+    text = (obj.get("text") or "").strip()
+    md   = (obj.get("metadata") or {})
+    if not (text and md):
+        return None
+    # Add text to payload for reference
+    md["text"] = text
+    # Stable ID based on source|page|chunk_id
+    raw_id = f"{md.get('source','src')}|{md.get('page', i)}|{md.get('chunk_id', i)}"
+    point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, raw_id))
+    return point_id, text, md
+
+
+def iter_records(jsonl_file: Path) -> Iterator[Tuple[str, str, dict]]:
+    """
+    Reads a cleaned JSONL file line by line and yields (point_id, text, payload).
+    Lines that are empty, invalid JSON, or missing text/metadata are skipped.
+    """
+    with open(jsonl_file, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = parse_record(json.loads(line), i)
+            except Exception:
+                continue
+            if record is not None:
+                yield record
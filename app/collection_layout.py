@@ -0,0 +1,94 @@
+# collection_layout.py
+"""
+How the chunks are laid out in Qdrant (COLLECTION_LAYOUT):
+
+  per_collection  one collection per <subject>_<grade>_<term> (default). A session
+                  lists all collections and keeps those ending in _g<grade>_t<term>;
+                  every question queries each of them.
+  single          every chunk in SINGLE_COLLECTION, with keyword payload indexes on
+                  subject / grade / term. A session asks for the subjects of its
+                  grade/term (one facet request), and every question is a single
+                  filtered HNSW query grouped by subject, so the hits are still the
+                  top k of each <subject>_<grade>_<term>.
+
+Point ids are the same in both layouts and hits keep the <subject>_<grade>_<term>
+name as their "collection", so BM25 indexes, citations and caches are unchanged.
+Switch with `python app/migrate_collections.py` (no re-embedding).
+"""
+import math
+import os
+
+import vector_profiles
+
+COLLECTION_LAYOUT = os.getenv("COLLECTION_LAYOUT", "per_collection")  # per_collection | single
+SINGLE_COLLECTION = os.getenv("SINGLE_COLLECTION", "curriculum")
+PAYLOAD_INDEX_FIELDS = ("subject", "grade", "term")
+
+
+def is_single(client=None) -> bool:
+    """True when `client` is searched through the single collection (local stores never are)."""
+    from local_index import LocalIndexClient
+    return COLLECTION_LAYOUT == "single" and not isinstance(client, LocalIndexClient)
+
+
+def collection_name(subject: str, grade: str, term: str) -> str:
+    return f"{subject}_{grade}_{term}"
+
+
+def split_collection_name(name: str):
+    """(subject, grade, term); subjects may contain underscores (social_studies_g4_t1)."""
+    subject, grade, term = name.rsplit("_", 2)
+    return subject, grade, term
+
+
+def scope_filter(grade: str, term: str, subjects=None):
+    """Qdrant filter on the indexed grade / term (and subject) payload fields."""
+    from qdrant_client import models
+    must = [models.FieldCondition(key="grade", match=models.MatchValue(value=grade)),
+            models.FieldCondition(key="term", match=models.MatchValue(value=term))]
+    if subjects:
+        must.append(models.FieldCondition(key="subject", match=models.MatchAny(any=list(subjects))))
+    return models.Filter(must=must)
+
+
+def ensure_payload_indexes(client, name: str = SINGLE_COLLECTION) -> None:
+    """Keyword indexes on subject / grade / term (no-op for fields already indexed)."""
+    from qdrant_client import models
+    existing = client.get_collection(name).payload_schema or {}
+    for field in PAYLOAD_INDEX_FIELDS:
+        if field not in existing:
+            client.create_payload_index(name, field, models.PayloadSchemaType.KEYWORD, wait=True)
+
+
+def matching_collections(client, grade: int, term: int, name: str = SINGLE_COLLECTION) -> list:
+    """<subject>_g<grade>_t<term> names that have chunks in the single collection."""
+    grade_key, term_key = f"g{grade}", f"t{term}"
+    res = client.facet(name, "subject", facet_filter=scope_filter(grade_key, term_key), limit=1000)
+    return sorted(collection_name(h.value, grade_key, term_key) for h in res.hits)
+
+
+def query_grouped(client, collections, qvec, limit: int, timeout_s: float, name: str = SINGLE_COLLECTION):
+    """
+    Top `limit` points of each of `collections` from one filtered query.
+    Returns [(collection, point)] in collection order.
+    """
+    scopes = {}
+    for col in collections:
+        subject, grade, term = split_collection_name(col)
+        scopes.setdefault((grade, term), []).append(subject)
+    out = []
+    for (grade, term), subjects in scopes.items():  # one request per grade/term (normally one)
+        res = client.query_points_groups(
+            collection_name=name,
+            query=qvec,
+            query_filter=scope_filter(grade, term, subjects),
+            group_by="subject",
+            limit=len(subjects),
+            group_size=limit,
+            with_payload=True,
+            search_params=vector_profiles.collection_search_params(client, name),
+            timeout=max(1, math.ceil(timeout_s)),
+        )
+        groups = {g.id: g.hits for g in res.groups}
+        out.extend((collection_name(s, grade, term), p) for s in subjects for p in groups.get(s, []))
+    return out
@@ -0,0 +1,95 @@
+# context_packer.py
+"""
+Packs retrieved snippets into the LLM context under a token budget.
+
+Walking the hits in ranking order:
+- a snippet whose word 3-gram shingles are mostly (≥ CONTEXT_DEDUP_THRESHOLD)
+  contained in an already kept snippet is dropped as a near-duplicate (the same
+  passage from another collection, or chunk overlap from chunking.py). With at most
+  RERANK_CANDIDATES snippets the exact shingle sets are cheap, so no MinHash sketch
+  is needed;
+- a snippet is kept when it fits the rest of CONTEXT_TOKEN_BUDGET (header included).
+  The first one that does not fit is trimmed at a sentence/word boundary when at
+  least MIN_SNIPPET_TOKENS of it would remain; every other snippet that does not fit
+  is skipped, but smaller later ones that still fit are kept.
+Kept snippets are numbered 1..n in order, so the [i] citations in the answer match
+the sources printed by ask.print_sources.
+
+Token counts are estimates for the Groq (Llama) tokenizer: ~CHARS_PER_TOKEN
+characters per token for mixed Arabic/English text.
+"""
+import math
+import os
+import re
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+MIN_SNIPPET_TOKENS = 48
+CHARS_PER_TOKEN = 3.0
+
+_SENTENCE_END = re.compile(r"[.!?؟\n]\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = text.split()
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    """Longest prefix within max_tokens, cut after a sentence end (else a space), plus " …"."""
+    limit = int((max_tokens - 1) * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    head = text[:limit]
+    ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    cut = ends[-1] if ends and ends[-1] > limit // 2 else (head.rfind(" ") if " " in head else limit)
+    return head[:cut].rstrip() + " …"
+
+
+def pack(hits, format_header, budget: int = CONTEXT_TOKEN_BUDGET,
+         threshold: float = CONTEXT_DEDUP_THRESHOLD):
+    """
+    hits: ranked hit dicts (with "text"); format_header(i, hit) → citation header line.
+    Returns (blocks, kept_hits, stats); blocks[i-1] is "header\\nsnippet" for kept_hits[i-1].
+    """
+    blocks, kept, kept_shingles = [], [], []
+    stats = {"snippets": len(hits), "kept": 0, "duplicates": 0, "trimmed": 0, "over_budget": 0,
+             "tokens_before": 0, "tokens_after": 0}
+    used = 0
+    for n, h in enumerate(hits, 1):
+        snippet = (h["text"] or "").strip()
+        stats["tokens_before"] += estimate_tokens(f"{format_header(n, h)}\n{snippet}") + 1
+
+        shingles = _shingles(snippet)
+        if shingles and any(len(shingles & prev) / len(shingles) >= threshold for prev in kept_shingles):
+            stats["duplicates"] += 1
+            continue
+
+        header = format_header(len(kept) + 1, h)
+        cost = estimate_tokens(f"{header}\n{snippet}") + 1  # + separator
+        if used + cost > budget:
+            room = budget - used - estimate_tokens(header) - 2
+            if room < MIN_SNIPPET_TOKENS or stats["trimmed"]:
+                stats["over_budget"] += 1
+                continue
+            snippet = _trim(snippet, room)
+            if estimate_tokens(snippet) < MIN_SNIPPET_TOKENS:  # cut back to almost nothing
+                stats["over_budget"] += 1
+                continue
+            cost = estimate_tokens(f"{header}\n{snippet}") + 1
+            stats["trimmed"] += 1
+        blocks.append(f"{header}\n{snippet}")
+        kept.append(h)
+        kept_shingles.append(shingles)
+        used += cost
+
+    stats["kept"] = len(kept)
+    stats["tokens_after"] = used
+    stats["tokens_saved"] = stats["tokens_before"] - used
+    return blocks, kept, stats
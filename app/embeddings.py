@@ -0,0 +1,224 @@
+# embeddings.py
+"""
+Embedding backends for intfloat/multilingual-e5-small (384-dim), picked by EMBED_BACKEND:
+
+  hf    llama_index HuggingFaceEmbedding on PyTorch (the original setup)
+  onnx  the same model exported to ONNX and int8 dynamically quantized, run with
+        onnxruntime + tokenizers only (no torch/transformers import at query time)
+
+Both produce normalized mean-pooled vectors with E5's "query: " / "passage: "
+prefixes, exactly like HuggingFaceEmbedding does for this model, so the ONNX
+vectors can be searched against collections built with the hf backend (and vice
+versa). `python app/embeddings.py export` writes the ONNX model once (needs
+optimum + torch) and checks the cosine similarity of both backends on sample texts.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+EMBED_MODEL_NAME = "intfloat/multilingual-e5-small"
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "hf")  # hf | onnx
+ONNX_EMBED_DIR = Path(os.getenv("ONNX_EMBED_DIR", str(ROOT / ".cache" / "onnx" / "multilingual-e5-small")))
+ONNX_EMBED_FILE = os.getenv("ONNX_EMBED_FILE", "model_int8.onnx")  # or model.onnx (unquantized)
+EMBED_ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))     # 0 = onnxruntime default
+EMBED_MAX_LENGTH = 512
+MIN_COSINE = 0.99  # export check: ONNX vs PyTorch vectors of the same text
+
+QUERY_PREFIX = "query: "
+PASSAGE_PREFIX = "passage: "
+
+SAMPLE_TEXTS = [
+    "ما هو ناتج 12 × 4؟",
+    "الكسور العشرية هي أعداد تحتوي على فاصلة عشرية مثل 3.5 و 0.25",
+    "المستطيل شكل رباعي فيه كل زاويتين متجاورتين قائمتان",
+    "What is a fraction?",
+    "قارن بين العددين ٤٥٦ و ٤٦٥ باستخدام الرموز < أو >",
+]
+
+
+class OnnxEmbedding:
+    """
+    onnxruntime version of HuggingFaceEmbedding for E5: same method names
+    (get_query_embedding / get_text_embedding / get_text_embedding_batch), same
+    vectors up to quantization error. The session is created on first use.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_EMBED_DIR, file_name: str = ONNX_EMBED_FILE,
+                 embed_batch_size: int = 32, num_threads: int = EMBED_ONNX_THREADS):
+        self.model_dir = Path(model_dir)
+        self.file_name = file_name
+        self.embed_batch_size = embed_batch_size
+        self.num_threads = num_threads
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._pad_id = 0
+        self._lock = threading.Lock()
+        if not (self.model_dir / file_name).exists():
+            raise FileNotFoundError(f"{self.model_dir / file_name} missing; run `python app/embeddings.py export`")
+
+    def set_num_threads(self, num_threads: int) -> None:
+        """Threads for the session (only before first use; build_index workers call this)."""
+        self.num_threads = num_threads
+
+    def _load(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            opts.intra_op_num_threads = self.num_threads
+        session = ort.InferenceSession(str(self.model_dir / self.file_name), opts,
+                                       providers=["CPUExecutionProvider"])
+        tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=EMBED_MAX_LENGTH)
+        tokenizer.no_padding()
+        self._input_names = tuple(i.name for i in session.get_inputs())
+        pad_id = tokenizer.token_to_id("<pad>")
+        self._pad_id = 0 if pad_id is None else pad_id
+        self._tokenizer, self._session = tokenizer, session
+
+    def _embed(self, texts):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._load()
+        encodings = self._tokenizer.encode_batch(list(texts))
+        width = max(len(e.ids) for e in encodings)
+        ids = np.full((len(encodings), width), self._pad_id, dtype=np.int64)
+        mask = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, e in enumerate(encodings):
+            ids[row, :len(e.ids)] = e.ids
+            mask[row, :len(e.ids)] = 1
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self._session.run(None, feeds)[0]  # (batch, tokens, 384)
+
+        # mean pooling over real tokens, then L2-normalize (as HuggingFaceEmbedding(normalize=True))
+        pooled = (hidden * mask[:, :, None]).sum(axis=1) / mask.sum(axis=1, keepdims=True)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def _embed_many(self, texts):
+        # Similar lengths in the same batch → less padding per forward pass
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = [None] * len(texts)
+        for start in range(0, len(order), self.embed_batch_size):
+            chunk = order[start:start + self.embed_batch_size]
+            for i, vec in zip(chunk, self._embed([texts[i] for i in chunk])):
+                out[i] = vec.tolist()
+        return out
+
+    def get_query_embedding(self, query: str):
+        return self._embed([QUERY_PREFIX + query])[0].tolist()
+
+    def get_query_embedding_batch(self, queries):
+        return self._embed_many([QUERY_PREFIX + q for q in queries])
+
+    def get_text_embedding(self, text: str):
+        return self._embed([PASSAGE_PREFIX + text])[0].tolist()
+
+    def get_text_embedding_batch(self, texts, **_ignored):
+        return self._embed_many([PASSAGE_PREFIX + t for t in texts])
+
+
+def load_embed_model(backend: str = EMBED_BACKEND, embed_batch_size: int = 32):
+    """Embedding model for the configured backend (see module docstring)."""
+    if backend == "onnx":
+        return OnnxEmbedding(embed_batch_size=embed_batch_size)
+    if backend != "hf":
+        raise ValueError(f"Unknown EMBED_BACKEND: {backend}")
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, normalize=True,
+                                embed_batch_size=embed_batch_size)
+
+
+def _hf_query_embedding_batch(embed, queries) -> list:
+    """
+    HuggingFaceEmbedding has no batched query call: format every question the way its
+    get_query_embedding does ("query: " for e5) and run them through the model's
+    batched _embed, embed_batch_size at a time.
+    """
+    from llama_index.embeddings.huggingface.utils import format_query
+    texts = [format_query(q, embed.model_name, embed.query_instruction) for q in queries]
+    size = max(1, embed.embed_batch_size)
+    vectors = []
+    for start in range(0, len(texts), size):
+        vectors.extend(embed._embed(texts[start:start + size]))
+    return vectors
+
+
+def embed_queries(embed, queries) -> list:
+    """
+    Query vectors for many questions in batched forward passes: get_query_embedding_batch
+    (onnx, QueryEmbeddingCache) or HuggingFaceEmbedding's batched _embed (hf); one
+    get_query_embedding call each only for other models.
+    """
+    queries = list(queries)
+    if hasattr(embed, "get_query_embedding_batch"):
+        return embed.get_query_embedding_batch(queries)
+    if hasattr(embed, "_embed") and hasattr(embed, "query_instruction"):
+        try:
+            return _hf_query_embedding_batch(embed, queries)
+        except ImportError:
+            pass
+    return [embed.get_query_embedding(q) for q in queries]
+
+
+def export_onnx(out_dir: Path = ONNX_EMBED_DIR, quantize: bool = True) -> Path:
+    """
+    Exports EMBED_MODEL_NAME to out_dir/model.onnx (+ tokenizer.json) and, with
+    `quantize`, writes out_dir/model_int8.onnx (dynamic int8 weights, for AVX2/VNNI CPUs).
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoTokenizer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ORTModelForFeatureExtraction.from_pretrained(EMBED_MODEL_NAME, export=True).save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(EMBED_MODEL_NAME).save_pretrained(out_dir)
+    if quantize:
+        quantize_dynamic(str(out_dir / "model.onnx"), str(out_dir / "model_int8.onnx"),
+                         weight_type=QuantType.QInt8, per_channel=True)
+    return out_dir
+
+
+def compare_backends(reference, candidate, texts=SAMPLE_TEXTS) -> dict:
+    """Cosine similarity of two backends on the same texts (queries and passages)."""
+    sims = []
+    for t in texts:
+        for fn in ("get_query_embedding", "get_text_embedding"):
+            a = np.asarray(getattr(reference, fn)(t), dtype=np.float32)
+            b = np.asarray(getattr(candidate, fn)(t), dtype=np.float32)
+            sims.append(float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b))))
+    return {"min_cosine": round(min(sims), 5), "mean_cosine": round(float(np.mean(sims)), 5)}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="ONNX export of the E5 embedding model")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--out", type=Path, default=ONNX_EMBED_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    out = export_onnx(args.out, quantize=not args.no_quantize)
+    print(f"✅ Exported {EMBED_MODEL_NAME} → {out} ({time.perf_counter() - start:.1f}s)")
+
+    reference = load_embed_model("hf")
+    for file_name in ("model.onnx",) + (() if args.no_quantize else ("model_int8.onnx",)):
+        result = compare_backends(reference, OnnxEmbedding(out, file_name))
+        ok = "✅" if result["min_cosine"] >= MIN_COSINE else "⚠️"
+        print(f"{ok} {file_name}: cosine vs PyTorch min {result['min_cosine']} / mean {result['mean_cosine']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 import json
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import fitz
@@ -9,125 +10,183 @@ import pytesseract
 from PIL import Image
 import io
 
+import metrics
+from chunking import chunk_stats, iter_chunks
+from page_cache import PageCache, file_fingerprint
+from text_cleaning import clean_text, count_math_symbols
 
-def detect_math_symbols(text):
-    """Detect mathematical symbols and equations in text"""
-    math_patterns = [
-        r'[+\-×÷*/=<>≤≥≠±√∑∏∫]',  # Basic math symbols
-        r'\d+[/]\d+',  # Fractions like 1/2
-        r'\d+\^\d+',  # Powers like 2^3
-        r'[xy]\s*[=]',  # Variables with equals
-        r'\([^)]*[+\-*/][^)]*\)',  # Expressions in parentheses
-        r'\b(sin|cos|tan|log|ln)\b',  # Mathematical functions
-        r'\d+\s*[°]',  # Degrees
-        r'[αβγδθπλμσφψω]',  # Greek letters
-    ]
+OCR_DPI = 200
+OCR_LANG = 'ara'
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0"))    # 0/1 = single process
+EXTRACT_PARALLEL = os.getenv("EXTRACT_PARALLEL", "pages")  # "pages" (within a PDF) or "books" (whole PDFs)
+PAGE_CACHE = os.getenv("PAGE_CACHE", "1") == "1"           # reuse raw page text/OCR across runs
+CHUNKER = os.getenv("CHUNKER", "tokens")                   # "tokens" (chunking.py) or "legacy" (create_chunks)
+EXTRACT_FORMAT = os.getenv("EXTRACT_FORMAT", "jsonl")      # "jsonl" (Cleaned/, read by build_index) or "json" (array)
+# Input root EXACTLY as requested earlier
+BOOKS_ROOT = Path(r"/home/mohamed/DEPI_Project/Data/Books/arabic/g5/t1")
 
-    math_content = []
-    for pattern in math_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        if matches:
-            math_content.extend(matches)
 
-    return math_content
+def _page_settings():
+    """Everything besides the PDF bytes that changes a page's raw extraction result."""
+    return f"dpi={OCR_DPI};lang={OCR_LANG}"
 
 
-def extract_text_from_pdf(pdf_path: Path):
+def _extract_page(doc, i, is_math_book, cache=None, file_hash=None):
     """
-    Extract text from PDF using PyMuPDF with OCR fallback.
-    Returns (pages_text_list, total_pages).
+    Extract one page (native text, OCR fallback, math/diagram markers).
+    With a cache, raw text and detection counts are reused when the same PDF page was
+    already extracted with the same settings, skipping rendering/OCR entirely.
+    Returns (page_text, method, seconds); page_text is "" on failure so callers keep alignment.
     """
-    print(f"Processing: {pdf_path}")
-    filename = pdf_path.name.lower()
-    is_math_book = 'math' in filename
-
-    doc = fitz.open(str(pdf_path))
-    total_pages = len(doc)
-    pages_text = []
-    total_math_elements = []
-
-    for i in range(total_pages):
-        page = doc.load_page(i)
-        try:
+    start = time.perf_counter()
+    try:
+        entry = cache.get(file_hash, i, _page_settings()) if cache is not None else None
+        if entry is not None:
+            method = "cached"
+            page_text = entry["text"]
+            math_count, drawings = entry["math_count"], entry["drawings"]
+        else:
+            method = "text"
+            math_count = drawings = None
             # Try regular text extraction first
-            page_text = page.get_text()
+            page_text = doc.load_page(i).get_text()
 
             # If empty, OCR the rendered image
             if not page_text.strip():
+                method = "ocr"
                 try:
-                    mat = fitz.Matrix(200/72, 200/72)  # 200 DPI
-                    pix = page.get_pixmap(matrix=mat)
+                    mat = fitz.Matrix(OCR_DPI/72, OCR_DPI/72)
+                    pix = doc.load_page(i).get_pixmap(matrix=mat)
                     img_data = pix.tobytes("png")
                     img = Image.open(io.BytesIO(img_data))
-                    page_text = pytesseract.image_to_string(img, lang='ara')
+                    page_text = pytesseract.image_to_string(img, lang=OCR_LANG)
                 except Exception as ocr_e:
                     print(f"⚠️ Page {i+1} empty or failed OCR")
-                    pages_text.append("")  # keep alignment
-                    continue
-
-            # Math markers (preserved behavior)
-            if is_math_book:
-                math_elements = detect_math_symbols(page_text)
-                if math_elements:
-                    page_text = f"[MATH_DETECTED: {len(math_elements)} elements]\n" + page_text
-                    total_math_elements.extend(math_elements)
-                drawings = page.get_drawings()
-                if drawings:
-                    page_text += f"\n[DIAGRAM_DETECTED: {len(drawings)} geometric elements]\n"
-
-            pages_text.append(page_text)
-            print(f"✅ Page {i+1}/{total_pages} saved")
-        except Exception as e:
-            print(f"❌ Error on page {i+1}: {e}")
-            pages_text.append("")  # keep alignment
-
-    doc.close()
-    return pages_text, total_pages
-
-
-# Text cleaning module
-import re
+                    return "", "failed", time.perf_counter() - start
+        raw_text = page_text
+
+        # Math markers (preserved behavior)
+        detected = False
+        if is_math_book:
+            if math_count is None:
+                math_count = count_math_symbols(raw_text)
+                detected = True
+            if drawings is None:
+                drawings = len(doc.load_page(i).get_drawings())
+                detected = True
+            if math_count:
+                page_text = f"[MATH_DETECTED: {math_count} elements]\n" + page_text
+            if drawings:
+                page_text += f"\n[DIAGRAM_DETECTED: {drawings} geometric elements]\n"
+
+        if cache is not None and (entry is None or detected):
+            cache.put(file_hash, i, _page_settings(), raw_text,
+                      entry["method"] if entry else method, math_count, drawings)
 
-def clean_text(text):
-    """Simple text cleaning for Arabic content with math preservation"""
-    # Preserve mathematical notations first
-    math_markers = []
-    math_pattern = r'\[MATH_DETECTED:.*?\]|\[DIAGRAM_DETECTED:.*?\]|\[MATH_BOOK_SUMMARY:.*?\]'
-    for match in re.finditer(math_pattern, text):
-        placeholder = f"__MATH_MARKER_{len(math_markers)}__"
-        math_markers.append(match.group())
-        text = text.replace(match.group(), placeholder)
+        return page_text, method, time.perf_counter() - start
+    except Exception as e:
+        print(f"❌ Error on page {i+1}: {e}")
+        return "", "failed", time.perf_counter() - start
 
-    # Normalize Arabic digits
-    text = text.translate(str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789"))
 
-    # Preserve mathematical symbols while cleaning
-    math_symbols = r'[+\-×÷*/=<>≤≥≠±√∑∏∫°αβγδθπλμσφψω\^\(\)\[\]]'
+def _init_extract_worker():
+    # One tesseract thread per worker process; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
 
-    # Remove extra spaces and empty lines but preserve math content
-    lines = []
-    for line in text.split('\n'):
-        line = line.strip()
-        # Keep lines with math markers, math symbols, or meaningful content
-        if (line and
-            (len(line) > 2 or
-             '__MATH_MARKER_' in line or
-             re.search(math_symbols, line) or
-             re.search(r'\d+[/\^]\d+', line))):
-            lines.append(line)
 
-    cleaned_text = '\n'.join(lines)
+def _open_page_cache(file_hash):
+    return PageCache() if file_hash else None
 
-    # Restore math markers
-    for i, marker in enumerate(math_markers):
-        placeholder = f"__MATH_MARKER_{i}__"
-        cleaned_text = cleaned_text.replace(placeholder, marker)
 
-    return cleaned_text
+def _extract_page_range(pdf_path, start, stop, is_math_book, file_hash=None):
+    """Worker task: open the PDF (and page cache) in this process and extract pages [start, stop)."""
+    doc = fitz.open(str(pdf_path))
+    cache = _open_page_cache(file_hash)
+    try:
+        return [_extract_page(doc, i, is_math_book, cache, file_hash) for i in range(start, stop)]
+    finally:
+        if cache is not None:
+            cache.close()
+        doc.close()
+
+
+def _print_timing_summary(timings):
+    """timings: list of (page_no, method, seconds)."""
+    if not timings:
+        return
+    for method in ("cached", "text", "ocr", "failed"):
+        secs = [t for _, m, t in timings if m == method]
+        if secs:
+            print(f"  ⏱️ {method}: {len(secs)} page(s), avg {sum(secs)/len(secs):.2f}s, max {max(secs):.2f}s")
+    slowest = sorted(timings, key=lambda x: x[2], reverse=True)[:3]
+    print("  🐢 Slowest pages: " + ", ".join(f"{p} ({m}, {t:.2f}s)" for p, m, t in slowest))
+
+
+def iter_pdf_pages(pdf_path: Path, workers: int = 0):
+    """
+    Extract text from PDF using PyMuPDF with OCR fallback, yielding
+    (page_no, page_text, method, seconds) in page order as pages finish.
+    With workers > 1, contiguous page ranges are extracted in a process pool;
+    a range is yielded as soon as it and all ranges before it are done.
+    With PAGE_CACHE on, pages already extracted from the same PDF bytes are read from
+    the on-disk page cache instead of being re-rendered/OCR'd.
+    page_text is "" for failed pages, so page numbers stay aligned.
+    """
+    print(f"Processing: {pdf_path}")
+    filename = pdf_path.name.lower()
+    is_math_book = 'math' in filename
+    file_hash = file_fingerprint(pdf_path) if PAGE_CACHE else None
+
+    doc = fitz.open(str(pdf_path))
+    total_pages = len(doc)
+
+    timings = []
+
+    def _report(start, results):
+        for i, (page_text, method, seconds) in enumerate(results, start + 1):
+            timings.append((i, method, seconds))
+            metrics.observe("extract_page_seconds", seconds, method=method)  # timed where it ran
+            if method != "failed":
+                print(f"✅ Page {i}/{total_pages} saved ({method}, {seconds:.2f}s)")
+            yield i, page_text, method, seconds
+
+    if workers > 1 and total_pages > 1:
+        doc.close()
+        # ~4 ranges per worker: small enough to balance OCR-heavy stretches
+        step = max(1, -(-total_pages // (workers * 4)))
+        ranges = [(s, min(s + step, total_pages)) for s in range(0, total_pages, step)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_extract_worker) as pool:
+            futures = [(a, pool.submit(_extract_page_range, pdf_path, a, b, is_math_book, file_hash))
+                       for a, b in ranges]
+            for a, fut in futures:
+                yield from _report(a, fut.result())
+    else:
+        # one page at a time, so a consumer sees each page as soon as it is extracted
+        cache = _open_page_cache(file_hash)
+        try:
+            for i in range(total_pages):
+                with metrics.profiled("extract_page"):
+                    page = _extract_page(doc, i, is_math_book, cache, file_hash)
+                yield from _report(i, [page])
+        finally:
+            if cache is not None:
+                cache.close()
+            doc.close()
+
+    _print_timing_summary(timings)
+
+
+def extract_text_from_pdf(pdf_path: Path, workers: int = 0):
+    """
+    All pages of iter_pdf_pages at once.
+    Returns (pages_text_list, total_pages).
+    """
+    pages_text = [page_text for _, page_text, _, _ in iter_pdf_pages(pdf_path, workers)]
+    return pages_text, len(pages_text)
 
 
 def create_chunks(text, chunk_size=500):
-    """Split text into chunks"""
+    """Split text into chunks (legacy per-page chunker, CHUNKER=legacy)"""
     sentences = re.split(r'[.!?؟]\s+', text)
     chunks = []
     current_chunk = ""
@@ -146,78 +205,146 @@ def create_chunks(text, chunk_size=500):
     return chunks
 
 
-def process_all_books():
+def book_output_path(pdf_path, fmt=EXTRACT_FORMAT, out_root=None) -> Path:
     """
-    تحديثات:
-    1) نحفظ بامتداد .json (وليس jsonl).
-    2) الآوتبوت = مسار ملف فقط (بدون مجلد باسم الكتاب).
-    3) اسم الملف: base_name مأخوذ من اسم الـ PDF + '.json'
-       ثم: Data/Extracted_Books/Basic/SUBJECT/GRADE/TERM/base_name.json
+    jsonl: Data/Extracted_Books/Cleaned/SUBJECT/GRADE/TERM/<pdf name>_cleaned.jsonl (build_index input)
+    json:  Data/Extracted_Books/SUBJECT/GRADE/TERM/<pdf name>_cleaned.json
     """
-    # Input root EXACTLY as requested earlier
-    INPUT_ROOT = Path(r"/home/mohamed/DEPI_Project/Data/Books/arabic/g5/t1")
-
-    print("🚀 Starting Book Processing")
-    print("=" * 50)
-
-    for pdf_path in INPUT_ROOT.rglob("*.pdf"):
-        pdf_path = Path(pdf_path)
+    pdf_path = Path(pdf_path)
+    SUBJECT, GRADE, TERM = pdf_path.parts[-4].lower(), pdf_path.parts[-3], pdf_path.parts[-2]
+    if out_root is None:
+        out_root = Path("Data", "Extracted_Books", "Cleaned") if fmt == "jsonl" else Path("Data", "Extracted_Books")
+    return Path(out_root, SUBJECT, GRADE, TERM, f"{pdf_path.stem}_cleaned.{fmt}")
 
-        # Derive metadata from path
-        SUBJECT = pdf_path.parts[-4].lower()
-        GRADE = pdf_path.parts[-3]
-        TERM = pdf_path.parts[-2]
-        
-        # File name directly (no extra folder for the book)
-        base_name = os.path.splitext(os.path.basename(pdf_path))[0] + "_cleaned.json"  
-        output_path = os.path.join("Data", "Extracted_Books", SUBJECT, GRADE, TERM, base_name)
 
-        # Create ONLY the parent directories; not a folder named after the book
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+def iter_book_records(pdf_path, page_workers=0):
+    """
+    Extract, clean and chunk one PDF, yielding {"text", "metadata"} records while
+    the pages are still being extracted (chunks are emitted as soon as they close).
+    """
+    pdf_path = Path(pdf_path)
 
-        print(f"\n=== Book: {pdf_path.name} ===")
-        print(f"Subject: {SUBJECT} | Grade: {GRADE} | Term: {TERM}")
-        start_time = time.time()
+    # Derive metadata from path
+    SUBJECT = pdf_path.parts[-4].lower()
+    GRADE = pdf_path.parts[-3]
+    TERM = pdf_path.parts[-2]
 
-        try:
-            # Extract per page
-            pages_text, total_pages = extract_text_from_pdf(pdf_path)
-
-            # Collect chunks, then save as a single JSON array
-            all_records = []
-            for i, page_text in enumerate(pages_text):
-                if not page_text.strip():
-                    continue
+    def cleaned_pages():
+        for page, page_text, _, _ in iter_pdf_pages(pdf_path, workers=page_workers):
+            if not page_text.strip():
+                continue
+            with metrics.span("extract_clean"):
                 cleaned_text = clean_text(page_text)
-                if not cleaned_text.strip():
-                    continue
-                page_chunks = create_chunks(cleaned_text)
-                for idx, chunk in enumerate(page_chunks, 1):
-                    rec = {
-                        "text": chunk,
-                        "metadata": {
-                            "page": i + 1,
-                            "subject": SUBJECT,
-                            "grade": GRADE,
-                            "term": TERM,
-                            "source": pdf_path.name,
-                            "chunk_id": idx
-                        }
-                    }
-                    all_records.append(rec)
-
-            with open(output_path, "w", encoding="utf-8") as f:
+            if not cleaned_text.strip():
+                continue
+            yield page, cleaned_text
+
+    base_md = {"subject": SUBJECT, "grade": GRADE, "term": TERM, "source": pdf_path.name}
+    if CHUNKER == "tokens":
+        # Token-budget chunks over the whole book, may span pages (see chunking.py)
+        per_page = {}
+        for chunk in iter_chunks(cleaned_pages()):
+            idx = per_page[chunk["page_start"]] = per_page.get(chunk["page_start"], 0) + 1
+            yield {
+                "text": chunk["text"],
+                "metadata": {"page": chunk["page_start"], **base_md, "chunk_id": idx,
+                             "page_end": chunk["page_end"], "n_tokens": chunk["n_tokens"]},
+            }
+    else:
+        for page, cleaned_text in cleaned_pages():
+            for idx, chunk in enumerate(create_chunks(cleaned_text), 1):
+                yield {"text": chunk, "metadata": {"page": page, **base_md, "chunk_id": idx}}
+
+
+def process_book(pdf_path, page_workers=0, fmt=EXTRACT_FORMAT, out_root=None, on_record=None):
+    """
+    Extract, clean and chunk one PDF and save its records (see book_output_path):
+    - jsonl: one record per line, written as the pages finish; the file replaces the
+      previous one only once the book is complete
+    - json: a single JSON array (previous format)
+    on_record(record) is called for every record as it is produced (pipeline.py).
+    Returns the output path, or None when the book failed.
+    """
+    pdf_path = Path(pdf_path)
+    output_path = book_output_path(pdf_path, fmt, out_root)
+
+    # Create ONLY the parent directories; not a folder named after the book
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    print(f"\n=== Book: {pdf_path.name} ===")
+    print(f"Subject: {pdf_path.parts[-4].lower()} | Grade: {pdf_path.parts[-3]} | Term: {pdf_path.parts[-2]}")
+    start_time = time.time()
+
+    tmp_path = output_path.with_name(output_path.name + ".part")
+    try:
+        count, n_tokens, spanning, all_records = 0, [], 0, []
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in iter_book_records(pdf_path, page_workers):
+                count += 1
+                md = record["metadata"]
+                if "n_tokens" in md:
+                    n_tokens.append(md["n_tokens"])
+                    spanning += md["page_end"] != md["page"]
+                if fmt == "jsonl":
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                else:
+                    all_records.append(record)
+                if on_record is not None:
+                    on_record(record)
+            if fmt != "jsonl":
                 json.dump(all_records, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, output_path)
+        metrics.observe("extract_book_seconds", time.time() - start_time)
+        metrics.inc("extract_chunks_total", count)
+
+        process_time = (time.time() - start_time) / 60
+        print(f"  ✅ Saved {count} chunks → {output_path}")
+        if n_tokens:
+            stats = chunk_stats(n_tokens)
+            print(f"  🧩 {stats['tokens']} tokens, mean {stats['mean_tokens']} / max {stats['max_tokens']} "
+                  f"per chunk, {spanning} chunk(s) span pages")
+        print(f"  ⏱️ Done in {process_time:.2f} minutes")
+        return output_path
+
+    except Exception as e:
+        print(f"  ❌ Error processing {pdf_path.name}: {e}")
+        metrics.inc("extract_books_failed_total")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return None
+
+
+def _process_book_in_worker(pdf_path):
+    """process_book in a EXTRACT_PARALLEL=books worker: (result, the book's metrics for the parent)."""
+    metrics.reset()  # workers are reused: hand back this book's series only
+    return process_book(pdf_path), metrics.export()
+
+
+def process_all_books(workers=EXTRACT_WORKERS, parallel=EXTRACT_PARALLEL):
+    """
+    تحديثات:
+    1) نحفظ بامتداد .jsonl سطرًا بسطر أثناء الاستخراج (EXTRACT_FORMAT=json للمصفوفة القديمة).
+    2) الآوتبوت = مسار ملف فقط (بدون مجلد باسم الكتاب).
+    3) اسم الملف: base_name مأخوذ من اسم الـ PDF + '_cleaned.jsonl'
+       ثم: Data/Extracted_Books/Cleaned/SUBJECT/GRADE/TERM/base_name.jsonl (مدخل build_index)
+    4) workers > 1: parallel="pages" يوزّع صفحات كل كتاب على العمليات،
+       و parallel="books" يعالج عدة كتب في نفس الوقت (صفحات كل كتاب بالتسلسل).
+    """
+    print("🚀 Starting Book Processing")
+    print("=" * 50)
 
-            process_time = (time.time() - start_time) / 60
-            print(f"  ✅ Saved {len(all_records)} chunks → {output_path}")
-            print(f"  ⏱️ Done in {process_time:.2f} minutes")
-
-        except Exception as e:
-            print(f"  ❌ Error processing {pdf_path.name}: {e}")
+    pdf_paths = sorted(BOOKS_ROOT.rglob("*.pdf"))
+    if workers > 1 and parallel == "books":
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_extract_worker) as pool:
+            for _, book_metrics in pool.map(_process_book_in_worker, pdf_paths):
+                metrics.merge(book_metrics)
+    else:
+        for pdf_path in pdf_paths:
+            process_book(pdf_path, page_workers=workers)
 
 
 def main():
+    metrics.setup()
     process_all_books()
 
 
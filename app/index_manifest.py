@@ -0,0 +1,52 @@
+# index_manifest.py
+"""
+What build_index.py has already indexed: one JSON file per collection,
+MANIFEST_DIR/<collection>.json = {jsonl_file_name: {point_id: content_hash}}.
+build_index.py / pipeline.py skip records whose hash is unchanged and delete the
+points of records (and files) that are gone; migrate_collections.py renames the
+manifests along with the collections. Stdlib only, so those scripts can share it
+without loading the embedding model.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+MANIFEST_DIR = Path(os.getenv("MANIFEST_DIR", str(ROOT / "Indexes" / "manifests")))
+
+
+def content_hash(payload: dict) -> str:
+    """Hash of the payload (text + metadata); a change in either means re-embedding."""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def manifest_path(collection_name: str) -> Path:
+    return Path(MANIFEST_DIR) / f"{collection_name}.json"
+
+
+def load_manifest(collection_name: str) -> dict:
+    """
+    Returns {jsonl_file_name: {point_id: content_hash}} for a collection.
+    Missing or unreadable manifests count as empty (→ everything gets indexed).
+    """
+    path = manifest_path(collection_name)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        print(f"⚠️ Ignoring unreadable manifest: {path}")
+        return {}
+
+
+def save_manifest(collection_name: str, manifest: dict) -> None:
+    """Writes the manifest atomically so an interrupted run never leaves half a file."""
+    path = manifest_path(collection_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
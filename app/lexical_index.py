@@ -0,0 +1,164 @@
+# lexical_index.py
+"""
+BM25 inverted index over chunk text, one file per collection.
+
+Built by build_index.py from the same records it upserts to Qdrant (same point
+ids and payloads), and queried by ask.py next to the dense search; the two
+rankings are merged with reciprocal-rank fusion. This catches exact terms that
+dense vectors blur: numbers, units and keywords such as "ناتج" / "احسب".
+
+Storage (LEXICAL_DIR/<collection>.npz, uncompressed so loading is a few reads):
+  vocab            "\n"-joined sorted terms
+  term_offsets     int64[V + 1]   postings of term t are [off[t], off[t + 1])
+  post_docs        int32[P]       document row of each posting
+  post_tf          uint16[P]      term frequency of each posting
+  doc_len          int32[N]       tokens per document
+  ids              "\n"-joined point ids (row → point id)
+  payload_blob     uint8[...]     UTF-8 JSON payloads, concatenated
+  payload_offsets  int64[N + 1]
+"""
+import json
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+LEXICAL_DIR = Path(os.getenv("LEXICAL_DIR", str(ROOT / "Indexes" / "lexical")))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Same digit mapping as text_cleaning.clean_text (٫ is the Arabic decimal separator: ٣٫٥ → 3.5),
+# plus the usual Arabic spelling variants
+_NORMALIZE = str.maketrans({
+    **{a: d for a, d in zip("٠١٢٣٤٥٦٧٨٩", "0123456789")}, "٫": ".",
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي",
+})
+_DIACRITICS = re.compile(r"[\u064B-\u0652\u0640]")  # tashkeel + tatweel
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)?|[^\W\d_]+|[+\-×÷*/=<>%]")
+_ARTICLE = re.compile(r"^(?:وال|بال|فال|كال|ال|لل)(?=\w{2})")
+
+
+def tokenize(text: str) -> list:
+    """Normalized tokens: numbers, words (definite article stripped) and math operators."""
+    text = _DIACRITICS.sub("", (text or "").translate(_NORMALIZE).lower())
+    return [_ARTICLE.sub("", t) for t in _TOKEN.findall(text)]
+
+
+def build(collection_name: str, records, out_dir: Path = LEXICAL_DIR) -> Path:
+    """
+    Writes the BM25 index for one collection.
+    records: iterable of (point_id, text, payload), e.g. chunk_records.iter_records().
+    """
+    ids, payloads, doc_len = [], [], []
+    postings = {}  # term -> [(doc, tf), ...]
+    for doc, (point_id, text, payload) in enumerate(records):
+        counts = Counter(tokenize(text))
+        ids.append(str(point_id))
+        payloads.append(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc, min(tf, 65535)))
+
+    vocab = sorted(postings)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    post_docs, post_tf = [], []
+    for t, term in enumerate(vocab):
+        for doc, tf in postings[term]:
+            post_docs.append(doc)
+            post_tf.append(tf)
+        term_offsets[t + 1] = len(post_docs)
+    payload_offsets = np.zeros(len(payloads) + 1, dtype=np.int64)
+    payload_offsets[1:] = np.cumsum([len(p) for p in payloads])
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{collection_name}.npz"
+    tmp = out_dir / f"{collection_name}.tmp.npz"
+    np.savez(
+        tmp,
+        vocab=np.frombuffer("\n".join(vocab).encode("utf-8"), dtype=np.uint8),
+        term_offsets=term_offsets,
+        post_docs=np.asarray(post_docs, dtype=np.int32),
+        post_tf=np.asarray(post_tf, dtype=np.uint16),
+        doc_len=np.asarray(doc_len, dtype=np.int32),
+        ids=np.frombuffer("\n".join(ids).encode("utf-8"), dtype=np.uint8),
+        payload_blob=np.frombuffer(b"".join(payloads), dtype=np.uint8),
+        payload_offsets=payload_offsets,
+    )
+    os.replace(tmp, path)
+    return path
+
+
+class LexicalIndex:
+    """One collection's BM25 index, fully loaded (postings are small next to the vectors)."""
+
+    def __init__(self, path: Path):
+        with np.load(path) as z:
+            vocab = z["vocab"].tobytes().decode("utf-8")
+            self.terms = {t: i for i, t in enumerate(vocab.split("\n"))} if vocab else {}
+            self.term_offsets = z["term_offsets"]
+            self.post_docs = z["post_docs"]
+            self.post_tf = z["post_tf"].astype(np.float32)
+            self.doc_len = z["doc_len"].astype(np.float32)
+            raw_ids = z["ids"].tobytes().decode("utf-8")
+            self.ids = raw_ids.split("\n") if raw_ids else []
+            self._blob = z["payload_blob"]
+            self._payload_offsets = z["payload_offsets"]
+        n = len(self.doc_len)
+        self.avg_len = float(self.doc_len.mean()) if n else 0.0
+        df = np.diff(self.term_offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5))
+
+    def payload(self, row: int) -> dict:
+        start, end = int(self._payload_offsets[row]), int(self._payload_offsets[row + 1])
+        return json.loads(self._blob[start:end].tobytes().decode("utf-8"))
+
+    def search(self, query: str, limit: int):
+        """[(point_id, bm25 score, payload)] best first; empty when no query term is known."""
+        term_ids = {self.terms[t] for t in tokenize(query) if t in self.terms}
+        if not term_ids:
+            return []
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / (self.avg_len or 1.0))
+        for t in term_ids:
+            lo, hi = self.term_offsets[t], self.term_offsets[t + 1]
+            docs, tf = self.post_docs[lo:hi], self.post_tf[lo:hi]
+            scores[docs] += self.idf[t] * tf * (BM25_K1 + 1) / (tf + norm[docs])
+        k = min(limit, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[r], float(scores[r]), self.payload(int(r))) for r in top]
+
+
+_loaded = {}  # collection -> (mtime, LexicalIndex)
+_lock = threading.Lock()
+
+
+def load(collection_name: str, index_dir: Path = LEXICAL_DIR):
+    """Cached LexicalIndex for a collection (reloaded when the file changes), or None."""
+    path = Path(index_dir) / f"{collection_name}.npz"
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        cached = _loaded.get(collection_name)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, LexicalIndex(path))
+            _loaded[collection_name] = cached
+        return cached[1]
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> dict:
+    """rankings: lists of keys, best first → {key: Σ 1 / (k + rank)}."""
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load-test harness for serve.py.
+
+Fires `--requests` POST /ask calls from `--concurrency` keep-alive connections and
+reports throughput, error counts and p50/p95/p99 latency (client side, plus the
+server's own queue/retrieve/generate timings).
+
+    python app/loadtest.py --url http://127.0.0.1:8000 --grade 5 --term 1 \
+        --questions questions.txt --requests 200 --concurrency 16 --out loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+DEFAULT_QUESTIONS = [
+    "ما هو ناتج 12 × 4؟",
+    "ما هي الكسور العشرية؟",
+    "كيف نقارن بين عددين؟",
+    "What is a fraction?",
+]
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+async def _post(reader, writer, host: str, body: bytes):
+    writer.write((f"POST /ask HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+                  ).encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = line.decode("latin-1").partition(":")
+        if k.strip().lower() == "content-length":
+            length = int(v)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _client(host, port, jobs: asyncio.Queue, results: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                payload = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                status, data = await _post(reader, writer, host,
+                                           json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                results.append({"status": 0, "latency_ms": 1000 * (time.perf_counter() - start),
+                                "error": str(e)})
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            results.append({"status": status, "latency_ms": 1000 * (time.perf_counter() - start),
+                            "server_ms": data.get("timings_ms", {})})
+    finally:
+        writer.close()
+
+
+async def run(url: str, payloads, concurrency: int):
+    parsed = urlparse(url)
+    jobs: asyncio.Queue = asyncio.Queue()
+    for p in payloads:
+        jobs.put_nowait(p)
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(parsed.hostname, parsed.port or 80, jobs, results)
+                           for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall_s: float) -> dict:
+    ok = [r for r in results if r["status"] == 200]
+    lat = [r["latency_ms"] for r in ok]
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": {str(s): sum(1 for r in results if r["status"] == s)
+                   for s in sorted({r["status"] for r in results}) if s != 200},
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "latency_ms": {f"p{p}": round(percentile(lat, p), 1) for p in (50, 95, 99)},
+    }
+    for stage in ("queue", "retrieve", "generate"):
+        vals = [r["server_ms"][stage] for r in ok if stage in r["server_ms"]]
+        if vals:
+            summary[f"server_{stage}_ms"] = {f"p{p}": round(percentile(vals, p), 1) for p in (50, 95, 99)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for serve.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--grade", type=int, default=5)
+    parser.add_argument("--term", type=int, default=1)
+    parser.add_argument("--questions", help="text file, one question per line")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-generate", action="store_true", help="retrieval only")
+    parser.add_argument("--out", help="write the summary as JSON here")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [q.strip() for q in f if q.strip()]
+    payloads = [{"question": questions[i % len(questions)], "grade": args.grade,
+                 "term": args.term, "generate": not args.no_generate}
+                for i in range(args.requests)]
+
+    results, wall_s = asyncio.run(run(args.url, payloads, args.concurrency))
+    summary = summarize(results, wall_s)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# local_index.py
+"""
+Offline retrieval over the persisted LlamaIndex stores under Indexes/.
+
+Each store (Indexes/<subject>/<grade>/<term>/index_*/) holds a FAISS flat index in
+default__vector_store.json, the node texts/metadata in docstore.json and the
+FAISS-row → node-id map in index_store.json. On first use (or via `python app/local_index.py
+convert`) the store is converted to a compact binary sidecar next to it (see
+build_sidecar): vectors as float32/float16/int8 .npy and payloads as an
+offset-indexed blob. Loads memory-map the sidecar lazily instead of parsing JSON.
+
+LocalIndexClient mimics the subset of QdrantClient that ask.py uses
+(get_collections, query_points), so search_all works unchanged with
+RETRIEVAL_BACKEND=local. Collections are named <subject>_<grade>_<term>
+(e.g. maths_g5_t1), like the Qdrant ones.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+INDEXES_ROOT = Path(os.getenv("INDEXES_ROOT", str(ROOT / "Indexes")))
+LOCAL_SEARCH = os.getenv("LOCAL_SEARCH", "exact")  # "exact" (NumPy) or "hnsw" (FAISS, approximate)
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")  # sidecar storage: float32 | float16 | int8
+SIDECAR_DIR = "local"
+SIDECAR_VERSION = 2
+
+_SOURCE_FILES = ("default__vector_store.json", "docstore.json", "index_store.json")
+
+
+def _faiss_vectors(path: Path) -> np.ndarray:
+    import faiss
+    index = faiss.read_index(str(path))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _payloads(store_dir: Path, n_rows: int) -> list:
+    """Payload (node metadata + text) for every FAISS row, in row order."""
+    with open(store_dir / "index_store.json", "r", encoding="utf-8") as f:
+        index_data = next(iter(json.load(f)["index_store/data"].values()))
+    nodes_dict = json.loads(index_data["__data__"])["nodes_dict"]
+    with open(store_dir / "docstore.json", "r", encoding="utf-8") as f:
+        docs = json.load(f)["docstore/data"]
+
+    payloads = [{} for _ in range(n_rows)]
+    for row, node_id in nodes_dict.items():
+        node = docs.get(node_id, {}).get("__data__", {})
+        payload = dict(node.get("metadata") or {})
+        payload["text"] = node.get("text", "")
+        payload["node_id"] = node_id
+        payloads[int(row)] = payload
+    return payloads
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    """(stored vectors, per-row scales or None) for float32 / float16 / int8 storage."""
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        # symmetric per-row scale: v ≈ q * scale, q in [-127, 127]
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return q, scales.astype(np.float32)
+    raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+
+def build_sidecar(store_dir: Path, dtype: str = LOCAL_VECTOR_DTYPE, out: Path = None) -> Path:
+    """
+    Converts one persisted store into the compact sidecar (`out`, default store_dir/local/):
+      vectors.npy          L2-normalized vectors as float32 / float16 / int8
+      scales.npy           per-row dequantization scales (int8 only)
+      payloads.bin         UTF-8 JSON payload (metadata + text) of every row, concatenated
+      payload_offsets.npy  int64[n + 1] byte offsets into payloads.bin
+      manifest.json        format version, dtype, rows, dim
+    manifest.json is written last, so a sidecar without it is incomplete.
+    """
+    vectors = _faiss_vectors(store_dir / "default__vector_store.json").astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+    stored, scales = _quantize(vectors, dtype)
+
+    out = Path(out) if out else store_dir / SIDECAR_DIR
+    out.mkdir(parents=True, exist_ok=True)
+    (out / "manifest.json").unlink(missing_ok=True)
+    np.save(out / "vectors.npy", np.ascontiguousarray(stored))
+    if scales is not None:
+        np.save(out / "scales.npy", scales)
+    else:
+        (out / "scales.npy").unlink(missing_ok=True)
+
+    offsets = [0]
+    with open(out / "payloads.bin", "wb") as f:
+        for payload in _payloads(store_dir, len(vectors)):
+            offsets.append(offsets[-1] + f.write(json.dumps(payload, ensure_ascii=False).encode("utf-8")))
+    np.save(out / "payload_offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+    with open(out / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({"version": SIDECAR_VERSION, "dtype": dtype,
+                   "rows": int(vectors.shape[0]), "dim": int(vectors.shape[1])}, f)
+    return out
+
+
+def _sidecar_is_fresh(store_dir: Path) -> bool:
+    manifest = store_dir / SIDECAR_DIR / "manifest.json"
+    if not manifest.exists():
+        return False
+    with open(manifest, "r", encoding="utf-8") as f:
+        if json.load(f).get("version") != SIDECAR_VERSION:
+            return False
+    newest_source = max((store_dir / f).stat().st_mtime for f in _SOURCE_FILES)
+    return manifest.stat().st_mtime >= newest_source
+
+
+def discover_stores(root: Path = INDEXES_ROOT) -> dict:
+    """{collection_name: store_dir} for every persisted store under root."""
+    stores = {}
+    for vector_file in sorted(Path(root).glob("*/*/*/index_*/default__vector_store.json")):
+        store_dir = vector_file.parent
+        subject, grade, term = store_dir.parts[-4:-1]
+        stores[f"{subject}_{grade}_{term}"] = store_dir
+    return stores
+
+
+class LocalCollection:
+    """
+    One store, memory-mapped from its sidecar: vectors are paged in by the OS on first
+    search and payloads are decoded only for the rows that are returned.
+    """
+
+    BLOCK_ROWS = 65536  # rows dequantized per step when scoring float16/int8 storage
+
+    def __init__(self, store_dir: Path, search: str = LOCAL_SEARCH, sidecar: Path = None):
+        if sidecar is not None:
+            out = Path(sidecar)
+        else:
+            if not _sidecar_is_fresh(store_dir):
+                build_sidecar(store_dir)
+            out = store_dir / SIDECAR_DIR
+        self.vectors = np.load(out / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(out / "scales.npy", mmap_mode="r") if (out / "scales.npy").exists() else None
+        self._offsets = np.load(out / "payload_offsets.npy", mmap_mode="r")
+        self._blob = np.memmap(out / "payloads.bin", dtype=np.uint8, mode="r") \
+            if self._offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self._hnsw = None
+        if search == "hnsw":
+            import faiss
+            self._hnsw = faiss.IndexHNSWFlat(self.vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            self._hnsw.add(self._float32_rows(0, len(self.vectors)))
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def payload(self, row: int) -> dict:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._blob[start:end].tobytes().decode("utf-8"))
+
+    def _float32_rows(self, start: int, stop: int) -> np.ndarray:
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[start:stop])[:, None]
+        return block
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ q
+        return np.concatenate([self._float32_rows(i, i + self.BLOCK_ROWS) @ q
+                               for i in range(0, len(self.vectors), self.BLOCK_ROWS)])
+
+    def search(self, query, limit: int):
+        """[(row, score)] best first."""
+        q = np.asarray(query, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        if self._hnsw is not None:
+            scores, rows = self._hnsw.search(q[None, :], limit)
+            return [(int(r), float(s)) for r, s in zip(rows[0], scores[0]) if r >= 0]
+        scores = self._scores(q)
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(r), float(scores[r])) for r in top]
+
+
+class LocalIndexClient:
+    """QdrantClient look-alike (get_collections / query_points) over local stores."""
+
+    def __init__(self, root: Path = INDEXES_ROOT, search: str = LOCAL_SEARCH):
+        self.search_mode = search
+        self._stores = discover_stores(root)
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            if name not in self._loaded:
+                if name not in self._stores:
+                    raise ValueError(f"Collection {name} not found")
+                self._loaded[name] = LocalCollection(self._stores[name], self.search_mode)
+            return self._loaded[name]
+
+    def get_collections(self):
+        return SimpleNamespace(collections=[SimpleNamespace(name=n) for n in self._stores])
+
+    def query_points(self, collection_name: str, query, with_payload: bool = True,
+                     limit: int = 10, **_ignored):
+        col = self._collection(collection_name)
+        points = [SimpleNamespace(id=row, score=score,
+                                  payload=col.payload(row) if with_payload else None)
+                  for row, score in col.search(query, limit)]
+        return SimpleNamespace(points=points)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert Indexes/ stores to compact binary sidecars")
+    parser.add_argument("command", choices=["convert"])
+    parser.add_argument("--root", type=Path, default=INDEXES_ROOT)
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default=LOCAL_VECTOR_DTYPE)
+    args = parser.parse_args()
+
+    for name, store_dir in discover_stores(args.root).items():
+        out = build_sidecar(store_dir, args.dtype)
+        src = sum((store_dir / f).stat().st_size for f in _SOURCE_FILES)
+        dst = sum(p.stat().st_size for p in out.iterdir())
+        print(f"✅ {name}: {src / 1024:.0f} KB → {dst / 1024:.0f} KB ({args.dtype}) → {out}")
+
+
+if __name__ == "__main__":
+    main()
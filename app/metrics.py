@@ -0,0 +1,340 @@
+# metrics.py
+"""
+Span timers and counters for extraction, indexing and querying (stdlib only, cheap
+enough to stay on: a span costs a few microseconds).
+
+    with metrics.span("query_search"):                  # → histogram query_search_seconds
+        ...
+    metrics.observe("extract_page_seconds", secs, method="ocr")
+    metrics.inc("cache_requests_total", cache="answer", result="hit")
+
+All series live in one thread-safe, process-wide registry. metrics.setup() (called by
+the scripts' main()) turns on the outputs configured in the environment:
+
+  METRICS_PORT=9464        Prometheus text at http://127.0.0.1:<port>/metrics from a
+                           background thread (serve.py also answers GET /metrics)
+  METRICS_JSON=run.json    snapshot at exit: counters, and count / sum / p50 / p95 /
+                           max per histogram (percentiles over the last samples)
+  METRICS_PROFILE=embed_batch,extract_page
+                           cProfile the spans (and profiled() blocks) with these names;
+                           one <name>.prof per name in METRICS_PROFILE_DIR at exit
+                           (pstats / snakeviz). Only in-process work is profiled.
+  METRICS_PYSPY=run.svg    record the whole process with py-spy (when installed) into
+                           a flame graph
+
+Stages that run in worker processes send their timings back to the parent, so nothing
+is lost with pools: page extraction (EXTRACT_WORKERS) and embedding (EMBED_WORKERS)
+return each timing with the result; whole books (EXTRACT_PARALLEL=books) return the
+worker's registry, which the parent adds to its own (export / merge).
+"""
+import atexit
+import bisect
+import cProfile
+import json
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+METRICS_PREFIX = "edu_bot_"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = no endpoint
+METRICS_JSON = os.getenv("METRICS_JSON", "")
+METRICS_PROFILE = {s.strip() for s in os.getenv("METRICS_PROFILE", "").split(",") if s.strip()}
+METRICS_PROFILE_DIR = Path(os.getenv("METRICS_PROFILE_DIR", "profiles"))
+METRICS_PYSPY = os.getenv("METRICS_PYSPY", "")
+# Histogram buckets in seconds: cache hits (~µs) up to OCR pages and LLM answers (~tens of s)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_SAMPLES = 2048  # per histogram series, for the JSON percentiles
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> _Histogram
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "sum", "max", "recent")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Adds `value` to a counter (name should end in _total)."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Records one duration in a histogram (name should end in _seconds)."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram()
+        hist.add(seconds)
+
+
+# -------------------------------
+# Spans (+ cProfile hooks)
+# -------------------------------
+_profiles = {}  # (span name, thread id) -> cProfile.Profile
+_profiling = threading.local()
+
+
+class span:
+    """
+    Times a block into the histogram <name>_seconds; an exception also counts in
+    span_errors_total{span=<name>}. Spans named in METRICS_PROFILE run under cProfile
+    (outermost profiled span per thread only).
+    """
+    __slots__ = ("name", "labels", "start", "profile")
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+        self.profile = None
+
+    def __enter__(self):
+        if self.name in METRICS_PROFILE and not getattr(_profiling, "active", False):
+            self.profile = _start_profile(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self._stop_profile()
+        observe(f"{self.name}_seconds", elapsed, **self.labels)
+        if exc_type is not None:
+            inc("span_errors_total", span=self.name)
+        return False
+
+    def _stop_profile(self) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+            _profiling.active = False
+
+
+class profiled(span):
+    """Only the cProfile hook of span, for stages whose time is recorded elsewhere (worker timings)."""
+    __slots__ = ()
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop_profile()
+        return False
+
+
+def _start_profile(name: str):
+    key = (name, threading.get_ident())
+    with _lock:
+        profile = _profiles.get(key)
+        if profile is None:
+            profile = _profiles[key] = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # another profiler is active (Python 3.12+ allows one per process)
+        return None
+    _profiling.active = True
+    return profile
+
+
+def write_profiles(out_dir: Path = METRICS_PROFILE_DIR) -> list:
+    """One <span>.prof per profiled span name (all threads merged). Returns the paths."""
+    import pstats
+    with _lock:
+        by_name = {}
+        for (name, _), profile in _profiles.items():
+            by_name.setdefault(name, []).append(profile)
+    paths = []
+    for name, profiles in sorted(by_name.items()):
+        try:
+            stats = pstats.Stats(*profiles)
+        except TypeError:  # never enabled: no data
+            continue
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{name}.prof"
+        stats.dump_stats(str(path))
+        paths.append(path)
+    return paths
+
+
+# -------------------------------
+# Output
+# -------------------------------
+def _percentile(ordered, p: float) -> float:
+    # nearest rank, as loadtest.percentile (not imported: it pulls in asyncio)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def snapshot() -> dict:
+    """{"counters": [...], "histograms": [...]} with one entry per name + labels."""
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_counters.items())]
+        histograms = []
+        for (n, l), h in sorted(_histograms.items()):
+            recent = sorted(h.recent)
+            histograms.append({
+                "name": n, "labels": dict(l), "count": h.count, "sum": round(h.sum, 6),
+                "mean": round(h.sum / h.count, 6) if h.count else 0.0,
+                "p50": round(_percentile(recent, 50), 6), "p95": round(_percentile(recent, 95), 6),
+                "max": round(h.max, 6),
+            })
+    return {"counters": counters, "histograms": histograms}
+
+
+def _labels_text(labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def prometheus_text() -> str:
+    """All series in the Prometheus text exposition format (version 0.0.4)."""
+    lines, typed = [], set()
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            full = METRICS_PREFIX + name
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{_labels_text(labels)} {value}")
+        for (name, labels), h in sorted(_histograms.items()):
+            full = METRICS_PREFIX + name
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} histogram")
+            cumulative = 0
+            for le, n in zip(BUCKETS + ("+Inf",), h.buckets):
+                cumulative += n
+                bucket = f'le="{le}"'
+                lines.append(f"{full}_bucket{_labels_text(labels, bucket)} {cumulative}")
+            lines.append(f"{full}_sum{_labels_text(labels)} {h.sum}")
+            lines.append(f"{full}_count{_labels_text(labels)} {h.count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_json(path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def export() -> dict:
+    """The raw registry (picklable), for a worker process to hand back to its parent (merge)."""
+    with _lock:
+        return {"counters": dict(_counters),
+                "histograms": {key: (list(h.buckets), h.count, h.sum, h.max, list(h.recent))
+                               for key, h in _histograms.items()}}
+
+
+def merge(state: dict) -> None:
+    """Adds another process's export() to this registry."""
+    with _lock:
+        for key, value in state["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, (buckets, count, total, peak, recent) in state["histograms"].items():
+            hist = _histograms.get(key)
+            if hist is None:
+                hist = _histograms[key] = _Histogram()
+            hist.buckets = [a + b for a, b in zip(hist.buckets, buckets)]
+            hist.count += count
+            hist.sum += total
+            hist.max = max(hist.max, peak)
+            hist.recent.extend(recent)
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def start_http_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """GET /metrics (Prometheus text) from a daemon thread. Returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def _start_py_spy(out_path: str):
+    """py-spy recording this process until exit, or None when py-spy is not installed."""
+    exe = shutil.which("py-spy")
+    if exe is None:
+        print("⚠️ METRICS_PYSPY set but py-spy is not installed (pip install py-spy)")
+        return None
+    return subprocess.Popen([exe, "record", "--pid", str(os.getpid()), "--output", out_path,
+                             "--format", "flamegraph", "--subprocesses"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+_setup_done = False
+
+
+def setup() -> None:
+    """Starts the outputs configured in the environment (once per process)."""
+    global _setup_done
+    if _setup_done:
+        return
+    _setup_done = True
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"📈 metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    spy = _start_py_spy(METRICS_PYSPY) if METRICS_PYSPY else None
+
+    def _at_exit():
+        if METRICS_JSON:
+            print(f"📈 metrics → {write_json(METRICS_JSON)}")
+        for path in write_profiles() if METRICS_PROFILE else ():
+            print(f"🔬 profile → {path}")
+        if spy is not None and spy.poll() is None:
+            spy.send_signal(signal.SIGINT)  # py-spy writes the flame graph on SIGINT
+            try:
+                spy.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                spy.kill()
+            print(f"🔥 py-spy → {METRICS_PYSPY}")
+
+    atexit.register(_at_exit)
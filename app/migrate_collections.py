@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Moves the indexed chunks between the two Qdrant layouts of collection_layout.py,
+copying the stored vectors (nothing is re-embedded):
+
+  --to single          every <subject>_g<grade>_t<term> collection → SINGLE_COLLECTION,
+                       subject/grade/term set from the collection name, payload indexes created
+  --to per_collection  SINGLE_COLLECTION → one collection per subject/grade/term (rollback)
+
+Point ids are kept. The build_index manifests are copied to the new layout's names,
+minus points whose payload changed, so the next build_index run with the new
+COLLECTION_LAYOUT only re-embeds those. Point counts are checked per
+subject/grade/term; --drop-old deletes the source collection(s) only if they match.
+
+    python app/migrate_collections.py --to single [--dry-run] [--drop-old]
+    COLLECTION_LAYOUT=single python app/ask.py
+"""
+import argparse
+import re
+
+from dotenv import load_dotenv
+
+import collection_layout
+import index_manifest
+from ask import ENV_PATH, load_search_client
+from collection_layout import SINGLE_COLLECTION
+
+SCROLL_BATCH = 256
+_NAME_PAT = re.compile(r"^(.+)_(g\d+)_(t\d+)$")
+
+
+def _scroll(client, name: str, scroll_filter=None, batch: int = SCROLL_BATCH):
+    """All points of a collection (with vectors), page by page."""
+    offset = None
+    while True:
+        points, offset = client.scroll(name, scroll_filter=scroll_filter, limit=batch, offset=offset,
+                                       with_payload=True, with_vectors=True)
+        if points:
+            yield points
+        if offset is None:
+            return
+
+
+def _ensure_collection(client, name: str, like: str) -> None:
+    """Creates `name` with the vector, HNSW and quantization config of `like` unless it exists."""
+    from qdrant_client.models import HnswConfigDiff
+    if not client.collection_exists(name):
+        config = client.get_collection(like).config
+        client.create_collection(name, vectors_config=config.params.vectors,
+                                 hnsw_config=HnswConfigDiff(**config.hnsw_config.model_dump()),
+                                 quantization_config=config.quantization_config)
+
+
+def _copy_manifest(src_name: str, dst_name: str, changed: set) -> bool:
+    if not index_manifest.manifest_path(src_name).exists():
+        return False
+    manifest = index_manifest.load_manifest(src_name)
+    index_manifest.save_manifest(dst_name, {file: {pid: h for pid, h in hashes.items() if pid not in changed}
+                                            for file, hashes in manifest.items()})
+    return True
+
+
+def to_single(client, dry_run: bool = False) -> dict:
+    """{collection: (points copied, points now in the single collection for it)}"""
+    from qdrant_client.models import PointStruct
+    sources = sorted(c.name for c in client.get_collections().collections if _NAME_PAT.match(c.name))
+    if not sources:
+        print("❌ No <subject>_g<grade>_t<term> collections to migrate")
+        return {}
+    result = {}
+    for name in sources:
+        subject, grade, term = _NAME_PAT.match(name).groups()
+        scope = {"subject": subject, "grade": grade, "term": term}
+        copied, changed = 0, set()
+        if not dry_run:
+            _ensure_collection(client, SINGLE_COLLECTION, like=name)
+            collection_layout.ensure_payload_indexes(client, SINGLE_COLLECTION)
+        for points in _scroll(client, name):
+            batch = []
+            for p in points:
+                payload = dict(p.payload or {})
+                if any(payload.get(k) != v for k, v in scope.items()):
+                    changed.add(str(p.id))
+                payload.update(scope)
+                batch.append(PointStruct(id=p.id, vector=p.vector, payload=payload))
+            if not dry_run:
+                client.upsert(SINGLE_COLLECTION, points=batch, wait=True)
+            copied += len(batch)
+        present = client.count(SINGLE_COLLECTION, count_filter=collection_layout.scope_filter(grade, term, [subject]),
+                               exact=True).count if not dry_run else copied
+        if not dry_run:
+            _copy_manifest(name, f"{SINGLE_COLLECTION}.{name}", changed)
+        result[name] = (copied, present)
+        print(f"{'🔎' if dry_run else '✅'} {name} → {SINGLE_COLLECTION}: {copied} point(s)"
+              f"{f', {len(changed)} payload(s) rescoped' if changed else ''}")
+    return result
+
+
+def to_per_collection(client, dry_run: bool = False) -> dict:
+    """{collection: (points copied, points now in that collection)}"""
+    from qdrant_client.models import PointStruct
+    if not client.collection_exists(SINGLE_COLLECTION):
+        print(f"❌ {SINGLE_COLLECTION} does not exist")
+        return {}
+    copied = {}
+    for points in _scroll(client, SINGLE_COLLECTION):
+        batches = {}
+        for p in points:
+            md = p.payload or {}
+            name = collection_layout.collection_name(md.get("subject", "general"), md.get("grade", "na"),
+                                                     md.get("term", "na"))
+            batches.setdefault(name, []).append(PointStruct(id=p.id, vector=p.vector, payload=md))
+        for name, batch in batches.items():
+            if not dry_run:
+                _ensure_collection(client, name, like=SINGLE_COLLECTION)
+                client.upsert(name, points=batch, wait=True)
+            copied[name] = copied.get(name, 0) + len(batch)
+    result = {}
+    for name, n in sorted(copied.items()):
+        present = client.count(name, exact=True).count if not dry_run else n
+        if not dry_run:
+            _copy_manifest(f"{SINGLE_COLLECTION}.{name}", name, set())
+        result[name] = (n, present)
+        print(f"{'🔎' if dry_run else '✅'} {SINGLE_COLLECTION} → {name}: {n} point(s)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate between per-collection and single-collection layouts")
+    parser.add_argument("--to", choices=["single", "per_collection"], default="single")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be copied")
+    parser.add_argument("--drop-old", action="store_true", help="delete the source collection(s) afterwards")
+    args = parser.parse_args()
+
+    load_dotenv(ENV_PATH)
+    client = load_search_client("qdrant")
+    result = (to_single if args.to == "single" else to_per_collection)(client, args.dry_run)
+    mismatched = [name for name, (copied, present) in result.items() if copied != present]
+    for name in mismatched:
+        print(f"⚠️ {name}: copied {result[name][0]}, found {result[name][1]} in the target")
+    total = sum(copied for copied, _ in result.values())
+    print(f"📦 {total} point(s) in {len(result)} subject/grade/term group(s)"
+          f"{' (dry run)' if args.dry_run else ''}")
+
+    if args.drop_old and result and not args.dry_run:
+        if mismatched:
+            print("❌ Counts differ, source collection(s) kept")
+            return
+        for name in ([SINGLE_COLLECTION] if args.to == "per_collection" else sorted(result)):
+            client.delete_collection(name)
+            print(f"🗑️ Dropped {name}")
+    if not args.dry_run and result:
+        print(f"➡️ Set COLLECTION_LAYOUT={args.to} for build_index.py / ask.py / serve.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# page_cache.py
+"""
+On-disk cache for per-page PDF extraction results.
+
+Entries are keyed by (PDF content hash, page number, extraction settings) and hold
+the raw page text (native or OCR) plus the math/diagram detection counts, so
+re-running extract_books after changing clean_text / create_chunks never renders
+or OCRs a page again. The cache is a single SQLite file, safe to share between the
+extraction worker processes, and is trimmed least-recently-used first once it grows
+past PAGE_CACHE_MAX_MB.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", str(ROOT / ".cache" / "page_cache.sqlite"))
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "512"))
+
+
+def file_fingerprint(path, block_size: int = 1 << 20) -> str:
+    """sha256 of the file content; renaming or moving a PDF keeps its cache entries."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PageCache:
+    """SQLite-backed page cache with size-bounded LRU eviction and hit/miss counters."""
+
+    def __init__(self, path: str = PAGE_CACHE_PATH, max_mb: float = PAGE_CACHE_MAX_MB):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                   file_hash TEXT NOT NULL,
+                   page      INTEGER NOT NULL,
+                   settings  TEXT NOT NULL,
+                   text      TEXT NOT NULL,
+                   method    TEXT NOT NULL,
+                   math_count INTEGER,
+                   drawings  INTEGER,
+                   size      INTEGER NOT NULL,
+                   last_used REAL NOT NULL,
+                   PRIMARY KEY (file_hash, page, settings)
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_lru ON pages(last_used)")
+        self._conn.commit()
+
+    def get(self, file_hash: str, page: int, settings: str):
+        """Returns {"text", "method", "math_count", "drawings"} or None."""
+        row = self._conn.execute(
+            "SELECT text, method, math_count, drawings FROM pages "
+            "WHERE file_hash=? AND page=? AND settings=?",
+            (file_hash, page, settings),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute(
+            "UPDATE pages SET last_used=? WHERE file_hash=? AND page=? AND settings=?",
+            (time.time(), file_hash, page, settings),
+        )
+        self._conn.commit()
+        text, method, math_count, drawings = row
+        return {"text": text, "method": method, "math_count": math_count, "drawings": drawings}
+
+    def put(self, file_hash: str, page: int, settings: str, text: str, method: str,
+            math_count=None, drawings=None) -> None:
+        size = len(text.encode("utf-8"))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_hash, page, settings, text, method, math_count, drawings, size, time.time()),
+        )
+        self._conn.commit()
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drops least-recently-used pages until the cache is back under 90% of its limit."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT rowid, size FROM pages ORDER BY last_used").fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if total <= target:
+                break
+            doomed.append((rowid,))
+            total -= size
+        self._conn.executemany("DELETE FROM pages WHERE rowid=?", doomed)
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming indexing pipeline: PDFs → extract/clean/chunk → embed → upsert, with the
+stages overlapping instead of running as separate full passes.
+
+- An extraction thread runs extract_books.process_book on one PDF after another
+  (pages in EXTRACT_WORKERS processes). It still writes the book's JSONL under
+  build_index.CLEANED_ROOT, and hands every record to a bounded queue as soon as
+  its chunk is closed.
+- The main thread feeds each book's records into build_index's incremental sync:
+  unchanged chunks are skipped by content hash, the rest are embedded in batches
+  (EMBED_WORKERS processes) and uploaded with UPSERT_IN_FLIGHT parallel upserts.
+- A full queue blocks the extraction (backpressure), so memory stays bounded by
+  --queue-size records plus the in-flight embed/upsert batches.
+
+Points and manifests end up the same as after extract_books.py + build_index.py on
+the same books, including the pruning of JSONL files removed from CLEANED_ROOT; BM25
+indexes are rebuilt for the collections of these books. If indexing raises, the
+extraction thread is stopped and joined before the error propagates.
+A book whose extraction fails keeps its previously indexed points (and its old JSONL);
+the records it had already upserted stay too, so its BM25 records are the old file's
+plus the synced ones, as in Qdrant.
+
+    python app/pipeline.py [--books Data/Books] [--queue-size 512] [--recreate]
+"""
+import argparse
+import queue
+import threading
+import time
+from pathlib import Path
+
+import build_index
+import chunk_records
+import collection_layout
+import extract_books
+import index_manifest
+import metrics
+from build_index import EmbedStats
+
+PIPELINE_QUEUE_SIZE = 512  # records buffered between extraction and embedding
+
+
+class _Waits:
+    """Seconds each side spent blocked on the queue (shows which stage is the bottleneck)."""
+
+    def __init__(self) -> None:
+        self.extract_blocked = 0.0  # queue full: embedding/upload is slower
+        self.embed_starved = 0.0    # queue empty: extraction is slower
+
+    def put(self, q: queue.Queue, item) -> None:
+        start = time.perf_counter()
+        q.put(item)
+        blocked = time.perf_counter() - start
+        self.extract_blocked += blocked
+        metrics.inc("pipeline_blocked_seconds_total", blocked, side="extract")
+
+    def get(self, q: queue.Queue):
+        start = time.perf_counter()
+        item = q.get()
+        starved = time.perf_counter() - start
+        self.embed_starved += starved
+        metrics.inc("pipeline_blocked_seconds_total", starved, side="embed")
+        return item
+
+
+class _Stopped(Exception):
+    """Aborts the book being extracted once the main thread has given up (see _stop_producer)."""
+
+
+def _produce(pdf_paths, q: queue.Queue, out_root: Path, page_workers: int, waits: _Waits,
+             stop: threading.Event) -> None:
+    """
+    Extraction thread: ("book", jsonl path), ("record", record)..., ("end", ok) per PDF,
+    then None. Once `stop` is set the current book fails (its old JSONL stays) and no
+    further book is started.
+    """
+    def on_record(record):
+        if stop.is_set():
+            raise _Stopped("pipeline stopped")
+        waits.put(q, ("record", record))
+
+    try:
+        for pdf_path in pdf_paths:
+            if stop.is_set():
+                break
+            waits.put(q, ("book", extract_books.book_output_path(pdf_path, "jsonl", out_root)))
+            ok = False
+            try:
+                ok = extract_books.process_book(pdf_path, page_workers, fmt="jsonl", out_root=out_root,
+                                                on_record=on_record) is not None
+            finally:
+                waits.put(q, ("end", ok))
+    finally:
+        q.put(None)
+
+
+def _stop_producer(producer: threading.Thread, q: queue.Queue, stop: threading.Event) -> None:
+    """Tells the extraction thread to stop and empties the queue until it has (a no-op after a full run)."""
+    stop.set()
+    while producer.is_alive():
+        try:
+            q.get(timeout=0.1)  # unblocks a put on a full queue
+        except queue.Empty:
+            pass
+    producer.join()
+
+
+def _cleaned_files(out_root: Path, failed: dict) -> dict:
+    """
+    collection -> every JSONL file under out_root, as build_index.py sees them, plus
+    the paths of failed books (their points stay even without a file).
+    """
+    files = {}
+    for path in set(out_root.rglob("*.jsonl")) | set(failed):
+        subject, grade, term = path.parts[-4:-1]
+        files.setdefault(collection_layout.collection_name(subject, grade, term), []).append(path)
+    return {name: sorted(paths) for name, paths in files.items()}
+
+
+def _book_records(q: queue.Queue, state: dict, waits: _Waits):
+    """(point_id, text, payload) of the current book until its "end" item; state["complete"] = ok."""
+    i = 0  # line number in the JSONL file → same point ids as chunk_records.iter_records
+    while True:
+        kind, value = waits.get(q)
+        if kind == "end":
+            state["complete"] = value
+            return
+        record = chunk_records.parse_record(value, i)
+        i += 1
+        if record is not None:
+            yield record
+
+
+def _keep(records, kept: list):
+    """Passes records through, appending each one to `kept`."""
+    for record in records:
+        kept.append(record)
+        yield record
+
+
+def _lexical_records(jsonl_path: Path, failed: dict):
+    """
+    BM25 records of one book: its JSONL file, or for a book whose extraction failed the
+    old file's records overridden / extended by the ones synced before the failure.
+    """
+    if jsonl_path not in failed:
+        yield from chunk_records.iter_records(jsonl_path)
+        return
+    synced = {point_id: (point_id, text, md) for point_id, text, md in failed[jsonl_path]}
+    if jsonl_path.exists():
+        yield from (r for r in chunk_records.iter_records(jsonl_path) if r[0] not in synced)
+    yield from synced.values()
+
+
+def run_pipeline(pdf_paths, recreate: bool = False,
+                 queue_size: int = PIPELINE_QUEUE_SIZE,
+                 page_workers: int = extract_books.EXTRACT_WORKERS,
+                 embed_workers: int = build_index.EMBED_WORKERS,
+                 batch_size: int = build_index.EMBED_BATCH_SIZE) -> None:
+    out_root = Path(build_index.CLEANED_ROOT)
+    q: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    waits = _Waits()
+    started = time.perf_counter()
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(pdf_paths, q, out_root, page_workers, waits, stop),
+                                name="extract", daemon=True)
+
+    pool = build_index._make_embed_pool(embed_workers)
+    total_stats = EmbedStats()
+    manifests = {}
+    touched = set()       # collections of the books in this run, for the BM25 rebuild
+    failed = {}           # JSONL path of a failed book -> records synced before the failure
+    build_index._init_layout(recreate)
+    producer.start()
+    try:
+        for kind, jsonl_path in iter(lambda: waits.get(q), None):
+            subject, grade, term = jsonl_path.parts[-4:-1]
+            col = build_index._open_collection(subject, grade, term, manifests, recreate)
+            manifest = manifests[col["name"]]
+
+            state = {"complete": False}
+            synced = []
+            file_stats = EmbedStats()
+            upserted, unchanged, deleted = build_index._sync_records(
+                jsonl_path.name, _keep(_book_records(q, state, waits), synced), col["target"], manifest,
+                pool, file_stats, batch_size, col["scope"], complete=lambda: state["complete"],
+                workers=embed_workers)
+            index_manifest.save_manifest(col["manifest_name"], manifest)
+            touched.add(col["name"])
+            if not state["complete"]:
+                failed[jsonl_path] = synced
+
+            total_stats.chunks += file_stats.chunks
+            total_stats.batch_seconds.extend(file_stats.batch_seconds)
+            status = "✅" if state["complete"] else "⚠️ (extraction failed, old points kept)"
+            print(f"{status} {col['label']} ← {jsonl_path.name}: upserted {upserted}, "
+                  f"unchanged {unchanged}, deleted {deleted}")
+            if upserted:
+                print("   " + file_stats.report(jsonl_path.name))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _stop_producer(producer, q, stop)
+
+    print("\n" + total_stats.report("Embedding total"))
+    print(f"⏱️ pipeline: {len(pdf_paths)} book(s) in {time.perf_counter() - started:.1f}s | "
+          f"extraction blocked on a full queue {waits.extract_blocked:.1f}s, "
+          f"embedding waited for records {waits.embed_starved:.1f}s")
+    collection_files = _cleaned_files(out_root, failed)
+    build_index._prune_removed_files(manifests, collection_files)
+    build_index._rebuild_lexical({name: collection_files[name] for name in sorted(touched)},
+                                 lambda f: _lexical_records(f, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract → embed → upsert in one streaming pass")
+    parser.add_argument("--books", type=Path, default=extract_books.BOOKS_ROOT,
+                        help="directory searched for <subject>/<grade>/<term>/*.pdf")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE)
+    parser.add_argument("--recreate", action="store_true", help="recreate the collection(s) (all data lost)")
+    args = parser.parse_args()
+
+    metrics.setup()
+    pdf_paths = sorted(args.books.rglob("*.pdf"))
+    if not pdf_paths:
+        print(f"❌ No PDFs found under: {args.books}")
+        return
+    print("🚀 Streaming pipeline: extract → embed → upsert")
+    print("=" * 50)
+    run_pipeline(pdf_paths, recreate=args.recreate, queue_size=args.queue_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# query_cache.py
+"""
+Caches for repeated student questions.
+
+1) QueryEmbeddingCache – LRU of normalized question text → query vector. It wraps
+   the embedding model and exposes the same get_query_embedding(), so it can be
+   passed anywhere ask.py expects `embed`. get_query_embedding_batch() fills it for
+   many questions at once (batch_ask.py).
+2) SemanticAnswerCache – stored LLM answers per (grade, term, dominant subject,
+   reply language, numbers in the question). A new question reuses an answer when its query vector is within
+   ANSWER_CACHE_THRESHOLD cosine similarity of a cached one. Entries expire after
+   ANSWER_CACHE_TTL_S and the least-recently-used ones are dropped beyond
+   ANSWER_CACHE_SIZE. The numbers are part of the key because E5 scores questions
+   that differ only in their numbers ("ناتج 12 × 4" / "ناتج 12 × 5") above the threshold.
+
+Both keep hit/miss counters (see stats()) and are safe to share between threads.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+from embeddings import embed_queries
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(24 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+_AR_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+_DIACRITICS = re.compile(r"[\u064B-\u0652\u0640]")  # tashkeel + tatweel
+_TRAILING_PUNCT = re.compile(r"[\s?؟!.،,]+$")
+_NUMBER = re.compile(r"\d+(?:[.,٫]\d+)?")
+
+
+def normalize_question(q: str) -> str:
+    """Lowercase, Western digits, no tashkeel/tatweel, single spaces, no trailing punctuation."""
+    q = (q or "").translate(_AR_DIGITS).lower()
+    q = _DIACRITICS.sub("", q)
+    q = " ".join(q.split())
+    return _TRAILING_PUNCT.sub("", q)
+
+
+def question_numbers(q: str) -> tuple:
+    """The numbers of a question in order, Western digits and "." as decimal separator."""
+    return tuple(n.replace(",", ".").replace("٫", ".")
+                 for n in _NUMBER.findall((q or "").translate(_AR_DIGITS)))
+
+
+def _hit_rate(hits: int, misses: int) -> float:
+    return round(hits / (hits + misses), 4) if hits + misses else 0.0
+
+
+class QueryEmbeddingCache:
+    """LRU question → query-vector cache in front of an embedding model."""
+
+    def __init__(self, embed, max_size: int = QUERY_CACHE_SIZE):
+        self.embed = embed
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_query_embedding(self, query: str):
+        key = normalize_question(query)
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                metrics.inc("cache_requests_total", cache="query_embedding", result="hit")
+                return vec
+            self.misses += 1
+        metrics.inc("cache_requests_total", cache="query_embedding", result="miss")
+        vec = self.embed.get_query_embedding(query)
+        with self._lock:
+            self._lru[key] = vec
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+        return vec
+
+    def get_query_embedding_batch(self, queries):
+        """Vectors for many questions; the uncached ones are embedded together (embed_queries)."""
+        keys = [normalize_question(q) for q in queries]
+        with self._lock:
+            found = {k: self._lru[k] for k in keys if k in self._lru}
+        missing = {}  # normalized question -> first original text
+        for q, k in zip(queries, keys):
+            if k not in found:
+                missing.setdefault(k, q)
+        if missing:
+            found.update(zip(missing, embed_queries(self.embed, missing.values())))
+        metrics.inc("cache_requests_total", len(keys) - len(missing), cache="query_embedding", result="hit")
+        metrics.inc("cache_requests_total", len(missing), cache="query_embedding", result="miss")
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            for k in keys:
+                self._lru[k] = found[k]
+                self._lru.move_to_end(k)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+        return [found[k] for k in keys]
+
+    def peek(self, query: str):
+        """Vector for a question that was just embedded, without touching the hit/miss counters."""
+        with self._lock:
+            vec = self._lru.get(normalize_question(query))
+        return vec if vec is not None else self.get_query_embedding(query)
+
+    def __getattr__(self, name):
+        # Everything else (get_text_embedding, ...) goes straight to the model
+        return getattr(self.embed, name)
+
+    def stats(self) -> dict:
+        return {"size": len(self._lru), "hits": self.hits, "misses": self.misses,
+                "hit_rate": _hit_rate(self.hits, self.misses)}
+
+
+class SemanticAnswerCache:
+    """Answers reused for near-identical questions (cosine ≥ threshold on normalized vectors)."""
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl_s: float = ANSWER_CACHE_TTL_S, max_size: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # entry_id -> (key, unit vector, answer, created_at)
+        self._by_key = {}              # key -> [entry_id, ...]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def _drop(self, entry_id) -> None:
+        key = self._entries.pop(entry_id)[0]
+        ids = self._by_key.get(key, [])
+        ids.remove(entry_id)
+        if not ids:
+            self._by_key.pop(key, None)
+
+    def get(self, key, qvec):
+        """Best cached answer for `key` within the threshold, or None."""
+        q = self._unit(qvec)
+        now = time.time()
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id in list(self._by_key.get(key, [])):
+                _, vec, _, created = self._entries[entry_id]
+                if now - created > self.ttl_s:
+                    self._drop(entry_id)
+                    continue
+                sim = float(np.dot(q, vec))
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                metrics.inc("cache_requests_total", cache="answer", result="miss")
+                return None
+            self.hits += 1
+            metrics.inc("cache_requests_total", cache="answer", result="hit")
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+
+    def put(self, key, qvec, answer: str) -> None:
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, self._unit(qvec), answer, time.time())
+            self._by_key.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": _hit_rate(self.hits, self.misses)}
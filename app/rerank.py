@@ -0,0 +1,152 @@
+# rerank.py
+"""
+Optional cross-encoder reranking of retrieved hits (USE_RERANK=1).
+
+ask.retrieve() takes the top RERANK_CANDIDATES hits of the dominant subject, and
+the reranker scores every (question, chunk) pair in one batched forward pass on
+CPU. The model runs on ONNX Runtime through sentence-transformers
+(backend="onnx"), preferring the int8-quantized RERANK_ONNX_FILE, and falls back
+to plain ONNX and then PyTorch when that is not available.
+
+Each query has a latency budget (RERANK_BUDGET_MS):
+- the reranker keeps a running estimate of the cost per pair and trims the
+  candidates so the predicted pass fits the budget (the trimmed tail keeps its
+  retrieval order after the reranked head);
+- a pass that runs over the budget is abandoned and the original order is used;
+- when all RERANK_WORKERS are still busy with earlier passes, the query is not
+  reranked either, so slow passes never queue up behind each other.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+USE_RERANK = os.getenv("USE_RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "onnx")  # onnx | torch
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # hits scored per question
+RERANK_MIN_CANDIDATES = 4                                      # fewer than this → not worth it
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "400"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # tokens per (question, chunk) pair
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+RERANK_LATENCY_SAMPLES = 2048  # recent passes kept for the stats() percentiles
+
+
+def _load_cross_encoder(model_name: str, backend: str, max_length: int):
+    """(CrossEncoder, backend label), trying quantized ONNX → ONNX → PyTorch."""
+    from sentence_transformers import CrossEncoder
+
+    attempts = []
+    if backend == "onnx":
+        if RERANK_ONNX_FILE:
+            attempts.append(("onnx-int8", dict(backend="onnx", model_kwargs={"file_name": RERANK_ONNX_FILE})))
+        attempts.append(("onnx", dict(backend="onnx")))
+    attempts.append(("torch", {}))
+
+    last_error = None
+    for label, kwargs in attempts:
+        try:
+            return CrossEncoder(model_name, max_length=max_length, device="cpu", **kwargs), label
+        except Exception as e:  # missing optimum/onnxruntime, no such file in the repo, ...
+            last_error = e
+    raise last_error
+
+
+class CrossEncoderReranker:
+    """Batched cross-encoder scoring with a per-query time budget (see module docstring)."""
+
+    def __init__(self, model_name: str = RERANK_MODEL, backend: str = RERANK_BACKEND,
+                 budget_ms: float = RERANK_BUDGET_MS, max_length: int = RERANK_MAX_LENGTH,
+                 workers: int = RERANK_WORKERS):
+        self.model, self.backend = _load_cross_encoder(model_name, backend, max_length)
+        self.budget_s = budget_ms / 1000
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        self._busy = 0
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = {"timeout": 0, "busy": 0, "budget": 0}
+        self.latencies_ms = deque(maxlen=RERANK_LATENCY_SAMPLES)
+
+        # Warm-up pass (first call is much slower) also seeds the per-pair cost estimate
+        start = time.perf_counter()
+        self.model.predict([("warm up", "warm up")] * RERANK_MIN_CANDIDATES)
+        self.pair_cost_s = (time.perf_counter() - start) / RERANK_MIN_CANDIDATES
+
+    def _score(self, query: str, texts):
+        start = time.perf_counter()
+        try:
+            scores = self.model.predict([(query, t) for t in texts], batch_size=len(texts),
+                                        show_progress_bar=False)
+        finally:
+            with self._lock:
+                self._busy -= 1
+        return scores, time.perf_counter() - start
+
+    def rerank(self, query: str, hits):
+        """
+        Hits in reranked order: the scored head first (by cross-encoder score, kept in
+        "score"; the retrieval score moves to "retrieval_score"), then any unscored tail.
+        Returns `hits` unchanged when the query is not reranked.
+        """
+        if len(hits) < 2:
+            return hits
+        n = min(len(hits), max(RERANK_MIN_CANDIDATES, int(self.budget_s / self.pair_cost_s)))
+        if n * self.pair_cost_s > self.budget_s:
+            self._fallback("budget")
+            return hits
+        with self._lock:
+            if self._busy >= self.workers:
+                self.fallbacks["busy"] += 1
+                return hits
+            self._busy += 1
+
+        start = time.perf_counter()
+        future = self._executor.submit(self._score, query, [h["text"] for h in hits[:n]])
+        try:
+            scores, seconds = future.result(timeout=self.budget_s)
+        except FutureTimeout:
+            self._fallback("timeout")
+            # The pass still finishes in the background; learn from it for the next query
+            future.add_done_callback(lambda f: f.exception() or self._observe(n, f.result()[1]))
+            return hits
+        self._observe(n, seconds)
+        with self._lock:
+            self.latencies_ms.append(1000 * (time.perf_counter() - start))
+            self.reranked += 1
+
+        head = [dict(h, retrieval_score=h["score"], score=float(s)) for h, s in zip(hits[:n], scores)]
+        head.sort(key=lambda x: x["score"], reverse=True)
+        return head + list(hits[n:])
+
+    def _fallback(self, reason: str) -> None:
+        with self._lock:
+            self.fallbacks[reason] += 1
+
+    def _observe(self, pairs: int, seconds: float) -> None:
+        # Exponential moving average of the cost of one pair
+        self.pair_cost_s = 0.8 * self.pair_cost_s + 0.2 * seconds / pairs
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self.latencies_ms)
+            reranked, fallbacks = self.reranked, dict(self.fallbacks)
+        pct = lambda p: round(lat[min(len(lat) - 1, int(p / 100 * len(lat)))], 1) if lat else 0.0
+        return {"backend": self.backend, "reranked": reranked, "fallbacks": fallbacks,
+                "latency_ms": {"p50": pct(50), "p95": pct(95)},
+                "pair_cost_ms": round(1000 * self.pair_cost_s, 2)}
+
+
+def load_reranker():
+    """CrossEncoderReranker when USE_RERANK=1, else None (also None if the model cannot load)."""
+    if not USE_RERANK:
+        return None
+    try:
+        reranker = CrossEncoderReranker()
+    except Exception as e:
+        print(f"⚠️ Reranker disabled ({e})")
+        return None
+    print(f"🔁 Reranker: {RERANK_MODEL} [{reranker.backend}], budget {RERANK_BUDGET_MS:.0f} ms")
+    return reranker
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running HTTP query service around ask.py's retrieval + generation pipeline.
+
+    POST /ask     {"question": "...", "grade": 5, "term": 1, "generate": true}
+    GET  /health
+    GET  /stats   cache sizes and hit rates (+ reranker latency/fallbacks)
+    GET  /metrics per-stage latency histograms and counters (Prometheus text, metrics.py)
+
+The embedding model, Qdrant client and LLM are loaded once at startup and shared
+by all requests; any grade/term can be asked concurrently. At most
+SERVE_MAX_CONCURRENCY questions run at a time (in worker threads), up to
+SERVE_MAX_QUEUE more wait for a slot, and anything beyond that gets 503.
+
+Offline / test setup (in-memory Qdrant seeded from cleaned JSONL + stub LLM):
+    LLM_BACKEND=stub python app/serve.py --qdrant memory --seed Data/Extracted_Books/Cleaned
+"""
+
+import os
+os.environ.setdefault("TRANSFORMERS_NO_TF", "1")
+os.environ.setdefault("USE_TF", "0")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+import chunk_records
+import collection_layout
+import metrics
+import vector_profiles
+from ask import (ENV_PATH, answer_cache_key, generate_answer,
+                 get_matching_collections, load_llm, load_search_client, retrieve)
+from embeddings import load_embed_model
+from query_cache import QueryEmbeddingCache, SemanticAnswerCache
+from rerank import load_reranker
+
+# ============== CONFIG ==============
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_MAX_CONCURRENCY = int(os.getenv("SERVE_MAX_CONCURRENCY", "4"))  # questions processed at once
+SERVE_MAX_QUEUE = int(os.getenv("SERVE_MAX_QUEUE", "64"))             # questions waiting for a slot
+COLLECTIONS_TTL_S = 60  # how long a grade/term → collections lookup is reused
+MAX_BODY_BYTES = 64 * 1024
+# ====================================
+
+
+def seed_collections(client: QdrantClient, embed, root: Path, batch_size: int = 64,
+                     layout: str = collection_layout.COLLECTION_LAYOUT) -> int:
+    """
+    Fills an (in-memory) Qdrant from a Cleaned/<subject>/<grade>/<term>/*.jsonl tree,
+    reading the chunks with chunk_records like build_index.py, so collection names,
+    point ids and payloads match (all in SINGLE_COLLECTION with layout="single").
+    """
+    total = 0
+    for jsonl_file in sorted(Path(root).rglob("*.jsonl")):
+        subject, grade, term = jsonl_file.parts[-4:-1]
+        name = collection_layout.collection_name(subject, grade, term)
+        col = collection_layout.SINGLE_COLLECTION if layout == "single" else name
+        if not client.collection_exists(col):
+            vector_profiles.create_collection(client, col, len(embed.get_text_embedding("probe")))
+            if layout == "single":
+                collection_layout.ensure_payload_indexes(client, col)
+        records = list(chunk_records.iter_records(jsonl_file))
+        if layout == "single":  # as build_index's scope: the path decides subject/grade/term
+            for _, _, md in records:
+                md.update(subject=subject, grade=grade, term=term)
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            vectors = embed.get_text_embedding_batch([t for _, t, _ in batch])
+            client.upsert(col, points=[PointStruct(id=pid, vector=v, payload=md)
+                                       for (pid, _, md), v in zip(batch, vectors)])
+        total += len(records)
+        print(f"🌱 Seeded {len(records)} chunk(s) → {col if col == name else f'{col}/{name}'}")
+    return total
+
+
+class QueryService:
+    """Shares one set of models between requests and bounds how many run at once."""
+
+    def __init__(self, client: QdrantClient, embed, llm, reranker=None,
+                 max_concurrency: int = SERVE_MAX_CONCURRENCY,
+                 max_queue: int = SERVE_MAX_QUEUE):
+        self.client = client
+        self.embed = QueryEmbeddingCache(embed)
+        self.answers = SemanticAnswerCache()
+        self.llm = llm
+        self.reranker = reranker
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._waiting = 0
+        self._collections = {}  # (grade, term) -> (expires_at, [names])
+
+    def stats(self) -> dict:
+        stats = {"query_embedding_cache": self.embed.stats(), "answer_cache": self.answers.stats()}
+        if self.reranker is not None:
+            stats["rerank"] = self.reranker.stats()
+        return stats
+
+    def _collections_for(self, grade: int, term: int):
+        cached = self._collections.get((grade, term))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        names = get_matching_collections(self.client, grade, term)
+        self._collections[(grade, term)] = (time.monotonic() + COLLECTIONS_TTL_S, names)
+        return names
+
+    def _answer(self, question: str, grade: int, term: int, generate: bool) -> dict:
+        """Blocking pipeline for one question; runs in a worker thread."""
+        t0 = time.perf_counter()
+        collections = self._collections_for(grade, term)
+        if not collections:
+            return {"error": f"No collections that end with _g{grade}_t{term}"}
+        pack_stats = {}
+        context, sources = retrieve(self.client, self.embed, collections, question, self.reranker,
+                                    stats=pack_stats)
+        t1 = time.perf_counter()
+
+        result = {
+            "answer": None,
+            "sources": [{"i": i, "score": h["score"], "source": h["source"], "page": h["page"],
+                         "collection": h["collection"], "text": h["text"]} for i, h in sources],
+            "timings_ms": {"retrieve": round(1000 * (t1 - t0), 1)},
+            "context_tokens": {k: pack_stats[k] for k in ("tokens_before", "tokens_after", "tokens_saved")
+                               if k in pack_stats},
+        }
+        if sources and generate and self.llm is not None:
+            key = answer_cache_key(grade, term, question, sources)
+            qvec = self.embed.peek(question)
+            try:
+                result["answer"] = self.answers.get(key, qvec)
+                result["cached"] = result["answer"] is not None
+                if result["answer"] is None:
+                    result["answer"] = generate_answer(self.llm, question, context)
+                    self.answers.put(key, qvec, result["answer"])
+            except Exception as e:
+                result["error"] = f"LLM error: {e}"
+            result["timings_ms"]["generate"] = round(1000 * (time.perf_counter() - t1), 1)
+        return result
+
+    async def ask(self, body: dict):
+        """Validates a /ask body and returns (http_status, response_dict)."""
+        question = str(body.get("question") or "").strip()
+        try:
+            grade, term = int(body.get("grade")), int(body.get("term"))
+        except (TypeError, ValueError):
+            return 400, {"error": "grade and term must be integers"}
+        if not question or grade not in range(1, 7) or term not in (1, 2):
+            return 400, {"error": "need question, grade (1-6) and term (1-2)"}
+        if self._waiting >= self.max_queue:
+            return 503, {"error": "busy, try again"}
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            queue_ms = round(1000 * (time.perf_counter() - queued_at), 1)
+            metrics.observe("serve_queue_seconds", queue_ms / 1000)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor, self._answer, question, grade, term, bool(body.get("generate", True)))
+        finally:
+            self._slots.release()
+        result.setdefault("timings_ms", {})["queue"] = queue_ms
+        return (404 if "error" in result and not result.get("sources") else 200), result
+
+
+# -------------------------------
+# Minimal HTTP/1.1 (keep-alive, JSON only)
+# -------------------------------
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+async def _write_json(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await _write_body(writer, status, body, "application/json; charset=utf-8", keep_alive)
+
+
+async def _write_body(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                      keep_alive: bool):
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+def make_handler(service: QueryService):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await _write_json(writer, 413, {"error": "body too large"}, False)
+                    break
+                raw = await reader.readexactly(length) if length else b""
+
+                if method == "GET" and path == "/health":
+                    status, payload = 200, {"status": "ok"}
+                elif method == "GET" and path == "/stats":
+                    status, payload = 200, service.stats()
+                elif method == "GET" and path == "/metrics":
+                    await _write_body(writer, 200, metrics.prometheus_text().encode("utf-8"),
+                                      "text/plain; version=0.0.4; charset=utf-8", keep_alive)
+                    if not keep_alive:
+                        break
+                    continue
+                elif method == "POST" and path == "/ask":
+                    try:
+                        body = json.loads(raw or b"{}")
+                    except ValueError:
+                        status, payload = 400, {"error": "invalid JSON"}
+                    else:
+                        if not isinstance(body, dict):
+                            status, payload = 400, {"error": "body must be a JSON object"}
+                        else:
+                            try:
+                                status, payload = await service.ask(body)
+                            except Exception as e:  # Qdrant down, model error, ...: answer 500, keep serving
+                                print(f"❌ POST /ask failed: {e!r}", file=sys.stderr)
+                                traceback.print_exc()
+                                status, payload = 500, {"error": f"internal error: {type(e).__name__}"}
+                else:
+                    status, payload = 404, {"error": "not found"}
+                await _write_json(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(service: QueryService, host: str = SERVE_HOST, port: int = SERVE_PORT):
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"🚀 Serving on http://{host}:{port}  (POST /ask, GET /health, GET /stats, GET /metrics)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edu_Bot query service")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--qdrant", choices=["remote", "memory", "local"], default="remote",
+                        help="remote = URL_QDRANT from .env, memory = local in-process Qdrant, "
+                             "local = persisted stores under Indexes/ (offline)")
+    parser.add_argument("--seed", type=Path, help="Cleaned JSONL tree to load into --qdrant memory")
+    args = parser.parse_args()
+
+    load_dotenv(ENV_PATH)
+    metrics.setup()
+    if args.qdrant == "memory":
+        client = QdrantClient(":memory:")
+    else:
+        client = load_search_client(args.qdrant)
+
+    embed = load_embed_model()
+    if args.seed:
+        seed_collections(client, embed, args.seed)
+    llm = load_llm()  # ممكن يكون None → sources only
+    asyncio.run(serve(QueryService(client, embed, llm, load_reranker()), args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold-start report for the ask.py CLI.
+
+1) Runs `python -X importtime -c "import ask"` in a fresh process and lists the
+   slowest imports (cumulative µs, as printed by -X importtime).
+2) Times each background loader of ask.start_warmup() (search client, embeddings,
+   LLM, reranker) with --warmup.
+
+Exits with status 1 when `import ask` takes longer than --budget-ms or pulls in one
+of HEAVY_MODULES at import time, so a regression in the lazy imports is caught.
+
+    python app/startup_report.py [--top 15] [--budget-ms 1500] [--warmup] [--out startup.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "llama_index", "qdrant_client",
+                 "onnxruntime")
+
+
+def import_times(module: str = "ask") -> list:
+    """[(module, self_us, cumulative_us)] for one `import module` in a fresh interpreter."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=APP_DIR, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in out.stderr.splitlines():
+        # "import time:       123 |        456 |   package.module"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def warmup_times() -> dict:
+    """Seconds per background loader of ask.start_warmup(), plus the wall time until all are ready."""
+    sys.path.insert(0, str(APP_DIR))
+    from dotenv import load_dotenv
+    import ask
+
+    load_dotenv(ask.ENV_PATH)
+    start = time.perf_counter()
+    result = {}
+    for name, future in ask.start_warmup().items():
+        try:
+            result[name] = round(future.result()[1], 3)
+        except Exception as e:
+            result[name] = f"error: {e}"
+    result["all ready"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ask.py cold-start report")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=1500, help="max time for `import ask`")
+    parser.add_argument("--warmup", action="store_true", help="also time the background model loading")
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args()
+
+    rows = import_times("ask")
+    total_ms = next((cum for name, _, cum in rows if name == "ask"), 0) / 1000
+    heavy = sorted({name.split(".")[0] for name, _, _ in rows} & set(HEAVY_MODULES))
+
+    print(f"📦 import ask: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms), {len(rows)} modules")
+    print(f"{'cumulative_ms':>14}{'self_ms':>9}  module")
+    for name, self_us, cum_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>14.1f}{self_us / 1000:>9.1f}  {name}")
+    if heavy:
+        print(f"⚠️ heavy modules imported by `import ask`: {', '.join(heavy)}")
+
+    report = {"import_ask_ms": round(total_ms, 1), "budget_ms": args.budget_ms, "heavy_imports": heavy,
+              "slowest": [{"module": n, "self_ms": s / 1000, "cumulative_ms": c / 1000}
+                          for n, s, c in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]]}
+    if args.warmup:
+        report["warmup_s"] = warmup_times()
+        print("⏱️ warm-up: " + ", ".join(f"{k} {v}" for k, v in report["warmup_s"].items()))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    ok = total_ms <= args.budget_ms and not heavy
+    print("✅ startup OK" if ok else "❌ startup regression")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for Groq's OpenAI-compatible chat API, with Groq-style rate limits,
+for exercising batch_ask.py (and LLM_BACKEND=http in ask.py / serve.py) offline.
+tests/test_batch_stub.py drives batch_ask.BatchRunner against it (retries, 429s, output).
+
+    POST /openai/v1/chat/completions   (any path ending in /chat/completions)
+    GET  /health
+    GET  /stats    requests, 429s, injected errors, peak concurrency
+
+- Answers like ask.StubLLM (first retrieved snippet) after --latency seconds;
+  "stream": true sends the answer word by word as server-sent events.
+- More than --rpm requests or --tpm tokens (prompt estimate + answer) within the
+  last 60 s get 429 with retry-after and x-ratelimit-* headers, as Groq does.
+- --error-rate of the requests fail with 503 (transient errors to retry).
+
+    python app/stub_llm_server.py --port 8900 --rpm 60 --tpm 20000 --latency 0.5
+    LLM_BACKEND=http GROQ_API_KEY=x GROQ_API_BASE=http://127.0.0.1:8900/openai/v1 \
+        python app/batch_ask.py worksheet.jsonl --out answers.jsonl
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import deque
+
+from ask import StubLLM
+from context_packer import estimate_tokens
+
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8900
+WINDOW_S = 60.0  # Groq limits are per minute
+MAX_BODY_BYTES = 1024 * 1024
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+            429: "Too Many Requests", 503: "Service Unavailable"}
+
+
+class RateLimits:
+    """Sliding-window request / token counters for the last WINDOW_S seconds."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._events = deque()  # (time, tokens)
+        self._tokens = 0
+
+    def _expire(self, now: float) -> None:
+        while self._events and self._events[0][0] <= now - WINDOW_S:
+            self._tokens -= self._events.popleft()[1]
+
+    def admit(self, tokens: int):
+        """(True, headers) and the request is counted, or (False, headers) with retry-after."""
+        now = time.monotonic()
+        self._expire(now)
+        over_requests = self.rpm and len(self._events) >= self.rpm
+        over_tokens = self.tpm and self._tokens + tokens > self.tpm and self._events
+        retry_after = 0.0
+        if over_requests:
+            retry_after = self._events[0][0] + WINDOW_S - now
+        elif over_tokens:
+            freed = 0  # wait until enough of the oldest requests leave the window
+            for t, n in self._events:
+                freed += n
+                if self._tokens - freed + tokens <= self.tpm:
+                    retry_after = t + WINDOW_S - now
+                    break
+        if not (over_requests or over_tokens):
+            self._events.append((now, tokens))
+            self._tokens += tokens
+        reset = self._events[0][0] + WINDOW_S - now if self._events else 0.0
+        headers = {
+            "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self._events))),
+            "x-ratelimit-limit-tokens": str(self.tpm),
+            "x-ratelimit-remaining-tokens": str(max(0, self.tpm - self._tokens)),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        }
+        if over_requests or over_tokens:
+            headers["retry-after"] = str(max(1, math.ceil(retry_after)))
+            return False, headers
+        return True, headers
+
+
+class StubChatServer:
+    def __init__(self, rpm: int = 30, tpm: int = 12000, latency_s: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.limits = RateLimits(rpm, tpm)
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.llm = StubLLM()
+        self._random = random.Random(seed)
+        self._in_flight = 0
+        self.counters = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "max_in_flight": 0}
+
+    def stats(self) -> dict:
+        return dict(self.counters, in_flight=self._in_flight)
+
+    async def chat(self, body: dict, writer: asyncio.StreamWriter) -> None:
+        self.counters["requests"] += 1
+        messages = body.get("messages") or []
+        prompt = str(messages[-1].get("content") or "") if messages else ""
+        if not prompt:
+            await _write(writer, 400, {"error": {"message": "messages required"}})
+            return
+        answer = self.llm._text(prompt)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(answer)
+
+        admitted, headers = self.limits.admit(prompt_tokens + completion_tokens)
+        if not admitted:
+            self.counters["rate_limited"] += 1
+            await _write(writer, 429, {"error": {"message": "Rate limit reached", "type": "tokens",
+                                                 "code": "rate_limit_exceeded"}}, headers)
+            return
+        if self._random.random() < self.error_rate:
+            self.counters["errors"] += 1
+            await _write(writer, 503, {"error": {"message": "Service Unavailable"}}, headers)
+            return
+
+        self._in_flight += 1
+        self.counters["max_in_flight"] = max(self.counters["max_in_flight"], self._in_flight)
+        try:
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            model = body.get("model", "stub")
+            if body.get("stream"):
+                await self._stream(writer, completion_id, model, answer, headers)
+            else:
+                await asyncio.sleep(self.latency_s)
+                await _write(writer, 200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }, headers)
+            self.counters["ok"] += 1
+        finally:
+            self._in_flight -= 1
+
+    async def _stream(self, writer, completion_id: str, model: str, answer: str, headers: dict) -> None:
+        """Server-sent events until [DONE], then the connection closes (no Content-Length)."""
+        head = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n{head}"
+                      f"Connection: close\r\n\r\n").encode("latin-1"))
+        words = re.findall(r"\S+\s*", answer) or [""]
+        for w in words:
+            await asyncio.sleep(self.latency_s / len(words))
+            event = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": w}, "finish_reason": None}]}
+            writer.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await writer.drain()
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+
+
+async def _write(writer: asyncio.StreamWriter, status: int, payload: dict, headers: dict = None) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = "".join(f"{k}: {v}\r\n" for k, v in (headers or {}).items())
+    writer.write((f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+                  f"Content-Type: application/json; charset=utf-8\r\n"
+                  f"Content-Length: {len(body)}\r\n{head}"
+                  f"Connection: close\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+def make_handler(server: StubChatServer):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # One request per connection, as urllib sends them
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = line.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY_BYTES:
+                await _write(writer, 413, {"error": {"message": "body too large"}})
+                return
+            raw = await reader.readexactly(length) if length else b""
+
+            if method == "GET" and path == "/health":
+                await _write(writer, 200, {"status": "ok"})
+            elif method == "GET" and path == "/stats":
+                await _write(writer, 200, server.stats())
+            elif method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    await _write(writer, 400, {"error": {"message": "invalid JSON"}})
+                else:
+                    await server.chat(body, writer)
+            else:
+                await _write(writer, 404, {"error": {"message": "not found"}})
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(server: StubChatServer, host: str = STUB_HOST, port: int = STUB_PORT):
+    listener = await asyncio.start_server(make_handler(server), host, port)
+    print(f"🧪 Stub LLM on http://{host}:{port}/openai/v1  ({server.limits.rpm} RPM, "
+          f"{server.limits.tpm} TPM, latency {server.latency_s}s, error rate {server.error_rate})")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible chat server with Groq-style rate limits")
+    parser.add_argument("--host", default=STUB_HOST)
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--rpm", type=int, default=30, help="requests per minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=12000, help="tokens per minute (0 = unlimited)")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(serve(StubChatServer(args.rpm, args.tpm, args.latency, args.error_rate, args.seed),
+                      args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
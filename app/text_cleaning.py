@@ -0,0 +1,93 @@
+# text_cleaning.py
+"""
+Page text cleaning and math detection for extract_books, in one scan per page.
+
+Output is identical to the original implementations (kept in bench_cleaning.py,
+which checks the equivalence over eval/cleaning_corpus.jsonl and real pages):
+
+count_math_symbols(text) == len(detect_math_symbols(text))
+    The eight patterns are counted independently (their matches overlap, e.g. "1/2"
+    counts for both "/" and the fraction). Symbols, Greek letters and function names
+    have disjoint characters, so they share one case-sensitive scan: re.IGNORECASE is
+    replaced by the characters it folds to (e.g. "σ" also matches "ς" and "Σ", "s" also
+    "ſ"), and the leading \\b by a look-behind after the first character, which lets the
+    regex engine skip ahead to candidate characters. The other patterns can only match
+    when their trigger character ("/", "^", "=", "(", "°") is in the text, which a
+    substring test rules out for most pages.
+
+clean_text(text)
+    Markers only needed placeholders to keep their digits out of the Arabic → ASCII
+    digit mapping; markers written by extract_books use ASCII digits, so the text is
+    mapped (str.replace per digit present, much faster than str.translate on non-ASCII
+    text) and filtered line by line. A text that has Arabic-Indic digits inside a
+    marker, or the placeholder text itself, takes the placeholder path.
+"""
+import re
+
+_MARKER = re.compile(r'\[MATH_DETECTED:.*?\]|\[DIAGRAM_DETECTED:.*?\]|\[MATH_BOOK_SUMMARY:.*?\]')
+_PLACEHOLDER = "__MATH_MARKER_"
+_DIGIT_PAIRS = tuple(zip("٠١٢٣٤٥٦٧٨٩", "0123456789"))
+_ARABIC_DIGIT = re.compile("[٠-٩]")
+# Lines of 1-2 characters are kept only if they contain one of these
+_SHORT_LINE_CHARS = frozenset("+-×÷*/=<>≤≥≠±√∑∏∫°αβγδθπλμσφψω^()[]")
+
+# [+\-×÷*/=<>≤≥≠±√∑∏∫] and [αβγδθπλμσφψω] with the case folds of re.IGNORECASE
+_SYMBOLS = r"*+\-/<=>±×÷∏∑√∫≠≤≥"
+_GREEK = "µΑΒΓΔΘΛΜΠΣΦΨΩαβγδθλμπςσφψωϐϑϕϖϴΩ"
+# \b(sin|cos|tan|log|ln)\b, re.IGNORECASE
+_FUNCTIONS = (r"(?<!\w.)(?:(?<=[Ssſ])[Iiİı][Nn]|(?<=[Cc])[Oo][Ssſ]|(?<=[Tt])[Aa][Nn]"
+              r"|(?<=[Ll])(?:[Oo][Gg]|[Nn]))(?!\w)")
+_MATH_COMBINED = re.compile(rf"[{_SYMBOLS}{_GREEK}SsſCcTtLl](?:(?<=[{_SYMBOLS}{_GREEK}])|{_FUNCTIONS})")
+# (trigger character, pattern)
+_MATH_GUARDED = (
+    ("/", re.compile(r'\d+/\d+')),                     # fractions like 1/2
+    ("^", re.compile(r'\d+\^\d+')),                    # powers like 2^3
+    ("=", re.compile(r'[xXyY]\s*=')),                  # variables with equals
+    ("(", re.compile(r'\([^)]*[+\-*/][^)]*\)')),       # expressions in parentheses
+    ("°", re.compile(r'\d+\s*°')),                     # degrees
+)
+
+
+def count_math_symbols(text: str) -> int:
+    """Number of math elements in a page (symbols, fractions, powers, functions, ...)."""
+    count = len(_MATH_COMBINED.findall(text))
+    for trigger, pattern in _MATH_GUARDED:
+        if trigger in text:
+            count += len(pattern.findall(text))
+    return count
+
+
+def _ascii_digits(text: str) -> str:
+    for arabic, ascii_digit in _DIGIT_PAIRS:
+        if arabic in text:
+            text = text.replace(arabic, ascii_digit)
+    return text
+
+
+def _keep_line(line: str) -> bool:
+    return len(line) > 2 or (bool(line) and not _SHORT_LINE_CHARS.isdisjoint(line))
+
+
+def _clean_with_placeholders(text: str) -> str:
+    """Marker-protecting variant for the rare inputs where the placeholders change the output."""
+    markers = []
+    for match in _MARKER.finditer(text):
+        placeholder = f"{_PLACEHOLDER}{len(markers)}__"
+        markers.append(match.group())
+        text = text.replace(match.group(), placeholder)
+    lines = [s for s in (line.strip() for line in _ascii_digits(text).split("\n"))
+             if _keep_line(s) or _PLACEHOLDER in s]
+    cleaned_text = "\n".join(lines)
+    for i, marker in enumerate(markers):
+        cleaned_text = cleaned_text.replace(f"{_PLACEHOLDER}{i}__", marker)
+    return cleaned_text
+
+
+def clean_text(text: str) -> str:
+    """Simple text cleaning for Arabic content with math preservation"""
+    if _PLACEHOLDER in text or ("_DETECTED:" in text or "_SUMMARY:" in text) and any(
+            _ARABIC_DIGIT.search(m) for m in _MARKER.findall(text)):
+        return _clean_with_placeholders(text)
+    # Normalize Arabic digits, strip lines and drop empty / meaningless short ones
+    return "\n".join(s for s in (line.strip() for line in _ascii_digits(text).split("\n"))
+                     if _keep_line(s))
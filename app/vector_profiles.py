@@ -0,0 +1,136 @@
+# vector_profiles.py
+"""
+Storage profiles for the Qdrant collections (VECTOR_PROFILE). build_index.py, serve.py
+and migrate_collections.py apply them when creating a collection. Queries pass the
+search parameters of the profile a collection was actually created with (its
+quantization config, read once per collection), not the current VECTOR_PROFILE:
+
+  float32  plain float32 vectors in RAM (the original setup)
+  int8     scalar quantization: an int8 copy in RAM (4x smaller), float32 vectors
+           on disk. The HNSW search runs on the int8 copy for oversampling × limit
+           candidates, which are rescored with the float32 vectors.
+  binary   1 bit per dimension in RAM (32x smaller), same oversampling and rescoring.
+           384 dimensions are few for binary quantization, hence more oversampling.
+
+HNSW_M / HNSW_EF_CONSTRUCT shape the graph when a collection is created (Qdrant's
+defaults: 16 / 100); HNSW_EF is the search beam (0 = Qdrant's default). A profile only
+takes effect for new collections: rebuild with `build_index.py` after recreating, or
+change an existing one with client.update_collection(quantization_config=...).
+
+    python app/bench_quantization.py --url http://localhost:6333   # memory, p95, recall@10
+"""
+import os
+import threading
+import weakref
+
+# quantization: None | "scalar" | "binary"; oversampling: candidates fetched per result before rescoring
+PROFILES = {
+    "float32": {"quantization": None, "on_disk": False, "oversampling": 1.0},
+    "int8": {"quantization": "scalar", "on_disk": True, "oversampling": 2.0},
+    "binary": {"quantization": "binary", "on_disk": True, "oversampling": 4.0},
+}
+VECTOR_PROFILE = os.getenv("VECTOR_PROFILE", "float32")            # float32 | int8 | binary
+HNSW_M = int(os.getenv("HNSW_M", "16"))                            # graph links per node
+HNSW_EF_CONSTRUCT = int(os.getenv("HNSW_EF_CONSTRUCT", "100"))     # build-time beam
+HNSW_EF = int(os.getenv("HNSW_EF", "0"))                           # search beam, 0 = Qdrant default
+QUANT_OVERSAMPLING = float(os.getenv("QUANT_OVERSAMPLING", "0"))   # 0 = the profile's default
+SCALAR_QUANTILE = 0.99  # int8 range covers this share of the values (clips outliers)
+
+_collection_profiles = weakref.WeakKeyDictionary()  # client -> {collection: profile}
+_collection_profiles_lock = threading.Lock()
+
+
+def _profile(name: str) -> dict:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown VECTOR_PROFILE: {name} (choose from {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def create_kwargs(dim: int, profile: str = VECTOR_PROFILE,
+                  m: int = HNSW_M, ef_construct: int = HNSW_EF_CONSTRUCT) -> dict:
+    """vectors_config / hnsw_config / quantization_config for client.create_collection."""
+    from qdrant_client import models
+    spec = _profile(profile)
+    kwargs = {
+        "vectors_config": models.VectorParams(size=dim, distance=models.Distance.COSINE,
+                                              on_disk=spec["on_disk"] or None),
+        "hnsw_config": models.HnswConfigDiff(m=m, ef_construct=ef_construct),
+    }
+    if spec["quantization"] == "scalar":
+        kwargs["quantization_config"] = models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=SCALAR_QUANTILE, always_ram=True))
+    elif spec["quantization"] == "binary":
+        kwargs["quantization_config"] = models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True))
+    return kwargs
+
+
+def create_collection(client, name: str, dim: int, profile: str = VECTOR_PROFILE, recreate: bool = False) -> None:
+    """Creates `name` with the profile (dropping it first with recreate=True)."""
+    if recreate and client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(name, **create_kwargs(dim, profile))
+    with _collection_profiles_lock:
+        _collection_profiles.get(client, {}).pop(name, None)
+
+
+def search_params(profile: str = VECTOR_PROFILE, hnsw_ef: int = HNSW_EF,
+                  oversampling: float = QUANT_OVERSAMPLING):
+    """
+    SearchParams for query_points of a collection with this profile, or None when the
+    server defaults apply (float32 without HNSW_EF), so nothing extra is sent.
+    """
+    spec = _profile(profile)
+    if spec["quantization"] is None and not hnsw_ef:
+        return None
+    from qdrant_client import models
+    quantization = None
+    if spec["quantization"] is not None:
+        quantization = models.QuantizationSearchParams(
+            ignore=False, rescore=True, oversampling=oversampling or spec["oversampling"])
+    return models.SearchParams(hnsw_ef=hnsw_ef or None, quantization=quantization)
+
+
+def profile_of(quantization_config) -> str:
+    """The profile matching a collection's quantization config (product quantization counts as int8)."""
+    if quantization_config is None:
+        return "float32"
+    return "binary" if getattr(quantization_config, "binary", None) is not None else "int8"
+
+
+def collection_profile(client, name: str) -> str:
+    """
+    The profile `name` was created with, from get_collection (cached per client and
+    collection). Stores without get_collection (local_index) count as float32; when the
+    lookup fails, VECTOR_PROFILE is assumed for this call.
+    """
+    with _collection_profiles_lock:
+        profile = _collection_profiles.get(client, {}).get(name)
+    if profile is not None:
+        return profile
+    if not hasattr(client, "get_collection"):
+        return "float32"
+    try:
+        profile = profile_of(client.get_collection(name).config.quantization_config)
+    except Exception:
+        return VECTOR_PROFILE
+    with _collection_profiles_lock:
+        _collection_profiles.setdefault(client, {})[name] = profile
+    return profile
+
+
+def collection_search_params(client, name: str, hnsw_ef: int = HNSW_EF,
+                             oversampling: float = QUANT_OVERSAMPLING):
+    """search_params() for the profile collection `name` was created with."""
+    return search_params(collection_profile(client, name), hnsw_ef, oversampling)
+
+
+def estimated_ram_mb(n_points: int, dim: int, profile: str = VECTOR_PROFILE, m: int = HNSW_M) -> float:
+    """
+    Vector + HNSW link memory that stays in RAM for n_points (payloads excluded):
+    float32 vectors, or only the quantized copy when the originals are on disk.
+    """
+    spec = _profile(profile)
+    bytes_per_vector = {None: 4 * dim, "scalar": dim, "binary": (dim + 7) // 8}[spec["quantization"]]
+    links = n_points * m * 2 * 4  # ~2m neighbours on level 0, 4-byte ids
+    return (n_points * bytes_per_vector + links) / (1024 * 1024)
@@ -0,0 +1,111 @@
+"""
+Shared fixtures. The app/ scripts import each other as top-level modules, so app/
+goes on sys.path; the environment is pinned before any of them reads it at import.
+"""
+import hashlib
+import importlib
+import json
+import os
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.insert(0, str(APP_DIR))
+os.environ["HYBRID_SEARCH"] = "0"
+os.environ["COLLECTION_LAYOUT"] = "per_collection"
+os.environ["VECTOR_PROFILE"] = "float32"
+os.environ["LLM_BACKEND"] = "stub"
+
+DIM = 64
+
+
+class HashEmbedding:
+    """Deterministic bag-of-words vectors (hashed tokens), in place of the E5 model."""
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self.calls = 0
+
+    def get_text_embedding(self, text: str):
+        self.calls += 1
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in (text or "").lower().split():
+            vec[int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec + 1.0 / np.sqrt(self.dim)).tolist()
+
+    def get_text_embedding_batch(self, texts, **_):
+        return [self.get_text_embedding(t) for t in texts]
+
+    get_query_embedding = get_text_embedding
+
+
+@pytest.fixture
+def embed():
+    return HashEmbedding()
+
+
+@pytest.fixture
+def cleaned_tree(tmp_path):
+    """Cleaned/<subject>/<grade>/<term>/*.jsonl with a few maths and science chunks for g5/t1."""
+    chunks = {
+        "testmath": ["fractions add the numerators when denominators match",
+                     "multiplication of whole numbers and times tables"],
+        "testscience": ["plants need water sunlight and air to grow"],
+    }
+    for subject, texts in chunks.items():
+        folder = tmp_path / "Cleaned" / subject / "g5" / "t1"
+        folder.mkdir(parents=True)
+        with open(folder / f"{subject}_cleaned.jsonl", "w", encoding="utf-8") as f:
+            for i, text in enumerate(texts):
+                md = {"source": f"{subject}.pdf", "page": i + 1, "chunk_id": i, "subject": subject,
+                      "grade": "g5", "term": "t1"}
+                f.write(json.dumps({"text": text, "metadata": md}, ensure_ascii=False) + "\n")
+    return tmp_path / "Cleaned"
+
+
+@pytest.fixture
+def build_index(tmp_path, monkeypatch):
+    """
+    build_index with HashEmbedding for the model and an in-memory Qdrant; manifests and
+    BM25 indexes go under tmp_path. (The module creates its client and model at import.)
+    """
+    import embeddings
+    import index_manifest
+    import lexical_index
+    monkeypatch.setenv("URL_QDRANT", "http://127.0.0.1:1")  # never contacted: replaced below
+    monkeypatch.setenv("API_KEY_QDRANT", "test")
+    monkeypatch.setattr(embeddings, "load_embed_model", lambda *args, **kwargs: HashEmbedding())
+    monkeypatch.setattr(embeddings, "EMBED_BACKEND", "onnx")  # no llama_index Settings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        module = importlib.import_module("build_index")
+
+    warnings.filterwarnings("ignore", category=UserWarning)  # :memory: ignores HNSW/quantization
+    from qdrant_client import QdrantClient
+    monkeypatch.setattr(module, "QDRANT_CLIENT", QdrantClient(":memory:"))
+    monkeypatch.setattr(module, "EMBED_MODEL", HashEmbedding())
+    monkeypatch.setattr(module, "VECTOR_DIM", DIM)
+    monkeypatch.setattr(index_manifest, "MANIFEST_DIR", tmp_path / "manifests")
+    monkeypatch.setattr(lexical_index, "LEXICAL_DIR", tmp_path / "lexical")
+    return module
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """make_pdf(texts, name="book.pdf") → path of a PDF with one page of native text per entry."""
+    import fitz
+
+    def make(texts, name="book.pdf"):
+        doc = fitz.open()
+        for text in texts:
+            doc.new_page().insert_text((72, 72), text)
+        path = tmp_path / name
+        doc.save(str(path))
+        doc.close()
+        return path
+    return make
@@ -0,0 +1,16 @@
+from batch_ask import load_items
+
+
+def test_load_items_skips_malformed_lines(tmp_path, capsys):
+    path = tmp_path / "worksheet.jsonl"
+    path.write_text('{"question": "ناتج 12 × 4", "grade": 5, "term": 1}\n'
+                    '{"question": "broken\n'
+                    '\n'
+                    '["not", "an", "object"]\n'
+                    '{"id": "q3", "question": "ما هي الكسور"}\n', encoding="utf-8")
+
+    items = load_items(path, grade=4, term=2)
+
+    assert [(i["index"], i["id"], i["grade"], i["term"]) for i in items] == [(0, 0, 5, 1), (1, "q3", 4, 2)]
+    err = capsys.readouterr().err
+    assert f"{path}:2: skipped" in err and f"{path}:4: skipped" in err
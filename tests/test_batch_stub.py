@@ -0,0 +1,117 @@
+"""batch_ask.BatchRunner against stub_llm_server over HTTP: retries, rate limits, output rows."""
+import asyncio
+import json
+import threading
+import time
+import warnings
+
+import pytest
+from qdrant_client import QdrantClient
+
+import batch_ask
+import serve
+import stub_llm_server
+from ask import HttpChatLLM
+from batch_ask import BatchRunner, GroqLimiter, TokenBucket
+
+
+@pytest.fixture
+def start_stub():
+    """start_stub(**StubChatServer kwargs) → (stub, api_base); servers stop after the test."""
+    loops = []
+
+    def start(**kwargs):
+        stub = stub_llm_server.StubChatServer(**kwargs)
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(
+            asyncio.start_server(stub_llm_server.make_handler(stub), "127.0.0.1", 0))
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        loops.append((loop, server))
+        return stub, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/openai/v1"
+
+    yield start
+    for loop, server in loops:
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+@pytest.fixture
+def client(embed, cleaned_tree):
+    warnings.filterwarnings("ignore", category=UserWarning)
+    client = QdrantClient(":memory:")
+    serve.seed_collections(client, embed, cleaned_tree, layout="per_collection")
+    return client
+
+
+def _items(n):
+    # different numbers → different answer cache keys, so every question reaches the LLM
+    return [{"index": i, "id": f"q{i}", "question": f"how do fractions add {i}", "grade": 5, "term": 1}
+            for i in range(n)]
+
+
+def _run(client, embed, api_base, items, **kwargs):
+    rows = []
+    runner = BatchRunner(client, embed, HttpChatLLM(api_base, "test-key", "stub"), write=rows.append, **kwargs)
+    asyncio.run(runner.run(items))
+    return runner, rows
+
+
+def test_transient_errors_are_retried_with_backoff(monkeypatch, client, embed, start_stub):
+    monkeypatch.setattr(batch_ask, "BACKOFF_BASE_S", 0.01)
+    stub, api_base = start_stub(rpm=0, tpm=0, latency_s=0.0, error_rate=0.4, seed=1)
+
+    runner, rows = _run(client, embed, api_base, _items(10), limiter=GroqLimiter(0, 0), max_retries=10)
+
+    assert all(row.get("answer") for row in rows)
+    assert runner.counters["retries"] == stub.counters["errors"] > 0
+    assert sum(row["attempts"] for row in rows) == stub.counters["requests"]
+    assert runner.counters["rate_limited"] == 0
+
+
+def test_429_pauses_the_workers_until_retry_after(monkeypatch, client, embed, start_stub):
+    monkeypatch.setattr(stub_llm_server, "WINDOW_S", 2.0)  # retry-after of 1-2 s instead of up to 60 s
+    stub, api_base = start_stub(rpm=3, tpm=0, latency_s=0.0)
+
+    started = time.monotonic()
+    runner, rows = _run(client, embed, api_base, _items(5), limiter=GroqLimiter(0, 0), llm_concurrency=5)
+
+    assert all(row.get("answer") for row in rows)
+    assert runner.counters["rate_limited"] == stub.counters["rate_limited"] > 0
+    assert time.monotonic() - started >= 1.0  # waited out a retry-after (the stub sends at least 1 s)
+    assert stub.counters["ok"] == 5
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=20.0, capacity=1.0)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire(1)
+
+    started = time.monotonic()
+    asyncio.run(take(5))
+    assert time.monotonic() - started >= 4 / 20 * 0.9  # first from the full bucket, then 20/s
+
+
+def test_output_rows(client, embed, start_stub, tmp_path):
+    _, api_base = start_stub(rpm=0, tpm=0, latency_s=0.0)
+    items = _items(3) + [{"index": 3, "id": "bad", "question": "", "grade": 5, "term": 1},
+                         {"index": 4, "id": "g3", "question": "fractions", "grade": 3, "term": 2}]
+    out = tmp_path / "answers.jsonl"
+    with open(out, "w", encoding="utf-8") as f:
+        runner = BatchRunner(client, embed, HttpChatLLM(api_base, "test-key", "stub"),
+                             write=lambda row: f.write(json.dumps(row, ensure_ascii=False) + "\n"),
+                             limiter=GroqLimiter(0, 0))
+        asyncio.run(runner.run(items))
+
+    rows = {row["id"]: row for row in map(json.loads, out.read_text(encoding="utf-8").splitlines())}
+    assert set(rows) == {"q0", "q1", "q2", "bad", "g3"}
+    for i in range(3):
+        row = rows[f"q{i}"]
+        assert row["index"] == i and row["grade"] == 5 and row["term"] == 1
+        assert row["answer"] and row["attempts"] == 1
+        assert row["sources"][0]["collection"] == "testmath_g5_t1"
+        assert {"retrieve", "llm_wait", "generate", "total"} <= set(row["timings_ms"])
+    assert "need question" in rows["bad"]["error"]
+    assert "_g3_t2" in rows["g3"]["error"]
+    assert runner.summary()["answered"] == 3
@@ -0,0 +1,67 @@
+import json
+
+import chunk_records
+import index_manifest
+import lexical_index
+import metrics
+
+
+def _ids(client, collection):
+    points, _ = client.scroll(collection, limit=100)
+    return {p.id for p in points}
+
+
+def _index_counts():
+    return {c["labels"]["result"]: c["value"] for c in metrics.snapshot()["counters"]
+            if c["name"] == "index_points_total"}
+
+
+def test_rerun_embeds_changed_chunks_only_and_prunes_removed_files(build_index, cleaned_tree, monkeypatch):
+    monkeypatch.setattr(build_index, "CLEANED_ROOT", str(cleaned_tree))
+    client = build_index.QDRANT_CLIENT
+    math_file = cleaned_tree / "testmath" / "g5" / "t1" / "testmath_cleaned.jsonl"
+    science_file = cleaned_tree / "testscience" / "g5" / "t1" / "testscience_cleaned.jsonl"
+    math_ids = {pid for pid, _, _ in chunk_records.iter_records(math_file)}
+    science_ids = {pid for pid, _, _ in chunk_records.iter_records(science_file)}
+
+    metrics.reset()
+    build_index.insert_into_qdart()
+    assert _index_counts() == {"upserted": 3, "unchanged": 0}
+    assert _ids(client, "testmath_g5_t1") == math_ids
+    assert _ids(client, "testscience_g5_t1") == science_ids
+    assert set(index_manifest.load_manifest("testmath_g5_t1")["testmath_cleaned.jsonl"]) == math_ids
+
+    lines = math_file.read_text(encoding="utf-8").splitlines()
+    first = json.loads(lines[0])
+    first["text"] = "fractions add the numerators and keep the denominator"
+    math_file.write_text("\n".join([json.dumps(first, ensure_ascii=False)] + lines[1:]) + "\n", encoding="utf-8")
+    science_file.unlink()
+
+    metrics.reset()
+    embedded_before = build_index.EMBED_MODEL.calls
+    build_index.insert_into_qdart()
+
+    assert _index_counts() == {"upserted": 1, "unchanged": 1, "deleted": 1}
+    assert build_index.EMBED_MODEL.calls - embedded_before == 1
+    assert _ids(client, "testmath_g5_t1") == math_ids
+    changed, = client.retrieve("testmath_g5_t1", [chunk_records.parse_record(first, 0)[0]], with_payload=True)
+    assert changed.payload["text"] == first["text"]
+    assert _ids(client, "testscience_g5_t1") == set()
+    assert index_manifest.load_manifest("testscience_g5_t1") == {}
+    assert not (lexical_index.LEXICAL_DIR / "testscience_g5_t1.npz").exists()
+    assert (lexical_index.LEXICAL_DIR / "testmath_g5_t1.npz").exists()
+
+
+def test_records_gone_from_a_file_are_deleted(build_index, cleaned_tree, monkeypatch):
+    monkeypatch.setattr(build_index, "CLEANED_ROOT", str(cleaned_tree))
+    build_index.insert_into_qdart()
+    math_file = cleaned_tree / "testmath" / "g5" / "t1" / "testmath_cleaned.jsonl"
+    kept = math_file.read_text(encoding="utf-8").splitlines()[:1]
+    math_file.write_text(kept[0] + "\n", encoding="utf-8")
+
+    metrics.reset()
+    build_index.insert_into_qdart()
+
+    assert _index_counts() == {"upserted": 0, "unchanged": 2, "deleted": 1}  # + the science chunk
+    assert _ids(build_index.QDRANT_CLIENT, "testmath_g5_t1") == {
+        pid for pid, _, _ in chunk_records.iter_records(math_file)}
@@ -0,0 +1,55 @@
+import pytest
+
+import chunking
+from chunking import chunk_pages
+
+
+@pytest.fixture(autouse=True)
+def one_token_per_word(monkeypatch):
+    monkeypatch.setattr(chunking, "count_tokens_batch", lambda texts: [len(t.split()) for t in texts])
+
+
+def _sentence(n, words=4):
+    return " ".join(f"s{n}w{i}" for i in range(words - 1)) + f" s{n}end."
+
+
+def test_no_chunk_exceeds_the_budget_and_no_word_is_lost():
+    long_sentence = " ".join(f"long{i}" for i in range(45)) + "."
+    pages = [(1, " ".join(_sentence(n, words=3 + n % 5) for n in range(12))),
+             (2, long_sentence + " " + _sentence(99)),
+             (3, "\n".join(_sentence(n) for n in range(100, 106)))]
+
+    chunks = chunk_pages(pages, max_tokens=16, overlap_tokens=0, min_tokens=4)
+
+    assert all(c["n_tokens"] <= 16 for c in chunks)
+    assert all(c["n_tokens"] == len(c["text"].split()) for c in chunks)
+    assert " ".join(c["text"] for c in chunks).split() == " ".join(text for _, text in pages).split()
+
+
+def test_short_page_tail_continues_into_the_next_page():
+    pages = [(1, "tail of page one."), (2, " ".join(_sentence(n) for n in range(3))), (3, _sentence(7))]
+
+    chunks = chunk_pages(pages, max_tokens=20, overlap_tokens=0, min_tokens=8)
+
+    assert [(c["page_start"], c["page_end"], c["n_tokens"]) for c in chunks] == [(1, 2, 16), (3, 3, 4)]
+    assert chunks[0]["text"].startswith("tail of page one. s0w0")
+
+
+@pytest.mark.parametrize("overlap, expected", [(0, [8, 8, 4]), (4, [8, 8, 8, 8])])
+def test_overlap_repeats_the_last_sentence_of_a_full_chunk(overlap, expected):
+    sentences = [_sentence(n) for n in range(5)]
+
+    chunks = chunk_pages([(1, " ".join(sentences))], max_tokens=10, overlap_tokens=overlap, min_tokens=4)
+
+    assert [c["n_tokens"] for c in chunks] == expected
+    if overlap:
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert chunk["text"].startswith(previous["text"].split(". ")[-1])
+
+
+def test_overlap_never_crosses_a_page_boundary():
+    pages = [(1, " ".join(_sentence(n) for n in range(2))), (2, " ".join(_sentence(n) for n in range(2, 4)))]
+
+    chunks = chunk_pages(pages, max_tokens=10, overlap_tokens=4, min_tokens=4)
+
+    assert [(c["page_start"], c["page_end"], c["n_tokens"]) for c in chunks] == [(1, 1, 8), (2, 2, 8)]
@@ -0,0 +1,27 @@
+from context_packer import MIN_SNIPPET_TOKENS, estimate_tokens, pack
+
+
+def _header(i, h):
+    return f"[{i}]"
+
+
+def _texts(blocks):
+    return [b.split("\n", 1)[1] for b in blocks]
+
+
+def test_smaller_later_snippets_that_fit_are_kept():
+    # ~40 tokens left after the first: too little to trim "beta" into, enough for "gamma"
+    hits = [{"text": "alpha " * 40}, {"text": "beta " * 400}, {"text": "gamma " * 5}]
+    blocks, kept, stats = pack(hits, _header, budget=125)
+    assert [h["text"][:4] for h in kept] == ["alph", "gamm"]
+    assert stats["over_budget"] == 1 and stats["trimmed"] == 0
+    assert blocks[1].startswith("[2]")
+
+
+def test_snippet_trimmed_to_almost_nothing_is_dropped():
+    # Only break is right after "ab": trimming would leave "ab …"
+    hits = [{"text": "alpha " * 40}, {"text": "ab " + "x" * 900}]
+    blocks, kept, stats = pack(hits, _header, budget=180)
+    assert len(kept) == 1
+    assert stats["trimmed"] == 0 and stats["over_budget"] == 1
+    assert all(estimate_tokens(t) >= MIN_SNIPPET_TOKENS for t in _texts(blocks))
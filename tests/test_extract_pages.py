@@ -0,0 +1,31 @@
+import extract_books
+
+TEXTS = [f"page {n} of the fractions chapter" for n in range(1, 8)]
+
+
+def _pages(pdf, workers):
+    return [(page_no, text.strip(), method) for page_no, text, method, _ in extract_books.iter_pdf_pages(pdf, workers)]
+
+
+def test_parallel_pages_come_back_in_page_order(make_pdf, monkeypatch):
+    monkeypatch.setattr(extract_books, "PAGE_CACHE", False)
+    pdf = make_pdf(TEXTS)
+
+    pages = _pages(pdf, workers=3)  # 7 pages → ranges of one page spread over 3 processes
+
+    assert pages == [(n, text, "text") for n, text in enumerate(TEXTS, 1)]
+    assert pages == _pages(pdf, workers=0)
+
+
+def test_extract_text_from_pdf_keeps_failed_pages_aligned(make_pdf, monkeypatch):
+    monkeypatch.setattr(extract_books, "PAGE_CACHE", False)
+    real = extract_books._extract_page
+
+    def fail_page_two(doc, i, *args, **kwargs):
+        return ("", "failed", 0.0) if i == 1 else real(doc, i, *args, **kwargs)
+
+    monkeypatch.setattr(extract_books, "_extract_page", fail_page_two)
+    pages, total = extract_books.extract_text_from_pdf(make_pdf(TEXTS[:3]))
+
+    assert total == 3
+    assert [p.strip() for p in pages] == [TEXTS[0], "", TEXTS[2]]
@@ -0,0 +1,23 @@
+from ask import fuse_hits, subject_of_top_hit
+from lexical_index import tokenize
+
+
+def _hit(pid, score, subject):
+    return {"collection": f"{subject}_g5_t1", "id": pid, "score": score, "subject": subject}
+
+
+def test_fusion_keeps_the_dense_score_and_ranks_by_rrf():
+    dense = [_hit("a", 0.91, "math"), _hit("b", 0.90, "science")]
+    lexical = [_hit("b", 12.5, "science"), _hit("c", 7.0, "science")]
+    hits = fuse_hits(dense, lexical)
+
+    assert [h["id"] for h in hits] == ["b", "a", "c"]
+    by_id = {h["id"]: h for h in hits}
+    assert by_id["a"]["score"] == 0.91 and by_id["b"]["score"] == 0.90
+    assert by_id["b"]["bm25_score"] == 12.5
+    assert by_id["c"]["score"] == 0.0  # BM25-only: no dense similarity
+    assert subject_of_top_hit(hits) == "science"
+
+
+def test_arabic_decimal_separator_is_one_number():
+    assert tokenize("٣٫٥ + ٢") == ["3.5", "+", "2"]
@@ -0,0 +1,26 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+
+def _work(seconds):
+    metrics.reset()
+    metrics.observe("extract_book_seconds", seconds)
+    metrics.inc("extract_chunks_total", 3)
+    return metrics.export()
+
+
+def test_worker_metrics_merge_into_the_parent():
+    metrics.reset()
+    metrics.observe("extract_book_seconds", 0.5)
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        for state in pool.map(_work, [0.02, 2.0, 7.0]):
+            metrics.merge(state)
+
+    snap = metrics.snapshot()
+    book, = [h for h in snap["histograms"] if h["name"] == "extract_book_seconds"]
+    assert book["count"] == 4 and book["max"] == 7.0
+    assert abs(book["sum"] - 9.52) < 1e-9
+    assert [c["value"] for c in snap["counters"] if c["name"] == "extract_chunks_total"] == [9]
+    assert "edu_bot_extract_book_seconds_bucket{le=\"+Inf\"} 4" in metrics.prometheus_text()
+    metrics.reset()
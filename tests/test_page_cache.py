@@ -0,0 +1,60 @@
+import shutil
+import time
+
+import fitz
+
+import extract_books
+from page_cache import PageCache, file_fingerprint
+
+
+def _extract(pdf, cache, page=0):
+    doc = fitz.open(str(pdf))
+    try:
+        return extract_books._extract_page(doc, page, False, cache, file_fingerprint(pdf))[:2]
+    finally:
+        doc.close()
+
+
+def test_fingerprint_follows_the_bytes_not_the_path(make_pdf, tmp_path):
+    pdf = make_pdf(["page one"])
+    moved = tmp_path / "moved.pdf"
+    shutil.copy(pdf, moved)
+    other = make_pdf(["page one, corrected"], name="other.pdf")
+
+    assert file_fingerprint(moved) == file_fingerprint(pdf)
+    assert file_fingerprint(other) != file_fingerprint(pdf)
+
+
+def test_pages_are_reused_until_the_pdf_or_the_ocr_settings_change(make_pdf, tmp_path, monkeypatch):
+    cache = PageCache(str(tmp_path / "pages.sqlite"))
+    pdf = make_pdf(["page one"])
+
+    assert _extract(pdf, cache) == ("page one\n", "text")
+    assert _extract(pdf, cache) == ("page one\n", "cached")
+
+    monkeypatch.setattr(extract_books, "OCR_DPI", extract_books.OCR_DPI + 100)
+    assert _extract(pdf, cache)[1] == "text"
+    monkeypatch.setattr(extract_books, "OCR_LANG", "ara+eng")
+    assert _extract(pdf, cache)[1] == "text"
+
+    edited = make_pdf(["page one, corrected"], name="book.pdf")  # same path, new bytes
+    assert _extract(edited, cache) == ("page one, corrected\n", "text")
+    assert (cache.hits, cache.misses) == (1, 4)
+    cache.close()
+
+
+def test_eviction_trims_least_recently_used_pages_to_90_percent(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.sqlite"), max_mb=1000 / (1024 * 1024))  # 1000 bytes
+    for page in range(3):
+        cache.put("book", page, "s", "x" * 300, "text")
+        time.sleep(0.01)
+    cache.get("book", 0, "s")  # page 0 is now more recent than pages 1 and 2
+    time.sleep(0.01)
+
+    cache.put("book", 3, "s", "x" * 300, "text")  # 1200 bytes > 1000 → down to ≤ 900
+
+    kept = [page for page in range(4) if cache.get("book", page, "s") is not None]
+    assert kept == [0, 2, 3]
+    size = cache._conn.execute("SELECT SUM(size) FROM pages").fetchone()[0]
+    assert size <= 0.9 * cache.max_bytes
+    cache.close()
@@ -0,0 +1,141 @@
+import importlib
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from qdrant_client import QdrantClient
+
+import index_manifest
+import lexical_index
+
+BOOKS = {
+    "testmath": ["fractions add the numerators when denominators match",
+                 "multiplication of whole numbers and times tables"],
+    "testscience": ["plants need water sunlight and air to grow"],
+}
+
+
+def _record(subject, i, text):
+    return {"text": text, "metadata": {"source": f"{subject}.pdf", "page": i + 1, "chunk_id": i,
+                                       "subject": subject, "grade": "g5", "term": "t1"}}
+
+
+class FakeExtraction:
+    """
+    process_book stand-in: hands over each book's records and writes its JSONL; a book
+    in `fail_after` fails after that many records (the old JSONL stays, as in the real one).
+    """
+
+    def __init__(self, books):
+        self.books = {subject: [_record(subject, i, t) for i, t in enumerate(texts)]
+                      for subject, texts in books.items()}
+        self.fail_after = {}
+        self.started = []
+
+    def __call__(self, pdf_path, page_workers=0, fmt="jsonl", out_root=None, on_record=None):
+        import extract_books
+        book = Path(pdf_path).stem
+        self.started.append(book)
+        try:
+            for n, record in enumerate(self.books[book]):
+                if n == self.fail_after.get(book):
+                    raise RuntimeError("OCR failed")
+                on_record(record)
+        except Exception:
+            return None
+        out = extract_books.book_output_path(pdf_path, fmt, out_root)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.books[book]),
+                       encoding="utf-8")
+        return out
+
+
+@pytest.fixture
+def pipeline(build_index, tmp_path, monkeypatch):
+    import extract_books
+    module = importlib.import_module("pipeline")
+    monkeypatch.setattr(build_index, "CLEANED_ROOT", str(tmp_path / "Cleaned"))
+    extraction = FakeExtraction(BOOKS)
+    monkeypatch.setattr(extract_books, "process_book", extraction)
+    module.extraction = extraction
+    return module
+
+
+def _pdfs(tmp_path, *books):
+    return [tmp_path / "Books" / book / "g5" / "t1" / f"{book}.pdf" for book in books]
+
+
+def _state(client):
+    """{collection: {point id: payload}} and {collection: manifest} of everything indexed."""
+    points = {c.name: {p.id: p.payload for p in client.scroll(c.name, limit=100, with_payload=True)[0]}
+              for c in client.get_collections().collections}
+    manifests = {name: index_manifest.load_manifest(name) for name in points}
+    return points, manifests
+
+
+def test_pipeline_indexes_like_build_index(pipeline, build_index, tmp_path, monkeypatch):
+    pipeline.run_pipeline(_pdfs(tmp_path, "testmath", "testscience"), queue_size=1)
+    streamed = _state(build_index.QDRANT_CLIENT)
+
+    monkeypatch.setattr(build_index, "QDRANT_CLIENT", QdrantClient(":memory:"))
+    monkeypatch.setattr(index_manifest, "MANIFEST_DIR", tmp_path / "manifests_build_index")
+    build_index.insert_into_qdart()  # same JSONL, written by the pipeline
+
+    assert streamed == _state(build_index.QDRANT_CLIENT)
+    assert {len(points) for points in streamed[0].values()} == {1, 2}
+
+
+def test_failed_book_keeps_its_old_points(pipeline, build_index, tmp_path):
+    pdfs = _pdfs(tmp_path, "testmath", "testscience")
+    pipeline.run_pipeline(pdfs)
+    client = build_index.QDRANT_CLIENT
+    old_points, old_manifests = _state(client)
+    math_jsonl = tmp_path / "Cleaned" / "testmath" / "g5" / "t1" / "testmath_cleaned.jsonl"
+    old_jsonl = math_jsonl.read_text(encoding="utf-8")
+
+    changed = _record("testmath", 0, "fractions add numerators over a common denominator")
+    pipeline.extraction.books["testmath"][0] = changed
+    pipeline.extraction.fail_after["testmath"] = 1  # fails after handing over the changed chunk
+    pipeline.run_pipeline(pdfs)
+
+    points, manifests = _state(client)
+    assert set(points["testmath_g5_t1"]) == set(old_points["testmath_g5_t1"])
+    assert sorted(p["text"] for p in points["testmath_g5_t1"].values()) == sorted(
+        [changed["text"], BOOKS["testmath"][1]])
+    assert set(manifests["testmath_g5_t1"]["testmath_cleaned.jsonl"]) == set(
+        old_manifests["testmath_g5_t1"]["testmath_cleaned.jsonl"])
+    assert math_jsonl.read_text(encoding="utf-8") == old_jsonl
+    assert points["testscience_g5_t1"] == old_points["testscience_g5_t1"]
+
+    bm25 = lexical_index.load("testmath_g5_t1", lexical_index.LEXICAL_DIR)
+    assert sorted(bm25.payload(row)["text"] for row in range(len(bm25.ids))) == sorted(
+        [changed["text"], BOOKS["testmath"][1]])  # like Qdrant: the synced chunk + the old rest
+
+
+def test_removed_jsonl_files_are_pruned_like_build_index(pipeline, build_index, tmp_path):
+    pipeline.run_pipeline(_pdfs(tmp_path, "testmath", "testscience"))
+    (tmp_path / "Cleaned" / "testscience" / "g5" / "t1" / "testscience_cleaned.jsonl").unlink()
+
+    pipeline.run_pipeline(_pdfs(tmp_path, "testmath"))
+
+    points, manifests = _state(build_index.QDRANT_CLIENT)
+    assert points["testscience_g5_t1"] == {} and manifests["testscience_g5_t1"] == {}
+    assert len(points["testmath_g5_t1"]) == 2
+    assert not (lexical_index.LEXICAL_DIR / "testscience_g5_t1.npz").exists()
+
+
+def test_indexing_error_stops_and_joins_the_extraction_thread(pipeline, build_index, tmp_path, monkeypatch):
+    pipeline.extraction.books["testmath"] = [_record("testmath", i, f"chunk {i}") for i in range(50)]
+
+    def qdrant_down(file_name, records, *args, **kwargs):
+        next(iter(records))
+        raise ConnectionError("qdrant unreachable")
+
+    monkeypatch.setattr(build_index, "_sync_records", qdrant_down)
+    with pytest.raises(ConnectionError):
+        pipeline.run_pipeline(_pdfs(tmp_path, "testmath", "testscience"), queue_size=1)
+
+    assert not any(t.name == "extract" and t.is_alive() for t in threading.enumerate())
+    assert pipeline.extraction.started == ["testmath"]  # stopped inside the first book
+    assert not (tmp_path / "Cleaned" / "testmath" / "g5" / "t1" / "testmath_cleaned.jsonl").exists()
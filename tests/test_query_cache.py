@@ -0,0 +1,18 @@
+from ask import answer_cache_key
+from query_cache import SemanticAnswerCache, question_numbers
+
+SOURCES = [(1, {"subject": "math"})]
+QVEC = [0.6, 0.8, 0.0]  # E5 puts these questions above the threshold, so same vector here
+
+
+def test_calc_questions_that_differ_in_numbers_do_not_share_an_answer():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put(answer_cache_key(5, 1, "ناتج 12 × 4", SOURCES), QVEC, "48")
+
+    assert cache.get(answer_cache_key(5, 1, "ناتج 12 × 5", SOURCES), QVEC) is None
+    assert cache.get(answer_cache_key(5, 1, "ناتج ١٢ × ٤ ؟", SOURCES), QVEC) == "48"
+
+
+def test_question_numbers_normalizes_digits_and_decimal_separators():
+    assert question_numbers("ناتج ٣٫٥ + 2.5") == ("3.5", "2.5")
+    assert question_numbers("ما هي الكسور") == ()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import threading
+import warnings
+
+import pytest
+from qdrant_client import QdrantClient
+
+import chunk_records
+import serve
+from ask import StubLLM
+from conftest import HashEmbedding
+
+
+class BlockingEmbedding(HashEmbedding):
+    """Query embeddings wait for `release`, to keep a request busy in its worker slot."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def get_query_embedding(self, text: str):
+        self.started.set()
+        self.release.wait(10)
+        return self.get_text_embedding(text)
+
+
+def _service(embed, cleaned_tree, **kwargs):
+    warnings.filterwarnings("ignore", category=UserWarning)
+    client = QdrantClient(":memory:")
+    serve.seed_collections(client, embed, cleaned_tree, layout="per_collection")
+    return serve.QueryService(client, embed, StubLLM(), **kwargs)
+
+
+def test_seed_uses_the_indexed_point_ids_and_payloads(embed, cleaned_tree):
+    warnings.filterwarnings("ignore", category=UserWarning)
+    client = QdrantClient(":memory:")
+    serve.seed_collections(client, embed, cleaned_tree, layout="per_collection")
+    jsonl = cleaned_tree / "testmath" / "g5" / "t1" / "testmath_cleaned.jsonl"
+    points, _ = client.scroll("testmath_g5_t1", limit=10, with_payload=True)
+    assert {p.id: p.payload for p in points} == {pid: md for pid, _, md in chunk_records.iter_records(jsonl)}
+
+
+def test_ask_answers_from_seeded_collections(embed, cleaned_tree):
+    service = _service(embed, cleaned_tree)
+    status, body = asyncio.run(service.ask({"question": "how do fractions add", "grade": 5, "term": 1}))
+    assert status == 200
+    assert body["sources"] and body["sources"][0]["collection"] == "testmath_g5_t1"
+    assert body["answer"]
+    assert "queue" in body["timings_ms"]
+
+
+@pytest.mark.parametrize("body", [
+    {"question": "fractions", "grade": "five", "term": 1},
+    {"question": "fractions", "grade": 7, "term": 1},
+    {"question": "fractions", "grade": 5, "term": 3},
+    {"question": "  ", "grade": 5, "term": 1},
+])
+def test_ask_rejects_invalid_bodies(embed, cleaned_tree, body):
+    status, payload = asyncio.run(_service(embed, cleaned_tree).ask(body))
+    assert status == 400
+    assert "error" in payload
+
+
+def test_ask_without_collections_is_404(embed, cleaned_tree):
+    status, payload = asyncio.run(_service(embed, cleaned_tree).ask({"question": "fractions", "grade": 3, "term": 2}))
+    assert status == 404
+    assert "_g3_t2" in payload["error"]
+
+
+def test_full_queue_gets_503(cleaned_tree):
+    embed = BlockingEmbedding()
+    service = _service(embed, cleaned_tree, max_concurrency=1, max_queue=1)
+    body = {"question": "plants need water", "grade": 5, "term": 1, "generate": False}
+
+    async def scenario():
+        running = asyncio.create_task(service.ask(body))
+        await asyncio.get_running_loop().run_in_executor(None, embed.started.wait, 10)
+        waiting = asyncio.create_task(service.ask(dict(body, question="times tables")))
+        await asyncio.sleep(0.05)  # second request is now waiting for the only slot
+        rejected = await service.ask(dict(body, question="fractions"))
+        embed.release.set()
+        return rejected, await running, await waiting
+
+    rejected, running, waiting = asyncio.run(scenario())
+    assert rejected[0] == 503
+    assert running[0] == 200 and waiting[0] == 200
+
+
+async def _request(port, raw: bytes):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload
+
+
+def _post(body: bytes) -> bytes:
+    return (b"POST /ask HTTP/1.1\r\nConnection: close\r\nContent-Length: "
+            + str(len(body)).encode() + b"\r\n\r\n" + body)
+
+
+def _serve_requests(service, raws):
+    """Responses (status, body bytes) to each raw request, one connection each."""
+    async def scenario():
+        server = await asyncio.start_server(serve.make_handler(service), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [await _request(port, raw) for raw in raws]
+    return asyncio.run(scenario())
+
+
+def test_http_routes(embed, cleaned_tree):
+    ok, bad, missing, health = _serve_requests(_service(embed, cleaned_tree), [
+        _post(json.dumps({"question": "plants", "grade": 5, "term": 1}).encode()),
+        _post(b"{not json"),
+        b"GET /nope HTTP/1.1\r\nConnection: close\r\n\r\n",
+        b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n",
+    ])
+    assert ok[0] == 200 and json.loads(ok[1])["sources"]
+    assert bad[0] == 400 and json.loads(bad[1]) == {"error": "invalid JSON"}
+    assert missing[0] == 404
+    assert health == (200, b'{"status": "ok"}')
+
+
+def test_json_that_is_not_an_object_is_400(embed, cleaned_tree):
+    responses = _serve_requests(_service(embed, cleaned_tree), [_post(b"[1]"), _post(b'"x"'), _post(b"null")])
+    for status, payload in responses:
+        assert status == 400 and json.loads(payload) == {"error": "body must be a JSON object"}
+
+
+def test_pipeline_errors_are_500_and_the_server_keeps_serving(embed, cleaned_tree, capsys):
+    service = _service(embed, cleaned_tree)
+
+    def qdrant_down(*_):
+        raise ConnectionRefusedError("qdrant unreachable")
+
+    service._collections_for = qdrant_down
+    failed, health = _serve_requests(service, [
+        _post(json.dumps({"question": "plants", "grade": 5, "term": 1}).encode()),
+        b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n",
+    ])
+    assert failed[0] == 500 and json.loads(failed[1]) == {"error": "internal error: ConnectionRefusedError"}
+    assert health[0] == 200
+    assert "POST /ask failed" in capsys.readouterr().err
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import vector_profiles
+
+
+class ConfigClient:
+    """get_collection / create_collection only (local :memory: Qdrant drops quantization configs)."""
+
+    def __init__(self):
+        self.configs, self.lookups = {}, []
+
+    def collection_exists(self, name):
+        return name in self.configs
+
+    def delete_collection(self, name):
+        del self.configs[name]
+
+    def create_collection(self, name, quantization_config=None, **_):
+        self.configs[name] = quantization_config
+
+    def get_collection(self, name):
+        self.lookups.append(name)
+        return SimpleNamespace(config=SimpleNamespace(quantization_config=self.configs[name]))
+
+
+def test_search_params_follow_the_collection_not_the_env_profile():
+    assert vector_profiles.VECTOR_PROFILE == "float32"
+    client = ConfigClient()
+    vector_profiles.create_collection(client, "plain", 8)
+    vector_profiles.create_collection(client, "int8", 8, profile="int8")
+    vector_profiles.create_collection(client, "binary", 8, profile="binary")
+
+    assert vector_profiles.collection_search_params(client, "plain", hnsw_ef=0) is None
+    params = vector_profiles.collection_search_params(client, "int8", oversampling=0)
+    assert params.quantization.rescore and params.quantization.oversampling == 2.0
+    params = vector_profiles.collection_search_params(client, "binary", oversampling=0)
+    assert params.quantization.oversampling == 4.0
+
+
+def test_profile_is_read_once_and_forgotten_on_recreate():
+    client = ConfigClient()
+    vector_profiles.create_collection(client, "col", 8, profile="int8")
+
+    assert [vector_profiles.collection_profile(client, "col") for _ in range(3)] == ["int8"] * 3
+    assert client.lookups == ["col"]
+
+    vector_profiles.create_collection(client, "col", 8, recreate=True)
+    assert vector_profiles.collection_profile(client, "col") == "float32"
+    assert vector_profiles.collection_profile(client, "missing") == vector_profiles.VECTOR_PROFILE